@@ -0,0 +1,321 @@
+"""
+Simulates a fleet of recorders against an analyser to find out how many recorders a single analyser can sustain.
+
+Each virtual device heartbeats via a Heartbeater, accepts measurement requests from the analyser on a local http
+server (as a real recorder would) and then streams synthetic batches via an HttpPoster. Every request made to the
+analyser is timed and the analyser's queue depths are sampled from its diagnostics endpoint while the test runs.
+
+usage: PYTHONPATH=./src python scratch/loadgenerator.py --analyser http://127.0.0.1:8080 --devices 50 --duration 30
+"""
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import numpy as np
+
+from core.batch import SampleBatch
+from core.handler import HttpPoster
+from core.httpclient import HttpClient, PooledHttpClient, RequestsBasedHttpClient
+from core.interface import API_PREFIX, DATETIME_FORMAT, RecordingDeviceStatus
+from recorder.common.heartbeater import Heartbeater
+
+logger = logging.getLogger('loadgenerator')
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server only provides this from python 3.7
+    daemon_threads = True
+
+
+class TimingHttpClient(HttpClient):
+    """
+    Delegates to another HttpClient and records the latency and outcome of every request by request type.
+    """
+
+    def __init__(self, delegate):
+        self.delegate = delegate
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.bytesSent = 0
+
+    @staticmethod
+    def _classify(method, url):
+        if '/devices/' in url and '/measurements' not in url:
+            return 'heartbeat'
+        if url.endswith('/data'):
+            return 'data'
+        if url.endswith('/complete'):
+            return 'complete'
+        if url.endswith('/failed'):
+            return 'failed'
+        if method == 'get':
+            return 'diagnostics'
+        return 'initialise'
+
+    def _call(self, method, url, **kwargs):
+        kind = self._classify(method, url)
+        start = time.time()
+        try:
+            resp = getattr(self.delegate, method)(url, **kwargs)
+            failed = resp.status_code >= 400
+        except Exception:
+            resp = None
+            failed = True
+        elapsed = time.time() - start
+        payload = kwargs.get('json', kwargs.get('data'))
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(elapsed)
+            self.errors[kind] = self.errors.get(kind, 0) + (1 if failed else 0)
+            if isinstance(payload, (str, bytes)):
+                self.bytesSent += len(payload)
+        if resp is None:
+            raise IOError('Unable to ' + method + ' ' + url)
+        return resp
+
+    def get(self, url, **kwargs):
+        return self._call('get', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self._call('put', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self._call('patch', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._call('post', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self._call('delete', url, **kwargs)
+
+
+class VirtualDevice(object):
+    """
+    A recorder device that exposes the attributes marshalled via recordingDeviceFields and streams synthetic data.
+    """
+
+    def __init__(self, name, fs, samplesPerBatch, analyserURL, httpclient, wireFormat='json', encoding='float32',
+                 compressionLevel=None, window=1):
+        self.name = name
+        self.fs = fs
+        self.samplesPerBatch = samplesPerBatch
+        self.activeSamplesPerBatch = samplesPerBatch
+        self._accelEnabled = True
+        self._gyroEnabled = False
+        self.accelerometerSensitivity = 2
+        self.gyroSensitivity = 500
+        self.status = RecordingDeviceStatus.INITIALISED
+        self.failureCode = None
+        self.poster = HttpPoster(name, analyserURL, httpclient=httpclient, wireFormat=wireFormat, encoding=encoding,
+                                 compressionLevel=compressionLevel, window=window)
+        self.poster.deviceName = name
+        self.samplesSent = 0
+
+    def patch(self, body):
+        """
+        Accepts the target state pushed by the analyser so it stops pushing it, data is always streamed at the rate
+        requested on the command line.
+        """
+        self.accelerometerSensitivity = body.get('accelerometerSens', self.accelerometerSensitivity)
+        self.gyroSensitivity = body.get('gyroSens', self.gyroSensitivity)
+        self._accelEnabled = body.get('accelerometerEnabled', self._accelEnabled)
+        self._gyroEnabled = body.get('gyroEnabled', self._gyroEnabled)
+        self.fs = body.get('fs', self.fs)
+        self.samplesPerBatch = body.get('samplesPerBatch', self.samplesPerBatch)
+        self.activeSamplesPerBatch = self.samplesPerBatch
+
+    def record(self, measurementId, duration, fs, samplesPerBatch, at=None):
+        """
+        streams batches of white noise to the analyser in real time for the given duration.
+        """
+        if at is not None:
+            delay = (datetime.strptime(at, DATETIME_FORMAT) - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                time.sleep(delay)
+        self.status = RecordingDeviceStatus.RECORDING
+        columns = ['time', 'ac_x', 'ac_y', 'ac_z']
+        interval = samplesPerBatch / fs
+        batches = int(np.ceil(duration / interval))
+        self.poster.start(measurementId)
+        nextSend = time.time()
+        for i in range(batches):
+            samples = np.random.normal(0, 0.25, size=(samplesPerBatch, len(columns)))
+            samples[:, 0] = np.arange(self.samplesSent, self.samplesSent + samplesPerBatch) / fs
+            self.poster.handle(SampleBatch(samples, columns, fs, startIdx=self.samplesSent))
+            self.samplesSent += samplesPerBatch
+            nextSend += interval
+            wait = nextSend - time.time()
+            if wait > 0:
+                time.sleep(wait)
+        self.poster.stop(measurementId)
+        self.status = RecordingDeviceStatus.INITIALISED
+
+
+class LoadGenerator(object):
+    """
+    Runs the virtual devices and the http server that the analyser talks to.
+    """
+
+    def __init__(self, analyserURL, deviceCount, fs, samplesPerBatch, host='127.0.0.1', port=10102,
+                 pingInterval=5, wireFormat='json', encoding='float32', compressionLevel=None, window=1):
+        self.analyserURL = analyserURL.rstrip('/')
+        self.fs = fs
+        self.samplesPerBatch = samplesPerBatch
+        self.host = host
+        self.port = port
+        self.pingInterval = pingInterval
+        self.httpclient = TimingHttpClient(PooledHttpClient())
+        self.recordingDevices = {
+            'loadgen' + str(i): VirtualDevice('loadgen' + str(i), fs, samplesPerBatch, self.analyserURL,
+                                               self.httpclient, wireFormat=wireFormat, encoding=encoding,
+                                               compressionLevel=compressionLevel, window=window)
+            for i in range(deviceCount)
+        }
+        self.heartbeater = Heartbeater(self.httpclient, self, serverURL=self.analyserURL)
+        self.recordings = []
+        self.queueDepths = {'reactor': [], 'handlers': []}
+        self._server = None
+
+    def getPingInterval(self):
+        return self.pingInterval
+
+    def getServiceURL(self):
+        return 'http://' + self.host + ':' + str(self.port)
+
+    def startServer(self):
+        generator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _body(self):
+                length = int(self.headers.get('Content-Length', 0))
+                return json.loads(self.rfile.read(length)) if length > 0 else {}
+
+            def _reply(self, code):
+                self.send_response(code)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_PUT(self):
+                match = re.match(API_PREFIX + r'/devices/([^/]+)/measurements/([^/]+)$', self.path)
+                device = generator.recordingDevices.get(match.group(1)) if match else None
+                if device is None:
+                    self._reply(404)
+                else:
+                    body = self._body()
+                    t = threading.Thread(target=device.record,
+                                         args=(match.group(2), body['duration'], generator.fs,
+                                               generator.samplesPerBatch),
+                                         kwargs={'at': body.get('at')}, daemon=True)
+                    generator.recordings.append(t)
+                    t.start()
+                    self._reply(200)
+
+            def do_PATCH(self):
+                match = re.match(API_PREFIX + r'/devices/([^/]+)$', self.path)
+                device = generator.recordingDevices.get(match.group(1)) if match else None
+                if device is None:
+                    self._reply(404)
+                else:
+                    device.patch(self._body())
+                    self._reply(200)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def sampleQueueDepths(self):
+        try:
+            resp = self.httpclient.get(self.analyserURL + API_PREFIX + '/diagnostics')
+            if resp.status_code == 200:
+                diagnostics = resp.json()
+                self.queueDepths['reactor'].append(diagnostics['reactorQueueDepth'])
+                self.queueDepths['handlers'].append(sum(d['handlerQueueDepth'] or 0
+                                                        for d in diagnostics['devices'].values()))
+        except Exception:
+            logger.exception('Unable to read diagnostics')
+
+    def run(self, duration, delay=5):
+        """
+        Registers the devices, schedules a measurement of the given duration and waits for it to complete.
+        :return: the report.
+        """
+        self.startServer()
+        self.heartbeater.sendHeartbeat()
+        # allow the analyser to push the target state
+        time.sleep(1)
+        self.heartbeater.sendHeartbeat()
+        measurementId = 'loadgen' + datetime.utcnow().strftime(DATETIME_FORMAT)
+        resp = RequestsBasedHttpClient().put(self.analyserURL + API_PREFIX + '/measurements/' + measurementId,
+                                             json={'duration': duration, 'delay': delay})
+        if resp.status_code != 200:
+            raise ValueError('Unable to schedule measurement, response was ' + str(resp.status_code))
+        start = time.time()
+        lastPing = start
+        while time.time() - start < 2 or any(t.is_alive() for t in self.recordings):
+            self.sampleQueueDepths()
+            if time.time() - lastPing > self.pingInterval:
+                self.heartbeater.sendHeartbeat()
+                lastPing = time.time()
+            time.sleep(0.5)
+        elapsed = time.time() - start - delay
+        self._server.shutdown()
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        samples = sum(d.samplesSent for d in self.recordingDevices.values())
+        report = {
+            'devices': len(self.recordingDevices),
+            'samples': samples,
+            'samplesPerSecond': round(samples / elapsed, 1) if elapsed > 0 else None,
+            'megabytesPerSecond': round(self.httpclient.bytesSent / elapsed / 1e6, 3) if elapsed > 0 else None,
+            'requests': {},
+            'maxReactorQueueDepth': max(self.queueDepths['reactor'], default=None),
+            'maxHandlerQueueDepth': max(self.queueDepths['handlers'], default=None),
+            'httpclient': self.httpclient.delegate.getStats(),
+            'compression': {name: d.poster.getCompressionStats() for name, d in self.recordingDevices.items()}
+        }
+        for kind, latencies in self.httpclient.latencies.items():
+            millis = np.array(latencies) * 1000
+            report['requests'][kind] = {
+                'count': len(latencies),
+                'errorRate': round(self.httpclient.errors.get(kind, 0) / len(latencies), 4),
+                'p50': round(float(np.percentile(millis, 50)), 2),
+                'p90': round(float(np.percentile(millis, 90)), 2),
+                'p99': round(float(np.percentile(millis, 99)), 2),
+                'max': round(float(millis.max()), 2)
+            }
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulates N recorders streaming data to an analyser')
+    parser.add_argument('--analyser', default='http://127.0.0.1:8080', help='the analyser url')
+    parser.add_argument('--devices', type=int, default=10, help='the number of virtual devices')
+    parser.add_argument('--fs', type=int, default=500, help='the sample rate of each device')
+    parser.add_argument('--samplesPerBatch', type=int, default=125, help='the number of samples in each batch')
+    parser.add_argument('--duration', type=int, default=10, help='the measurement duration in seconds')
+    parser.add_argument('--port', type=int, default=10102, help='the port the virtual devices listen on')
+    parser.add_argument('--format', default='json', choices=['json', 'binary'], help='the data wire format')
+    parser.add_argument('--encoding', default='float32', choices=['float32', 'int16'],
+                        help='the value encoding used by the binary wire format')
+    parser.add_argument('--compression', type=int, default=None, choices=range(1, 10),
+                        help='the zlib level used to compress the binary wire format, uncompressed if not set')
+    parser.add_argument('--window', type=int, default=1, help='the number of data requests each device keeps in flight')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    generator = LoadGenerator(args.analyser, args.devices, args.fs, args.samplesPerBatch, port=args.port,
+                              wireFormat=args.format, encoding=args.encoding, compressionLevel=args.compression,
+                              window=args.window)
+    print(json.dumps(generator.run(args.duration), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import timeit
+
+import numpy as np
+
+from recorder.common.i2c_io import mock_io, WhiteNoiseProvider
+from recorder.common.mpu6050 import mpu6050
+
+
+def benchmark(samples=10000, repeats=5):
+    """
+    compares the throughput of the per sample unpack against the batch unpack with all sensors enabled.
+    :param samples: the no of samples to decode in each run.
+    :param repeats: the no of runs.
+    """
+    mpu = mpu6050(mock_io(dataProvider=WhiteNoiseProvider().provide))
+    mpu.enableGyro()
+    mpu.enableTemperature()
+    rawData = np.random.randint(0, 256, size=mpu.sampleSizeBytes * samples, dtype=np.uint8).tobytes()
+    sampleSize = mpu.sampleSizeBytes
+
+    def perSample():
+        mpu._sampleIdx = 0
+        return [mpu.unpackSample(rawData[i:i + sampleSize]) for i in range(0, len(rawData), sampleSize)]
+
+    def batch():
+        mpu._sampleIdx = 0
+        return mpu.unpackBatch(rawData).tolist()
+
+    for name, func in [('unpackSample', perSample), ('unpackBatch', batch)]:
+        elapsed = min(timeit.repeat(func, number=1, repeat=repeats))
+        print(name + ': ' + str(round(samples / elapsed)) + ' samples/s')
+
+
+if __name__ == '__main__':
+    benchmark()
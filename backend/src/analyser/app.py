@@ -5,22 +5,27 @@ from flask import Flask
 from flask_restful import Api
 
 from analyser.common.config import Config
+from analyser.common.datacache import dataCache
 from analyser.common.devicecontroller import DeviceController
+from analyser.common.ingest import IngestServer
 from analyser.common.measurementcontroller import MeasurementController
 from analyser.common.targetcontroller import TargetController
 from analyser.common.targetstatecontroller import TargetStateProvider, TargetStateController
 from analyser.common.uploadcontroller import UploadController
 from analyser.resources.analyse import Analyse
+from analyser.resources.diagnostics import Diagnostics
 from analyser.resources.target import Target
 from analyser.resources.targets import Targets
 from analyser.resources.upload import Upload, CompleteUpload, Uploads, UploadAnalyser, UploadTarget
 from analyser.resources.timeseries import TimeSeries
 from analyser.resources.measurement import InitialiseMeasurement, RecordData, CompleteMeasurement, Measurement, \
-    FailMeasurement
+    FailMeasurement, RecordSpectrum
 from analyser.resources.measurementdevices import MeasurementDevices, MeasurementDevice
 from analyser.resources.measurements import Measurements, ReloadMeasurement
 from analyser.resources.state import State
-from core.httpclient import RequestsBasedHttpClient
+from core.compression import CompressionStats
+from core.fanout import FanOut
+from core.httpclient import PooledHttpClient
 from core.interface import API_PREFIX
 from core.reactor import Reactor
 
@@ -34,27 +39,42 @@ app = Flask(__name__)
 api = Api(app)
 cfg = Config()
 
-httpclient = RequestsBasedHttpClient()
+httpclient = PooledHttpClient()
+dataCache.setMaxBytes(cfg.dataCacheMB * 1024 * 1024)
 reactor = Reactor(name='analyser')
 targetStateProvider = TargetStateProvider(cfg.targetState)
-targetStateController = TargetStateController(targetStateProvider, reactor, httpclient)
-deviceController = DeviceController(targetStateController, cfg.dataDir, httpclient)
+fanOut = FanOut('analyser', maxWorkers=cfg.fanOut.get('maxWorkers', 8),
+                deadlineSeconds=cfg.fanOut.get('deadlineSeconds', 2.0))
+targetStateController = TargetStateController(targetStateProvider, reactor, httpclient, fanOut=fanOut)
+deviceController = DeviceController(targetStateController, cfg.dataDir, httpclient, fanOut=fanOut,
+                                    dataFormat=cfg.dataFormat, csvOptions=cfg.csvLogger)
 targetStateController.deviceController = deviceController
 measurementController = MeasurementController(targetStateProvider, cfg.dataDir, deviceController)
 uploadController = UploadController(cfg.upload)
 targetController = TargetController(cfg.dataDir, uploadController)
+compressionStats = CompressionStats()
+ingestServer = IngestServer(measurementController, port=cfg.ingestPort, compressionStats=compressionStats)
 resourceArgs = {
     'deviceController': deviceController,
     'targetStateController': targetStateController,
     'measurementController': measurementController,
     'targetController': targetController,
-    'uploadController': uploadController
+    'uploadController': uploadController,
+    'reactor': reactor,
+    'httpclient': httpclient,
+    'fanOut': fanOut,
+    'compressionStats': compressionStats,
+    'ingestServer': ingestServer,
+    'dataCache': dataCache
 }
 
 # GET: gets the current target state
 # PATCH: mutate specific aspects of device configuration, delegates to the underlying measurementDevices
 api.add_resource(State, API_PREFIX + '/state', resource_class_kwargs=resourceArgs)
 
+# GET: queue depths and other internal state, used when load testing
+api.add_resource(Diagnostics, API_PREFIX + '/diagnostics', resource_class_kwargs=resourceArgs)
+
 # GET: the state of currently available measurementDevices
 api.add_resource(MeasurementDevices, API_PREFIX + '/devices', resource_class_kwargs=resourceArgs)
 
@@ -77,6 +97,9 @@ api.add_resource(InitialiseMeasurement, API_PREFIX + '/measurements/<measurement
 # PUT: receive some data payload for the measurement
 api.add_resource(RecordData, API_PREFIX + '/measurements/<measurementId>/<deviceId>/data',
                  resource_class_kwargs=resourceArgs)
+# PUT: receive the spectral summary calculated by the device
+api.add_resource(RecordSpectrum, API_PREFIX + '/measurements/<measurementId>/<deviceId>/spectrum',
+                 resource_class_kwargs=resourceArgs)
 # PUT: mark the measurement as complete
 api.add_resource(CompleteMeasurement, API_PREFIX + '/measurements/<measurementId>/<deviceId>/complete',
                  resource_class_kwargs=resourceArgs)
@@ -129,6 +152,12 @@ def main(args=None):
             except:
                 pass
 
+    if cfg.ingestPort:
+        try:
+            ingestServer.start()
+        except OSError:
+            # the recorders send their data over http if they cannot open a stream
+            logger.exception('Unable to listen for data streams on port ' + str(cfg.ingestPort))
     if cfg.useTwisted:
         import logging
         logger = logging.getLogger('analyser.twisted')
@@ -11,6 +11,11 @@ class Config(BaseConfig):
         self.dataDir = self.config.get('dataDir', self.getDefaultDataDir())
         self.ensureDirExists(self.dataDir)
         self.useTwisted = self.config.get('useTwisted', True)
+        self.ingestPort = self.config.get('ingestPort', 8081)
+        self.fanOut = self.config.get('fanOut', {})
+        self.dataFormat = self.config.get('dataFormat', 'csv')
+        self.csvLogger = self.config.get('csvLogger', {})
+        self.dataCacheMB = self.config.get('dataCacheMB', 512)
         self.ensureDirExists(self.upload['tmpDir'])
         self.ensureDirExists(self.upload['uploadDir'])
 
@@ -0,0 +1,148 @@
+import logging
+import mmap
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger('analyser.datacache')
+
+
+def _isMapped(array):
+    """
+    :param array: an ndarray.
+    :return: true if the array is a view onto a memory mapped file. Only the base chain is checked as an np.memmap
+    produced by a calculation (e.g. astype) owns its data even though it is still an np.memmap.
+    """
+    while array is not None:
+        if isinstance(array, mmap.mmap):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def sizeOf(value):
+    """
+    Estimates the memory held by some measurement data, i.e. the ndarrays reachable from it. Arrays that are memory
+    mapped are counted separately as their pages belong to the OS page cache which reclaims them as required.
+    :param value: the data, typically a dict of device name -> TriAxisSignal.
+    :return: a tuple of (resident bytes, mapped bytes).
+    """
+    if isinstance(value, np.ndarray):
+        return (0, value.nbytes) if _isMapped(value) else (value.nbytes, 0)
+    if isinstance(value, dict):
+        values = value.values()
+    elif isinstance(value, (list, tuple)):
+        values = value
+    elif hasattr(value, '__dict__'):
+        values = vars(value).values()
+    else:
+        return 0, 0
+    resident = 0
+    mapped = 0
+    for v in values:
+        r, m = sizeOf(v)
+        resident += r
+        mapped += m
+    return resident, mapped
+
+
+class MeasurementDataCache(object):
+    """
+    Holds the data loaded for each measurement (along with any analysis calculated from it) within a memory budget, the
+    least recently used measurement is evicted once the budget is exceeded. The analysis is calculated, and cached, as
+    the data is used so the size of each entry is measured again whenever the cache is used.
+    """
+
+    def __init__(self, maxBytes=512 * 1024 * 1024):
+        """
+        :param maxBytes: the memory budget.
+        """
+        self.maxBytes = maxBytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __deepcopy__(self, memo):
+        # the cache is shared by every measurement so a copy of a measurement uses the same cache
+        return self
+
+    def get(self, key, loader):
+        """
+        Gets the data for the key, loading it if it is not held.
+        :param key: the key.
+        :param loader: a function that loads the data.
+        :return: the data.
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                self._evict()
+                return data
+            self.misses += 1
+        # loading can take a while so it is done without holding the lock, if the data is loaded twice at the same time
+        # then the first to finish wins
+        data = loader()
+        with self._lock:
+            data = self._entries.setdefault(key, data)
+            self._entries.move_to_end(key)
+            self._evict()
+            return data
+
+    def invalidate(self, key):
+        """
+        Removes the data for the key.
+        :param key: the key.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def setMaxBytes(self, maxBytes):
+        """
+        Changes the memory budget.
+        :param maxBytes: the memory budget.
+        """
+        with self._lock:
+            self.maxBytes = maxBytes
+            self._evict()
+
+    def _evict(self):
+        """
+        Evicts the least recently used entries until the cache fits in the budget, the most recently used entry is
+        always kept.
+        """
+        sizes = OrderedDict((key, sizeOf(data)[0]) for key, data in self._entries.items())
+        total = sum(sizes.values())
+        while total > self.maxBytes and len(self._entries) > 1:
+            key, data = self._entries.popitem(last=False)
+            total -= sizes[key]
+            self.evictions += 1
+            logger.info('Evicting measurement data for ' + str(key) + ', using ' + str(total) + ' of ' +
+                        str(self.maxBytes) + ' bytes')
+
+    def getStats(self):
+        """
+        :return: the hit and miss counts, the no of evictions and the no of entries held along with the memory they
+        use (excluding memory mapped data which is reported separately) and the budget.
+        """
+        with self._lock:
+            resident, mapped = sizeOf(list(self._entries.values()))
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRatio': round(self.hits / lookups, 3) if lookups > 0 else None,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'residentBytes': resident,
+                'mappedBytes': mapped,
+                'maxBytes': self.maxBytes
+            }
+
+
+# the process wide cache of measurement data
+dataCache = MeasurementDataCache()
@@ -5,7 +5,8 @@ import time
 
 from flask_restful import fields
 
-from core.handler import CSVLogger, AsyncHandler
+from core.fanout import FanOut
+from core.handler import CSVLogger, AsyncHandler, BinaryLogger
 from core.interface import RecordingDeviceStatus, DATETIME_FORMAT, API_PREFIX
 
 logger = logging.getLogger('analyser.devicecontroller')
@@ -44,14 +45,24 @@ class DeviceController(object):
     Controls interactions with the recording devices.
     """
 
-    def __init__(self, targetStateController, dataDir, httpclient, maxAgeSeconds=30):
+    def __init__(self, targetStateController, dataDir, httpclient, maxAgeSeconds=30, fanOut=None, dataFormat='csv',
+                 csvOptions=None):
+        """
+        :param dataFormat: csv to store data in a data.out, float32 or int16 to store it in a data.bin.
+        :param csvOptions: the precision, flushInterval and fsync options passed to the CSVLogger.
+        """
         self.httpclient = httpclient
+        self.dataFormat = dataFormat
+        self.csvOptions = {} if csvOptions is None else csvOptions
+        self.fanOut = fanOut if fanOut is not None else FanOut('devices')
         self.devices = {}
         self.targetStateController = targetStateController
         self.dataDir = dataDir
         if dataDir is None or httpclient is None or targetStateController is None:
             raise ValueError("Mandatory args missing")
         self.maxAgeSeconds = maxAgeSeconds
+        # devices is replaced rather than mutated when a device is added or removed so readers do not need to lock
+        self._devicesLock = threading.Lock()
         self.running = True
         self.worker = threading.Thread(name='DeviceCaretaker', target=self._evictStaleDevices, daemon=True)
         self.worker.start()
@@ -76,15 +87,25 @@ class DeviceController(object):
             # thus the recorder will become free as soon as it has handed off the data. This means delivery is only
             # guaranteed as long as the analyser stays up but this is not a system that sits on top of a bulletproof
             # message bus so unlucky :P
-            storedDevice.dataHandler = AsyncHandler('analyser', CSVLogger('analyser', deviceId, self.dataDir))
+            storedDevice.dataHandler = AsyncHandler('analyser', self._createLogger(deviceId))
         else:
             logger.debug('Pinged by device ' + deviceId)
         storedDevice.payload = device
         storedDevice.lastUpdateTime = datetime.datetime.utcnow()
         # TODO if device has FAILED, do something?
-        self.devices.update({deviceId: storedDevice})
+        if deviceId not in self.devices:
+            with self._devicesLock:
+                devices = dict(self.devices)
+                devices[deviceId] = storedDevice
+                self.devices = devices
         self.targetStateController.updateDeviceState(storedDevice.payload)
 
+    def _createLogger(self, deviceId):
+        if self.dataFormat == 'csv':
+            return CSVLogger('analyser', deviceId, self.dataDir, **self.csvOptions)
+        else:
+            return BinaryLogger('analyser', deviceId, self.dataDir, encoding=self.dataFormat)
+
     def getDevices(self, status=None):
         """
         The devices in the given state or all devices is the arg is none.
@@ -99,7 +120,7 @@ class DeviceController(object):
         :param id: the id.
         :return: the device
         """
-        return next(iter([d for d in self.devices.values() if d.deviceId == id]), None)
+        return self.devices.get(id)
 
     def _evictStaleDevices(self):
         """
@@ -110,30 +131,30 @@ class DeviceController(object):
             expiredDeviceIds = [key for key, value in self.devices.items() if value.hasExpired()]
             for key in expiredDeviceIds:
                 logger.warning("Device timeout, removing " + key)
-                del self.devices[key]
+            if expiredDeviceIds:
+                with self._devicesLock:
+                    self.devices = {key: value for key, value in self.devices.items() if key not in expiredDeviceIds}
             time.sleep(1)
             # TODO send reset after a device fails
         logger.warning("DeviceCaretaker is now shutdown")
 
     def scheduleMeasurement(self, measurementId, duration, start):
         """
-        Schedules the requested measurement session with all INITIALISED devices.
+        Schedules the requested measurement session with all INITIALISED devices, the devices are contacted
+        concurrently so a slow device does not delay the others.
         :param measurementId:
         :param duration:
         :param start:
-        :return: a dict of device vs status.
+        :return: a dict of device vs FanOutResult where the value is the response status code.
         """
         # TODO subtract 1s from start and format
-        results = {}
-        for device in self.getDevices(RecordingDeviceStatus.INITIALISED.name):
+        payload = {'duration': duration, 'at': start.strftime(DATETIME_FORMAT)}
+
+        def send(device):
             logger.info('Sending measurement ' + measurementId + ' to ' + device.payload['serviceURL'])
-            try:
-                resp = self.httpclient.put(device.payload['serviceURL'] + '/measurements/' + measurementId,
-                                           json={'duration': duration, 'at': start.strftime(DATETIME_FORMAT)})
-                logger.info('Response for ' + measurementId + ' from ' + device.payload['serviceURL'] + ' is ' +
-                            str(resp.status_code))
-                results[device] = resp.status_code
-            except Exception as e:
-                logger.exception(e)
-                results[device] = 500
-        return results
+            resp = self.httpclient.put(device.payload['serviceURL'] + '/measurements/' + measurementId, json=payload)
+            logger.info('Response for ' + measurementId + ' from ' + device.payload['serviceURL'] + ' is ' +
+                        str(resp.status_code))
+            return resp.status_code
+
+        return self.fanOut.run(send, self.getDevices(RecordingDeviceStatus.INITIALISED.name))
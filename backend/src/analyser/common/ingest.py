@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from core.batch import SampleBatch
+from core.compression import DEFLATE, decompress
+from core.ingest import FRAME_HEADER, encodeFrame
+
+logger = logging.getLogger('analyser.ingest')
+
+# the handled data is acknowledged after this many batches or this many seconds, whichever comes first
+ACK_BATCHES = 8
+ACK_SECONDS = 0.5
+
+
+class IngestServer(object):
+    """
+    Accepts streaming ingest connections from recorders (see core.ingest.IngestClient). Each connection carries the
+    data for one device in one measurement so the data handler is resolved once, when the stream opens, and every batch
+    that follows is passed straight to it. Each batch is decoded and recorded on the event loop's executor, one at a
+    time per stream so the batches stay in order, so a slow handler does not hold up the other streams. The highest
+    endIdx handled is acknowledged every few batches (and when the stream ends) so the recorder can resend anything
+    that was not handled if the stream fails. The server runs an asyncio event loop on its own thread so it works
+    whether the rest of the analyser is served by twisted or by flask.
+    """
+
+    def __init__(self, measurementController, host='0.0.0.0', port=8081, compressionStats=None):
+        """
+        :param measurementController: the measurement controller.
+        :param host: the interface to listen on.
+        :param port: the port to listen on, 0 picks a free port.
+        :param compressionStats: the stats to update when decompressing data.
+        """
+        self._measurementController = measurementController
+        self.host = host
+        self.port = port
+        self._compressionStats = compressionStats
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._startError = None
+        self._lock = threading.Lock()
+        self.activeStreams = 0
+        self.streams = 0
+        self.batches = 0
+        self.bytesReceived = 0
+
+    def start(self):
+        """
+        Starts listening, returns once the server is accepting connections.
+        :raises OSError: if the server cannot listen on the port (e.g. it is already in use).
+        """
+        self._started.clear()
+        self._startError = None
+        self._thread = threading.Thread(name='IngestServer', target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._startError is not None:
+            self._thread.join()
+            self._loop = None
+            raise self._startError
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            logger.info('Listening for data streams on ' + self.host + ':' + str(self.port))
+        except Exception as e:
+            self._startError = e
+            self._loop.close()
+            return
+        finally:
+            self._started.set()
+        self._loop.run_forever()
+        self._server.close()
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+
+    def stop(self):
+        """
+        Stops listening.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def getStats(self):
+        """
+        :return: the no of open streams along with the total streams, batches and bytes received.
+        """
+        with self._lock:
+            return {
+                'activeStreams': self.activeStreams,
+                'streams': self.streams,
+                'batches': self.batches,
+                'bytesReceived': self.bytesReceived
+            }
+
+    @staticmethod
+    async def _readFrame(reader):
+        header = await reader.readexactly(FRAME_HEADER.size)
+        length = FRAME_HEADER.unpack(header)[0]
+        return await reader.readexactly(length) if length > 0 else b''
+
+    @staticmethod
+    def _reply(writer, **kwargs):
+        writer.write(encodeFrame(json.dumps(kwargs).encode('utf-8')))
+
+    def _record(self, stream, payload, compressed):
+        """
+        Decodes the payload and passes it to the stream.
+        :param stream: the stream.
+        :param payload: the payload.
+        :param compressed: true if the payload is compressed.
+        :return: the batch.
+        """
+        if compressed:
+            payload = decompress(payload, stats=self._compressionStats)
+        batch = SampleBatch.fromBinary(payload)
+        stream.record(batch)
+        return batch
+
+    async def _handle(self, reader, writer):
+        peer = str(writer.get_extra_info('peername'))
+        with self._lock:
+            self.activeStreams += 1
+            self.streams += 1
+        try:
+            hello = json.loads((await self._readFrame(reader)).decode('utf-8'))
+            measurementId = hello['measurementId']
+            deviceId = hello['deviceId']
+            stream = self._measurementController.openDataStream(measurementId, deviceId)
+            if stream is None:
+                logger.warning('Refusing stream from ' + peer + ' for unknown handler ' + deviceId + '/' +
+                               measurementId)
+                self._reply(writer, ok=False, error='Unknown measurement ' + measurementId + '/' + deviceId)
+                return
+            logger.info('Receiving stream from ' + peer + ' for ' + deviceId + '/' + measurementId)
+            self._reply(writer, ok=True)
+            compressed = hello.get('contentEncoding') == DEFLATE
+            batches = 0
+            handled = 0
+            lastAck = (0, time.monotonic())
+            while True:
+                payload = await self._readFrame(reader)
+                if len(payload) == 0:
+                    # everything sent before the end of the stream has been handled by now
+                    self._reply(writer, ok=True, batches=batches, ack=handled)
+                    logger.info('Stream for ' + deviceId + '/' + measurementId + ' ended after ' + str(batches) +
+                                ' batches')
+                    break
+                with self._lock:
+                    self.bytesReceived += FRAME_HEADER.size + len(payload)
+                # the batch only counts as handled (and so can be acknowledged) once it has been recorded
+                batch = await self._loop.run_in_executor(None, self._record, stream, payload, compressed)
+                batches += 1
+                handled = max(handled, batch.endIdx)
+                with self._lock:
+                    self.batches += 1
+                now = time.monotonic()
+                if batches - lastAck[0] >= ACK_BATCHES or now - lastAck[1] >= ACK_SECONDS:
+                    self._reply(writer, ack=handled)
+                    lastAck = (batches, now)
+        except asyncio.IncompleteReadError:
+            logger.warning('Stream from ' + peer + ' closed unexpectedly')
+        except (ValueError, KeyError):
+            logger.exception('Invalid data received from ' + peer + ', closing stream')
+            self._reply(writer, ok=False, error='Invalid data')
+        finally:
+            with self._lock:
+                self.activeStreams -= 1
+            writer.close()
@@ -1,5 +1,7 @@
 import datetime
 import glob
+import heapq
+import itertools
 import logging
 import shutil
 import threading
@@ -11,6 +13,12 @@ from flask import json
 from flask_restful import fields
 from flask_restful import marshal
 
+from analyser.common.datacache import dataCache as defaultDataCache
+from analyser.common.registry import MeasurementRegistry, ACTIVE, COMPLETE, FAILED
+from analyser.common.sequencer import BatchSequencer
+from core.batch import SampleBatch
+from core.datafile import DataFile, DATA_FILE_NAME, CSV_DATA_FILE_NAME
+from core.fanout import FanOutStatus
 from core.interface import EnumField, DATETIME_FORMAT
 
 MEASUREMENT_TIMES_CLASH = "Measurement times clash"
@@ -81,7 +89,7 @@ class ActiveMeasurement(object):
     Models a measurement that is scheduled or is currently in progress.
     """
 
-    def __init__(self, name, startTime, duration, deviceState, description=None):
+    def __init__(self, name, startTime, duration, deviceState, description=None, statusListener=None):
         self.name = name
         self.startTime = startTime
         self.duration = duration
@@ -94,6 +102,10 @@ class ActiveMeasurement(object):
         self.idAsPath = self.id.replace('_', '/')
         # hardcoded here rather than in the UI
         self.analysis = DEFAULT_ANALYSIS_SERIES
+        # called with this measurement whenever the status of a device changes
+        self.statusListener = statusListener
+        self._sequencers = {}
+        self._sequencerLock = threading.Lock()
 
     def overlapsWith(self, targetStartTime, duration):
         """
@@ -106,12 +118,13 @@ class ActiveMeasurement(object):
         return (self.startTime <= targetStartTime <= self.endTime) \
                or (targetStartTime <= self.startTime <= targetEndTime)
 
-    def updateDeviceStatus(self, deviceName, state, reason=None):
+    def updateDeviceStatus(self, deviceName, state, reason=None, gaps=None):
         """
         Updates the current device status.
         :param deviceName: the device name.
         :param state: the state.
         :param reason: the reason for the change.
+        :param gaps: the ranges of samples that were not received from the device, if known.
         :return:
         """
         logger.info('Updating recording device state for ' + deviceName + ' to ' + state.name +
@@ -127,6 +140,22 @@ class ActiveMeasurement(object):
             'time': datetime.datetime.utcnow().strftime(DATETIME_FORMAT),
             'count': count
         }
+        if gaps is not None:
+            self.recordingDevices[deviceName]['gaps'] = gaps
+        if self.statusListener is not None:
+            self.statusListener(self)
+
+    def getSequencer(self, deviceId):
+        """
+        :param deviceId: the device id.
+        :return: the sequencer which puts the batches received from the device into order.
+        """
+        with self._sequencerLock:
+            sequencer = self._sequencers.get(deviceId)
+            if sequencer is None:
+                sequencer = BatchSequencer(deviceId + '/' + self.id)
+                self._sequencers[deviceId] = sequencer
+            return sequencer
 
     def stillRecording(self, deviceId, dataCount):
         """
@@ -154,7 +183,7 @@ class CompleteMeasurement(object):
     The system only keeps, and can analyse, complete measurements.
     """
 
-    def __init__(self, meta, dataDir):
+    def __init__(self, meta, dataDir, dataCache=None):
         self.name = meta['name']
         self.startTime = datetime.datetime.strptime(meta['startTime'], DATETIME_FORMAT)
         self.duration = meta['duration']
@@ -168,7 +197,15 @@ class CompleteMeasurement(object):
         self.analysis = DEFAULT_ANALYSIS_SERIES
         self.idAsPath = self.id.replace('_', '/')
         self.dataDir = dataDir
-        self.data = {}
+        self._dataCache = defaultDataCache if dataCache is None else dataCache
+
+    @property
+    def data(self):
+        """
+        :return: the recording as a dict of device name -> TriAxisSignal, this is held in the data cache so it may be
+        loaded again if it has been evicted since it was last used.
+        """
+        return self._dataCache.get(self.idAsPath, self._loadData)
 
     def updateName(self, newName):
         self.name = newName
@@ -181,19 +218,38 @@ class CompleteMeasurement(object):
         :return:
         """
         if self.measurementParameters['accelerometerEnabled']:
-            if len(self.data) == 0:
-                logger.info('Loading measurement data for ' + self.name)
-                self.data = {name: self._loadXYZ(name) for name, value in self.recordingDevices.items()}
+            self._dataCache.get(self.idAsPath, self._loadData)
             return True
         else:
             # TODO error handling
             return False
 
+    def _loadData(self):
+        logger.info('Loading measurement data for ' + self.name)
+        return {name: self._loadXYZ(name) for name, value in self.recordingDevices.items()}
+
+    def evict(self):
+        """
+        Drops the recording from the data cache.
+        """
+        self._dataCache.invalidate(self.idAsPath)
+
     def _loadXYZ(self, name):
-        dataPath = os.path.join(self.dataDir, self.idAsPath, name, 'data.out')
-        if os.path.exists(dataPath):
+        binaryPath = os.path.join(self.dataDir, self.idAsPath, name, DATA_FILE_NAME)
+        dataPath = os.path.join(self.dataDir, self.idAsPath, name, CSV_DATA_FILE_NAME)
+        summaryPath = os.path.join(self.dataDir, self.idAsPath, name, 'spectrum.json')
+        # a device that only sends a spectral summary leaves an empty data file
+        if os.path.exists(binaryPath):
+            if len(DataFile(binaryPath)) > 0 or not os.path.exists(summaryPath):
+                from analyser.common.signal import loadTriAxisSignalFromDataFile
+                return loadTriAxisSignalFromDataFile(binaryPath)
+        hasData = os.path.exists(dataPath) and (os.path.getsize(dataPath) > 0 or not os.path.exists(summaryPath))
+        if hasData:
             from analyser.common.signal import loadTriAxisSignalFromFile
-            return loadTriAxisSignalFromFile(dataPath)
+            return loadTriAxisSignalFromFile(dataPath, cache=True)
+        elif os.path.exists(summaryPath):
+            from analyser.common.signal import loadTriAxisSignalFromSummary
+            return loadTriAxisSignalFromSummary(summaryPath)
         else:
             raise ValueError("Data does not exist")
 
@@ -204,6 +260,42 @@ class CompleteMeasurement(object):
         return "CompleteMeasurement[" + self.id + " for " + self.duration + "s]"
 
 
+class DataStream(object):
+    """
+    The data sent by a device during a measurement.
+    """
+
+    def __init__(self, measurement, deviceId, handler):
+        self.measurement = measurement
+        self.deviceId = deviceId
+        self.handler = handler
+
+    def record(self, data, sequence=None):
+        """
+        Passes the data to the handler, batches are passed on in sample order and batches which have already been
+        received are ignored.
+        :param data: the data, a SampleBatch or (from older recorders) a list of samples.
+        :param sequence: the sequence number of the batch, if known.
+        :return: true if the data was handled.
+        """
+        if isinstance(data, SampleBatch):
+            self.measurement.getSequencer(self.deviceId).accept(data, self._deliver, sequence=sequence)
+        else:
+            self._deliver(data)
+        return True
+
+    def flush(self):
+        """
+        Passes on any batches held back while waiting for a missing batch.
+        :return: the gaps in the data received from the device.
+        """
+        return self.measurement.getSequencer(self.deviceId).flush(self._deliver)
+
+    def _deliver(self, data):
+        self.measurement.stillRecording(self.deviceId, len(data))
+        self.handler.handle(data)
+
+
 class MeasurementController(object):
     """
     Contains all the logic around measurement scheduling and is responsible for ensuring we have valid measurements
@@ -215,67 +307,125 @@ class MeasurementController(object):
         self.targetStateProvider = targetStateProvider
         self.deviceController = deviceController
         self.dataDir = dataDir
-        self.activeMeasurements = []
-        self.completeMeasurements = []
-        self.failedMeasurements = []
+        self.registry = MeasurementRegistry()
         self.deathBed = {}
         self.reloadCompletedMeasurements()
         self.maxTimeTilDeathbedSeconds = maxTimeTilDeathbedSeconds
         self.maxTimeOnDeathbedSeconds = maxTimeOnDeathbedSeconds
+        # the caretaker sleeps until the next deadline or until a device changes status
+        self._caretakerCondition = threading.Condition()
+        self._deadlines = []
+        self._deadlineSequence = itertools.count()
+        self._changed = {}
         self.running = True
         self.worker = threading.Thread(name='MeasurementCaretaker', target=self._sweep, daemon=True)
         self.worker.start()
 
     def shutdown(self):
         logger.warning("Shutting down the MeasurementCaretaker")
-        self.running = False
+        with self._caretakerCondition:
+            self.running = False
+            self._caretakerCondition.notify()
+
+    @property
+    def activeMeasurements(self):
+        return self.registry.get(ACTIVE)
+
+    @property
+    def completeMeasurements(self):
+        return self.registry.get(COMPLETE)
+
+    @property
+    def failedMeasurements(self):
+        return self.registry.get(FAILED)
+
+    def _addDeadline(self, am, deadline):
+        """
+        Ensures the measurement is checked by the caretaker at the given time.
+        :param am: the active measurement.
+        :param deadline: the time.
+        """
+        with self._caretakerCondition:
+            heapq.heappush(self._deadlines, (deadline, next(self._deadlineSequence), am))
+            self._caretakerCondition.notify()
+
+    def _onDeviceStatusChange(self, am):
+        """
+        Ensures the measurement is checked by the caretaker now.
+        :param am: the active measurement.
+        """
+        with self._caretakerCondition:
+            self._changed[am.id] = am
+            self._caretakerCondition.notify()
 
     def _sweep(self):
         """
-        Checks the state of each measurement and verifies their state, if an active measurement is now complete then
-        passes them to the completed measurement set, if failed then to the failed set, if failed and old then evicts.
+        Checks the state of a measurement whenever one of its devices changes status or a deadline (the end of the
+        measurement, the time it is presumed dead or the time it is evicted from the deathbed) is reached.
         :return:
         """
-        while self.running:
-            for am in list(self.activeMeasurements):
+        while True:
+            with self._caretakerCondition:
+                if not self.running:
+                    break
                 now = datetime.datetime.utcnow()
-                # devices were allocated and have completed == complete
-                recordingDeviceCount = len(am.recordingDevices)
-                if recordingDeviceCount > 0:
-                    if all(entry['state'] == RecordStatus.COMPLETE.name for entry in am.recordingDevices.values()):
-                        logger.info("Detected completedmeasurement " + am.id)
-                        self._moveToComplete(am)
-
-                # we have reached the end time and we have either all failed devices or no devices == kill
-                if now > (am.endTime + datetime.timedelta(days=0, seconds=1)):
-                    allFailed = all(entry['state'] == RecordStatus.FAILED.name
-                                    for entry in am.recordingDevices.values())
-                    if (recordingDeviceCount > 0 and allFailed) or recordingDeviceCount == 0:
-                        logger.warning("Detected failed measurement " + am.id + " with " + str(recordingDeviceCount)
-                                       + " devices, allFailed: " + str(allFailed))
-                        self._moveToFailed(am)
-
-                # we are well past the end time and we have failed devices or an ongoing recording == kill or deathbed
-                if now > (am.endTime + datetime.timedelta(days=0, seconds=self.maxTimeTilDeathbedSeconds)):
-                    if any(entry['state'] == RecordStatus.FAILED.name for entry in am.recordingDevices.values()):
-                        logger.warning("Detected failed and incomplete measurement " + am.id + ", assumed dead")
-                        self._moveToFailed(am)
-                    elif all(entry['state'] == RecordStatus.RECORDING.name for entry in am.recordingDevices.values()):
-                        self._handleDeathbed(am)
-            time.sleep(0.1)
+                due = self._changed
+                self._changed = {}
+                while len(self._deadlines) > 0 and self._deadlines[0][0] <= now:
+                    am = heapq.heappop(self._deadlines)[2]
+                    due[am.id] = am
+                if len(due) == 0:
+                    timeout = (self._deadlines[0][0] - now).total_seconds() if len(self._deadlines) > 0 else None
+                    self._caretakerCondition.wait(timeout)
+                    continue
+            for am in due.values():
+                # a measurement that has already been completed or failed may still have deadlines outstanding
+                if self.registry.getById(am.id, group=ACTIVE) is am:
+                    self._check(am, datetime.datetime.utcnow())
         logger.warning("MeasurementCaretaker is now shutdown")
 
-    def _handleDeathbed(self, am):
+    def _check(self, am, now):
+        """
+        if an active measurement is now complete then passes it to the completed measurement set, if failed then to the
+        failed set, if it is overdue then puts it on the deathbed.
+        :param am: the active measurement.
+        :param now: the current time.
+        """
+        # devices were allocated and have completed == complete
+        recordingDeviceCount = len(am.recordingDevices)
+        if recordingDeviceCount > 0:
+            if all(entry['state'] == RecordStatus.COMPLETE.name for entry in am.recordingDevices.values()):
+                logger.info("Detected completedmeasurement " + am.id)
+                self._moveToComplete(am)
+                return
+
+        # we have reached the end time and we have either all failed devices or no devices == kill
+        if now >= (am.endTime + datetime.timedelta(days=0, seconds=1)):
+            allFailed = all(entry['state'] == RecordStatus.FAILED.name for entry in am.recordingDevices.values())
+            if (recordingDeviceCount > 0 and allFailed) or recordingDeviceCount == 0:
+                logger.warning("Detected failed measurement " + am.id + " with " + str(recordingDeviceCount)
+                               + " devices, allFailed: " + str(allFailed))
+                self._moveToFailed(am)
+                return
+
+        # we are well past the end time and we have failed devices or an ongoing recording == kill or deathbed
+        if now >= (am.endTime + datetime.timedelta(days=0, seconds=self.maxTimeTilDeathbedSeconds)):
+            if any(entry['state'] == RecordStatus.FAILED.name for entry in am.recordingDevices.values()):
+                logger.warning("Detected failed and incomplete measurement " + am.id + ", assumed dead")
+                self._moveToFailed(am)
+            elif all(entry['state'] == RecordStatus.RECORDING.name for entry in am.recordingDevices.values()):
+                self._handleDeathbed(am, now)
+
+    def _handleDeathbed(self, am, now):
         # check if in the deathbed, if not add it
-        now = datetime.datetime.utcnow()
         if am in self.deathBed.keys():
             # if it is, check if it's been there for too long
-            if now > (self.deathBed[am] + datetime.timedelta(days=0, seconds=self.maxTimeOnDeathbedSeconds)):
+            if now >= (self.deathBed[am] + datetime.timedelta(days=0, seconds=self.maxTimeOnDeathbedSeconds)):
                 logger.warning(am.id + " has been on the deathbed since " +
                                self.deathBed[am].strftime(DATETIME_FORMAT) + ", max time allowed is " +
                                str(self.maxTimeOnDeathbedSeconds) + ", evicting")
                 # ensure all recording devices that have not completed are marked as failed
-                for deviceName, status in am.recordingDevices.items():
+                for deviceName, status in list(am.recordingDevices.items()):
                     if status['state'] == RecordStatus.RECORDING.name or status['state'] == RecordStatus.SCHEDULED.name:
                         logger.warning("Marking " + deviceName + " as failed due to deathbed eviction")
                         if not self.failMeasurement(am.id, deviceName, failureReason='Evicting from deathbed'):
@@ -287,16 +437,15 @@ class MeasurementController(object):
                            am.endTime.strftime(DATETIME_FORMAT) + ", adding to deathbed")
             am.status = MeasurementStatus.DYING
             self.deathBed.update({am: now})
+            self._addDeadline(am, now + datetime.timedelta(days=0, seconds=self.maxTimeOnDeathbedSeconds))
 
     def _moveToComplete(self, am):
         am.status = MeasurementStatus.COMPLETE
-        self.activeMeasurements.remove(am)
-        self.completeMeasurements.append(CompleteMeasurement(self.store(am), self.dataDir))
+        self.registry.move(am, COMPLETE, replacement=CompleteMeasurement(self.store(am), self.dataDir))
 
     def _moveToFailed(self, am):
         am.status = MeasurementStatus.FAILED
-        self.activeMeasurements.remove(am)
-        self.failedMeasurements.append(am)
+        self.registry.move(am, FAILED)
         self.store(am)
 
     def schedule(self, name, duration, startTime, description=None):
@@ -313,18 +462,28 @@ class MeasurementController(object):
         if self._clashes(startTime, duration):
             return False, MEASUREMENT_TIMES_CLASH
         else:
-            am = ActiveMeasurement(name, startTime, duration, self.targetStateProvider.state, description=description)
+            am = ActiveMeasurement(name, startTime, duration, self.targetStateProvider.state, description=description,
+                                   statusListener=self._onDeviceStatusChange)
             logger.info("Scheduling measurement " + am.id + " for " + str(duration) + "s")
-            self.activeMeasurements.append(am)
+            self.registry.add(ACTIVE, am)
+            self._addDeadline(am, am.endTime + datetime.timedelta(days=0, seconds=1))
+            self._addDeadline(am, am.endTime + datetime.timedelta(days=0, seconds=self.maxTimeTilDeathbedSeconds))
             devices = self.deviceController.scheduleMeasurement(am.id, am.duration, am.startTime)
             anyFail = False
-            for device, status in devices.items():
-                if status == 200:
-                    deviceStatus = RecordStatus.SCHEDULED
+            for device, result in devices.items():
+                if result.status is FanOutStatus.OK and result.value == 200:
+                    logger.info('Scheduled ' + am.id + ' on ' + device.deviceId + ' in ' +
+                                str(round(result.elapsed, 3)) + 's')
+                    am.updateDeviceStatus(device.deviceId, RecordStatus.SCHEDULED)
                 else:
-                    deviceStatus = RecordStatus.FAILED
+                    if result.status is FanOutStatus.OK:
+                        reason = 'Device responded with ' + str(result.value)
+                    elif result.status is FanOutStatus.TIMEOUT:
+                        reason = 'Device did not respond in time'
+                    else:
+                        reason = 'Unable to contact device: ' + str(result.error)
+                    am.updateDeviceStatus(device.deviceId, RecordStatus.FAILED, reason=reason)
                     anyFail = True
-                am.updateDeviceStatus(device.deviceId, deviceStatus)
             if anyFail:
                 am.status = MeasurementStatus.FAILED
             else:
@@ -339,7 +498,7 @@ class MeasurementController(object):
         :param duration: the duration.
         :return: true if the measurement is allowed.
         """
-        return [m for m in self.activeMeasurements if m.overlapsWith(startTime, duration)]
+        return self.registry.clashes(startTime, duration)
 
     def startMeasurement(self, measurementId, deviceId):
         """
@@ -364,7 +523,7 @@ class MeasurementController(object):
         :param deviceId: the device.
         :return: active measurement and handler
         """
-        am = next((m for m in self.activeMeasurements if m.id == measurementId), None)
+        am = self.registry.getById(measurementId, group=ACTIVE)
         if am is None:
             return None, None
         else:
@@ -374,21 +533,48 @@ class MeasurementController(object):
             else:
                 return am, device.dataHandler
 
-    def recordData(self, measurementId, deviceId, data):
+    def recordData(self, measurementId, deviceId, data, sequence=None):
         """
         Passes the data to the handler.
         :param deviceId: the device the data comes from.
         :param measurementId: the measurement id.
-        :param data: the data.
+        :param data: the data, a SampleBatch or (from older recorders) a list of samples.
+        :param sequence: the sequence number of the batch, if known.
         :return: true if the data was handled.
         """
+        stream = self.openDataStream(measurementId, deviceId)
+        if stream is not None:
+            return stream.record(data, sequence=sequence)
+        else:
+            logger.error('Received data for unknown handler ' + deviceId + '/' + measurementId)
+            return False
+
+    def openDataStream(self, measurementId, deviceId):
+        """
+        Resolves the handler for the data sent by a device so that a stream of data can be passed to it without looking
+        it up again for each batch.
+        :param measurementId: the measurement id.
+        :param deviceId: the device the data comes from.
+        :return: the stream or None if there is no such measurement or device.
+        """
+        am, handler = self.getDataHandler(measurementId, deviceId)
+        return DataStream(am, deviceId, handler) if handler is not None else None
+
+    def recordSpectrum(self, measurementId, deviceId, summary):
+        """
+        Passes the spectral summary calculated by the device to the handler.
+        :param measurementId: the measurement id.
+        :param deviceId: the device the summary comes from.
+        :param summary: the summary.
+        :return: true if the summary was handled.
+        """
         am, handler = self.getDataHandler(measurementId, deviceId)
         if handler is not None:
-            am.stillRecording(deviceId, len(data))
-            handler.handle(data)
+            am.stillRecording(deviceId, 0)
+            handler.handleSummary(summary)
             return True
         else:
-            logger.error('Received data for unknown handler ' + deviceId + '/' + measurementId)
+            logger.error('Received spectrum for unknown handler ' + deviceId + '/' + measurementId)
             return False
 
     def completeMeasurement(self, measurementId, deviceId):
@@ -400,8 +586,11 @@ class MeasurementController(object):
         """
         am, handler = self.getDataHandler(measurementId, deviceId)
         if handler is not None:
+            gaps = DataStream(am, deviceId, handler).flush()
+            if len(gaps) > 0:
+                logger.warning(deviceId + '/' + measurementId + ' completed with ' + str(len(gaps)) + ' gaps')
             handler.stop(measurementId)
-            am.updateDeviceStatus(deviceId, RecordStatus.COMPLETE)
+            am.updateDeviceStatus(deviceId, RecordStatus.COMPLETE, gaps=gaps)
             return True
         else:
             return False
@@ -416,7 +605,8 @@ class MeasurementController(object):
         """
         am, handler = self.getDataHandler(measurementId, deviceName)
         if handler is not None:
-            am.updateDeviceStatus(deviceName, RecordStatus.FAILED, reason=failureReason)
+            gaps = DataStream(am, deviceName, handler).flush()
+            am.updateDeviceStatus(deviceName, RecordStatus.FAILED, reason=failureReason, gaps=gaps)
             handler.stop(measurementId)
             return True
         else:
@@ -439,14 +629,14 @@ class MeasurementController(object):
             String: error messages
             Integer: count of measurements deleted
         """
-        message, count, deleted = self.deleteFrom(measurementId, self.completeMeasurements)
+        message, count, deleted = self.deleteFrom(measurementId, COMPLETE)
         if count is 0:
-            message, count, deleted = self.deleteFrom(measurementId, self.failedMeasurements)
+            message, count, deleted = self.deleteFrom(measurementId, FAILED)
         return message, count, deleted
 
-    def deleteFrom(self, measurementId, data):
-        toDeleteIdx = [(ind, x) for ind, x in enumerate(data) if x.id == measurementId]
-        if toDeleteIdx:
+    def deleteFrom(self, measurementId, group):
+        toDelete = self.registry.getById(measurementId, group=group)
+        if toDelete is not None:
             errors = []
 
             def logError(func, path, exc_info):
@@ -456,10 +646,12 @@ class MeasurementController(object):
                 errors.append(path)
 
             logger.info("Deleting measurement: " + measurementId)
-            shutil.rmtree(self._getPathToMeasurementMetaDir(toDeleteIdx[0][1].idAsPath), ignore_errors=False,
+            shutil.rmtree(self._getPathToMeasurementMetaDir(toDelete.idAsPath), ignore_errors=False,
                           onerror=logError)
             if len(errors) is 0:
-                popped = data.pop(toDeleteIdx[0][0])
+                popped = self.registry.remove(group, measurementId)
+                if isinstance(popped, CompleteMeasurement):
+                    popped.evict()
                 return None, 1 if popped else 0, popped
             else:
                 return errors, 0, None
@@ -473,8 +665,8 @@ class MeasurementController(object):
         from pathlib import Path
         reloaded = [self.load(x.resolve()) for x in Path(self.dataDir).glob('*/*/*') if x.is_dir()]
         logger.info('Reloaded ' + str(len(reloaded)) + ' completed measurements')
-        self.completeMeasurements = [x for x in reloaded if x is not None and x.status == MeasurementStatus.COMPLETE]
-        self.failedMeasurements = [x for x in reloaded if x is not None and x.status == MeasurementStatus.FAILED]
+        self.registry.reset([x for x in reloaded if x is not None and x.status == MeasurementStatus.COMPLETE],
+                            [x for x in reloaded if x is not None and x.status == MeasurementStatus.FAILED])
 
     def getMeasurements(self, measurementStatus=None):
         """
@@ -500,7 +692,14 @@ class MeasurementController(object):
         :param measurementStatus: the status of the requested measurement.
         :return: the matching measurement or none if it doesn't exist.
         """
-        return next((x for x in self.getMeasurements(measurementStatus) if x.id == measurementId), None)
+        if measurementStatus is None:
+            return self.registry.getById(measurementId)
+        elif measurementStatus == MeasurementStatus.COMPLETE:
+            return self.registry.getById(measurementId, group=COMPLETE)
+        elif measurementStatus == MeasurementStatus.FAILED:
+            return self.registry.getById(measurementId, group=FAILED)
+        else:
+            return next((x for x in self.getMeasurements(measurementStatus) if x.id == measurementId), None)
 
     def store(self, measurement):
         """
@@ -577,9 +776,11 @@ class MeasurementController(object):
             if createdFilteredCopy:
                 logger.info('Copying measurement data from ' + oldMeasurement.idAsPath + ' to ' + newMeasurement.idAsPath)
                 newMeasurementPath = self._getPathToMeasurementMetaDir(newMeasurement.idAsPath)
-                dataSearchPattern = self._getPathToMeasurementMetaDir(oldMeasurement.idAsPath) + '/**/data.out'
+                oldMeasurementPath = self._getPathToMeasurementMetaDir(oldMeasurement.idAsPath)
+                dataFiles = glob.glob(oldMeasurementPath + '/**/' + CSV_DATA_FILE_NAME) + \
+                            glob.glob(oldMeasurementPath + '/**/' + DATA_FILE_NAME)
                 newDataCountsByDevice = [self._filterCopy(dataFile, newStart, newEnd, newMeasurementPath)
-                                         for dataFile in glob.glob(dataSearchPattern)]
+                                         for dataFile in dataFiles]
                 for device, count in newDataCountsByDevice:
                     newMeasurement.recordingDevices.get(device)['count'] = count
             self.store(newMeasurement)
@@ -593,7 +794,7 @@ class MeasurementController(object):
                               os.path.join(self._getPathToMeasurementMetaDir(newMeasurement.idAsPath), renames[1]))
                 self.store(newMeasurement)
             if deleteOld or createdFilteredCopy or newDevices:
-                self.completeMeasurements.append(newMeasurement)
+                self.registry.add(COMPLETE, newMeasurement)
             if deleteOld:
                 self.delete(oldMeasurement.id)
             return True
@@ -616,6 +817,8 @@ class MeasurementController(object):
         dataDeviceName = os.path.split(pathToData[0])[1]
         os.makedirs(os.path.join(newDataDir, dataDeviceName), exist_ok=True)
         outputFile = os.path.join(newDataDir, dataDeviceName, dataFileName)
+        if dataFileName == DATA_FILE_NAME:
+            return dataDeviceName, DataFile(dataFile).copyRange(outputFile, newStart, newEnd)
         dataCount = 0
         rowNum = 0
         with open(dataFile, mode='rt', newline='') as dataIn, open(outputFile, mode='wt', newline='') as dataOut:
@@ -0,0 +1,121 @@
+import bisect
+import datetime
+import threading
+
+ACTIVE = 'active'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+
+class _Snapshot(object):
+    """
+    An immutable view of the registry, a new snapshot is built on every change so it can be read without locking.
+    """
+
+    def __init__(self, active, complete, failed):
+        self.measurements = {ACTIVE: active, COMPLETE: complete, FAILED: failed}
+        # built back to front so the first measurement with a given id wins, as it would in a scan of the lists
+        self.byGroupAndId = {group: {m.id: m for m in reversed(measurements)}
+                             for group, measurements in self.measurements.items()}
+        self.byId = {}
+        for group in (FAILED, COMPLETE, ACTIVE):
+            self.byId.update(self.byGroupAndId[group])
+        # active measurements never overlap so, once sorted by start time, they are also sorted by end time
+        self.intervals = sorted(active, key=lambda m: m.startTime)
+        self.starts = [m.startTime for m in self.intervals]
+
+
+class MeasurementRegistry(object):
+    """
+    Holds the active, complete and failed measurements. The measurements are indexed by id and the active
+    measurements are also indexed by time so the lookups made for every batch of data received, and the clash check
+    made when scheduling, do not depend on how many measurements are held. Changes are made under a lock by building a
+    new snapshot which is then swapped in (copy on write) so readers never block and never see a partial change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot([], [], [])
+
+    def get(self, group):
+        """
+        :param group: ACTIVE, COMPLETE or FAILED.
+        :return: the measurements in the group, this list must not be modified.
+        """
+        return self._snapshot.measurements[group]
+
+    def getById(self, measurementId, group=None):
+        """
+        :param measurementId: the measurement id.
+        :param group: the group to look in, if None then active measurements are preferred to complete measurements
+        which are preferred to failed measurements.
+        :return: the measurement or None if it doesn't exist.
+        """
+        snapshot = self._snapshot
+        return (snapshot.byId if group is None else snapshot.byGroupAndId[group]).get(measurementId)
+
+    def clashes(self, startTime, duration):
+        """
+        :param startTime: the start time.
+        :param duration: the duration.
+        :return: the active measurements that overlap with the given times.
+        """
+        snapshot = self._snapshot
+        endTime = startTime + datetime.timedelta(days=0, seconds=duration)
+        idx = bisect.bisect_right(snapshot.starts, endTime)
+        clashes = []
+        while idx > 0 and snapshot.intervals[idx - 1].endTime >= startTime:
+            idx -= 1
+            clashes.append(snapshot.intervals[idx])
+        return clashes
+
+    def add(self, group, measurement):
+        """
+        Adds the measurement to the group.
+        :param group: ACTIVE, COMPLETE or FAILED.
+        :param measurement: the measurement.
+        """
+        with self._lock:
+            self._update({group: self.get(group) + [measurement]})
+
+    def move(self, measurement, group, replacement=None):
+        """
+        Moves an active measurement to another group, does nothing if the measurement is no longer active.
+        :param measurement: the active measurement.
+        :param group: COMPLETE or FAILED.
+        :param replacement: the measurement to add to the group in its place, if any.
+        """
+        with self._lock:
+            if self.getById(measurement.id, group=ACTIVE) is not measurement:
+                return
+            self._update({
+                ACTIVE: [m for m in self.get(ACTIVE) if m is not measurement],
+                group: self.get(group) + [measurement if replacement is None else replacement]
+            })
+
+    def remove(self, group, measurementId):
+        """
+        Removes the measurement from the group.
+        :param group: ACTIVE, COMPLETE or FAILED.
+        :param measurementId: the measurement id.
+        :return: the removed measurement or None if it is not in the group.
+        """
+        with self._lock:
+            removed = self.getById(measurementId, group=group)
+            if removed is not None:
+                self._update({group: [m for m in self.get(group) if m is not removed]})
+            return removed
+
+    def reset(self, complete, failed):
+        """
+        Replaces the complete and failed measurements.
+        :param complete: the complete measurements.
+        :param failed: the failed measurements.
+        """
+        with self._lock:
+            self._update({COMPLETE: list(complete), FAILED: list(failed)})
+
+    def _update(self, changes):
+        groups = dict(self._snapshot.measurements)
+        groups.update(changes)
+        self._snapshot = _Snapshot(groups[ACTIVE], groups[COMPLETE], groups[FAILED])
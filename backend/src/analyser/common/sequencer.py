@@ -0,0 +1,85 @@
+import heapq
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger('analyser.sequencer')
+
+
+class BatchSequencer(object):
+    """
+    Turns the batches received from a device into a contiguous stream. A recorder may have several batches in flight
+    at once (and may resend batches it spooled while the analyser was unreachable) so batches can arrive out of order or
+    more than once. Batches are ordered by startIdx, anything already received is dropped, anything that arrives early
+    is held until the batches before it arrive. If too many batches are held then the missing samples are assumed lost,
+    the gap is recorded and the held batches are released.
+    """
+
+    def __init__(self, name, maxPendingBatches=256):
+        """
+        :param name: the name used in log messages.
+        :param maxPendingBatches: the maximum no of batches to hold while waiting for a missing batch.
+        """
+        self.name = name
+        self.maxPendingBatches = maxPendingBatches
+        self.nextIdx = 0
+        self.gaps = []
+        self.duplicates = 0
+        self.heldBatches = 0
+        self._pending = []
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    def accept(self, batch, deliver, sequence=None):
+        """
+        Passes the batch, and any held batches that now follow on from it, to deliver in sample order. deliver is called
+        while the sequencer is locked so batches are delivered in order even if they are received on different threads.
+        :param batch: the batch.
+        :param deliver: a function that accepts the next batch in the stream.
+        :param sequence: the sequence number assigned to the batch by the recorder, if any.
+        """
+        with self._lock:
+            if batch.endIdx <= self.nextIdx:
+                self.duplicates += 1
+                return
+            if batch.startIdx > self.nextIdx:
+                logger.debug(self.name + ' holding batch ' + str(sequence) + ' starting at ' + str(batch.startIdx) +
+                             ', waiting for ' + str(self.nextIdx))
+                heapq.heappush(self._pending, (batch.startIdx, next(self._arrivals), batch))
+                self.heldBatches += 1
+                if len(self._pending) > self.maxPendingBatches:
+                    self._skipTo(self._pending[0][0])
+            else:
+                self._deliver(batch, deliver)
+            self._release(deliver)
+
+    def flush(self, deliver):
+        """
+        Delivers every held batch, recording a gap wherever samples are missing.
+        :param deliver: a function that accepts the next batch in the stream.
+        :return: the gaps, a list of [start, end) sample indexes.
+        """
+        with self._lock:
+            while len(self._pending) > 0:
+                self._skipTo(self._pending[0][0])
+                self._release(deliver)
+            return list(self.gaps)
+
+    def _deliver(self, batch, deliver):
+        if batch.startIdx < self.nextIdx:
+            batch = batch.slice(self.nextIdx - batch.startIdx)
+        self.nextIdx = batch.endIdx
+        deliver(batch)
+
+    def _release(self, deliver):
+        while len(self._pending) > 0 and self._pending[0][0] <= self.nextIdx:
+            batch = heapq.heappop(self._pending)[2]
+            if batch.endIdx <= self.nextIdx:
+                self.duplicates += 1
+            else:
+                self._deliver(batch, deliver)
+
+    def _skipTo(self, startIdx):
+        logger.warning(self.name + ' is missing samples ' + str(self.nextIdx) + ' to ' + str(startIdx))
+        self.gaps.append([self.nextIdx, startIdx])
+        self.nextIdx = startIdx
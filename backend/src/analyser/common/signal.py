@@ -1,7 +1,13 @@
+import glob
+import logging
+import os
+
 import librosa
 import numpy as np
 from scipy import signal
 
+logger = logging.getLogger('analyser.signal')
+
 # 1 micro m/s2 in G
 LA_REFERENCE_ACCELERATION_IN_G = (10 ** -6) / 9.80665
 
@@ -213,21 +219,92 @@ def loadSignalFromDelimitedFile(filename, timeColumnIdx=0, dataColumnIdx=1, deli
     :param delimiter: char
     :return a Signal instance
     """
-    data = np.genfromtxt(filename, delimiter=delimiter, skip_header=skipHeader)
-    columnCount = data.shape[1]
-    if columnCount < timeColumnIdx + 1:
-        raise ValueError(
-            filename + ' has only ' + columnCount + ' columns,  time values can\'t be at column ' + timeColumnIdx)
-    if columnCount < dataColumnIdx + 1:
-        raise ValueError(
-            filename + ' has only ' + columnCount + ' columns,  data values can\'t be at column ' + dataColumnIdx)
-
-    t = data[:, [timeColumnIdx]]
-    samples = data[:, [dataColumnIdx]]
-    # calculate fs as the interval between the time samples
-    fs = int(round(1 / (np.diff(t, n=1, axis=0).mean()), 0))
-    source = Signal(samples.ravel(), fs)
-    return source
+    columns = _loadColumns(filename, [timeColumnIdx, dataColumnIdx], delimiter=delimiter, skipHeader=skipHeader)
+    return Signal(columns[1], _calculateFs(columns[0]))
+
+
+def _calculateFs(t):
+    """
+    :param t: the time of each sample.
+    :return: fs as the interval between the time samples.
+    """
+    return int(round(1 / (np.diff(t).mean()), 0))
+
+
+def _loadColumns(filename, columnIdxs, delimiter=',', skipHeader=0, cache=False):
+    """
+    Reads the requested columns from a delimited file in a single pass.
+    :param filename: the file.
+    :param columnIdxs: the 0 indexed column numbers.
+    :param delimiter: the delimiter.
+    :param skipHeader: how many rows of headers to skip.
+    :param cache: if true, the parsed file is saved as a sidecar npy file which is memory mapped by subsequent loads
+    until the file changes. The sidecar does not record the delimiter or skipHeader so they must not vary between
+    loads.
+    :return: the values in each requested column.
+    """
+    data = _loadSidecar(filename) if cache else None
+    if data is None:
+        data = _parseDelimitedFile(filename, delimiter, skipHeader)
+        if cache:
+            _saveSidecar(filename, data)
+    columnCount = data.shape[0]
+    for idx in columnIdxs:
+        if columnCount < idx + 1:
+            raise ValueError(filename + ' has only ' + str(columnCount) + ' columns, values can\'t be at column ' +
+                             str(idx))
+    # a plain ndarray view (rather than a memmap) of each column, it is still backed by the sidecar if there is one
+    return [np.asarray(data[idx]) for idx in columnIdxs]
+
+
+def _parseDelimitedFile(filename, delimiter, skipHeader):
+    """
+    Parses every column of a delimited file of numbers with loadtxt, falls back to genfromtxt if the file is not a
+    complete grid of numbers (e.g. it has missing values).
+    :return: an ndarray with a row per column.
+    """
+    try:
+        data = np.loadtxt(filename, delimiter=delimiter, skiprows=skipHeader, ndmin=2)
+    except ValueError:
+        data = np.atleast_2d(np.genfromtxt(filename, delimiter=delimiter, skip_header=skipHeader))
+    return np.ascontiguousarray(data.T)
+
+
+def _getSidecarPath(filename):
+    stat = os.stat(filename)
+    return filename + '.' + str(stat.st_size) + '.' + str(stat.st_mtime_ns) + '.npy'
+
+
+def _loadSidecar(filename):
+    """
+    :param filename: the delimited file.
+    :return: the memory mapped content of the sidecar or None if there is no sidecar for the current file.
+    """
+    sidecarPath = _getSidecarPath(filename)
+    if os.path.exists(sidecarPath):
+        try:
+            return np.load(sidecarPath, mmap_mode='r')
+        except ValueError:
+            logger.exception('Ignoring unreadable sidecar ' + sidecarPath)
+    return None
+
+
+def _saveSidecar(filename, data):
+    """
+    Writes the parsed file to a sidecar named after the size and mtime of the file so that any change to the file
+    invalidates it, any stale sidecar is deleted.
+    :param filename: the delimited file.
+    :param data: the parsed file.
+    """
+    sidecarPath = _getSidecarPath(filename)
+    try:
+        for stale in glob.glob(glob.escape(filename) + '.*.npy'):
+            os.remove(stale)
+        tmpPath = filename + '.tmp.npy'
+        np.save(tmpPath, data)
+        os.replace(tmpPath, sidecarPath)
+    except OSError:
+        logger.exception('Unable to write sidecar ' + sidecarPath)
 
 
 def loadSignalFromWav(inputSignalFile, calibrationRealWorldValue=None, calibrationSignalFile=None, start=None,
@@ -277,6 +354,48 @@ def readWav(inputSignalFile, selectedChannel=1, start=None, end=None) -> Signal:
     return Signal(ys[::selectedChannel], frameRate)
 
 
+class SpectralSummarySignal(object):
+    """
+    A single axis of a spectral summary calculated by the recorder, i.e. the high passed spectrum, peak spectrum and
+    psd have already been calculated so only the conversion to dB remains. The time series is not available.
+    """
+
+    def __init__(self, freqs, spectrum, peakSpectrum, psd, fs):
+        self.freqs = freqs
+        self.spectrumValues = spectrum
+        self.peakSpectrumValues = peakSpectrum
+        self.psdValues = psd
+        self.fs = fs
+
+    def highPass(self, *args):
+        """
+        :return: self as the summary was calculated from high passed data.
+        """
+        return self
+
+    def raw(self):
+        return np.array([])
+
+    def vibration(self):
+        return np.array([])
+
+    def tilt(self):
+        return np.array([])
+
+    def psd(self, ref=None, **kwargs):
+        return self.freqs, self.psdValues if ref is None else librosa.power_to_db(self.psdValues, ref=ref)
+
+    def spectrum(self, ref=None, **kwargs):
+        return self.freqs, self._toAmplitude(self.spectrumValues, ref)
+
+    def peakSpectrum(self, ref=None, **kwargs):
+        return self.freqs, self._toAmplitude(self.peakSpectrumValues, ref)
+
+    @staticmethod
+    def _toAmplitude(values, ref):
+        return values if ref is None else librosa.amplitude_to_db(values, ref=ref)
+
+
 class TriAxisSignal(object):
     """
     A measurement that has data on multiple, independent, axes.
@@ -379,7 +498,7 @@ class TriAxisSignal(object):
 
 
 def loadTriAxisSignalFromFile(filename, timeColumnIdx=0, xIdx=1, yIdx=2, zIdx=3, delimiter=',',
-                              skipHeader=0) -> TriAxisSignal:
+                              skipHeader=0, cache=False) -> TriAxisSignal:
     """
     A factory method for loading a tri axis measurement from a single file.
     :param filename: the file to load from.
@@ -389,12 +508,44 @@ def loadTriAxisSignalFromFile(filename, timeColumnIdx=0, xIdx=1, yIdx=2, zIdx=3,
     :param zIdx: the column containing z axis data.
     :param delimiter: the delimiter.
     :param skipHeader: how many rows of headers to skip.
+    :param cache: if true, the parsed file is cached in a sidecar file so it is only parsed once.
     :return: the measurement
     """
-    return TriAxisSignal(
-        x=loadSignalFromDelimitedFile(filename, timeColumnIdx=timeColumnIdx, dataColumnIdx=xIdx,
-                                      delimiter=delimiter, skipHeader=skipHeader),
-        y=loadSignalFromDelimitedFile(filename, timeColumnIdx=timeColumnIdx, dataColumnIdx=yIdx,
-                                      delimiter=delimiter, skipHeader=skipHeader),
-        z=loadSignalFromDelimitedFile(filename, timeColumnIdx=timeColumnIdx, dataColumnIdx=zIdx,
-                                      delimiter=delimiter, skipHeader=skipHeader))
+    t, x, y, z = _loadColumns(filename, [timeColumnIdx, xIdx, yIdx, zIdx], delimiter=delimiter, skipHeader=skipHeader,
+                              cache=cache)
+    fs = _calculateFs(t)
+    return TriAxisSignal(x=Signal(x, fs), y=Signal(y, fs), z=Signal(z, fs))
+
+
+def loadTriAxisSignalFromDataFile(filename, xIdx=1, yIdx=2, zIdx=3) -> TriAxisSignal:
+    """
+    A factory method for loading a tri axis measurement from a data file (see core.datafile).
+    :param filename: the data.bin file.
+    :param xIdx: the column containing x axis data.
+    :param yIdx: the column containing y axis data.
+    :param zIdx: the column containing z axis data.
+    :return: the measurement.
+    """
+    from core.datafile import DataFile
+    dataFile = DataFile(filename)
+    return TriAxisSignal(x=Signal(dataFile.columnAt(xIdx), dataFile.fs),
+                         y=Signal(dataFile.columnAt(yIdx), dataFile.fs),
+                         z=Signal(dataFile.columnAt(zIdx), dataFile.fs))
+
+
+def loadTriAxisSignalFromSummary(filename) -> TriAxisSignal:
+    """
+    A factory method for loading a tri axis measurement from the spectral summary written by a recorder.
+    :param filename: the spectrum.json file.
+    :return: the measurement.
+    """
+    import json
+    with open(filename) as f:
+        summary = json.load(f)
+    freqs = np.array(summary['freqs'])
+    axes = {
+        axis: SpectralSummarySignal(freqs, np.array(values['spectrum']), np.array(values['peakSpectrum']),
+                                    np.array(values['psd']), summary['fs'])
+        for axis, values in summary['axes'].items()
+    }
+    return TriAxisSignal(x=axes.get('x'), y=axes.get('y'), z=axes.get('z'))
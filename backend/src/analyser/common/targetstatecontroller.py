@@ -3,22 +3,27 @@ import logging
 from flask_restful import marshal
 
 from analyser.common.config import loadTargetState
+from core.fanout import FanOut, FanOutStatus
 from core.interface import targetStateFields, RecordingDeviceStatus
 
 logger = logging.getLogger('analyser.targetstate')
 
 REACH_TARGET_STATE = 'RTS'
+PROPAGATE_TARGET_STATE = 'PTS'
 
 
 class TargetStateController(object):
-    def __init__(self, targetStateProvider, reactor, httpclient, deviceController=None):
+    def __init__(self, targetStateProvider, reactor, httpclient, deviceController=None, fanOut=None):
         """
         Registers with the reactor.
         :param reactor:
+        :param fanOut: used to propagate a new target state to all devices at once.
         """
         self._reactor = reactor
         self._httpclient = httpclient
+        self._fanOut = fanOut if fanOut is not None else FanOut('targetstate')
         self._reactor.register(REACH_TARGET_STATE, _applyTargetState)
+        self._reactor.register(PROPAGATE_TARGET_STATE, self._propagateTargetState)
         self._targetStateProvider = targetStateProvider
         self.deviceController = deviceController
 
@@ -35,13 +40,27 @@ class TargetStateController(object):
 
     def updateTargetState(self, newState):
         """
-        Updates the system target state and propagates that to all devices.
+        Updates the system target state and propagates that to all devices via the reactor so the caller does not wait
+        for the devices to respond.
         :param newState:
         :return:
         """
-        self._targetStateProvider.state = loadTargetState(newState, self._targetStateProvider.state)
-        for device in self.deviceController.getDevices():
-            self.updateDeviceState(device.payload)
+        targetState = loadTargetState(newState, self._targetStateProvider.state)
+        self._targetStateProvider.state = targetState
+        self._reactor.offer(PROPAGATE_TARGET_STATE, [targetState])
+
+    def _propagateTargetState(self, targetState):
+        """
+        Applies the target state to all devices concurrently.
+        :param targetState: the target state.
+        :return: a dict of deviceId vs FanOutResult.
+        """
+        results = self._fanOut.run(lambda device: _applyTargetState(targetState, device.payload, self._httpclient),
+                                   self.deviceController.getDevices())
+        for device, result in results.items():
+            if result.status is not FanOutStatus.OK:
+                logger.warning("Unable to update target state on " + device.deviceId + " - " + str(result))
+        return {device.deviceId: result for device, result in results.items()}
 
     def getTargetState(self):
         """
@@ -83,7 +102,8 @@ def _applyTargetState(targetState, md, httpclient):
     :param md:
     :param targetState: the target state.
     :param httpclient: the http client
-    :return:
+    :return: the response status code if an update was sent to the device, None otherwise. Raises if the device could
+    not be contacted.
     """
     anyUpdate = False
     if md['fs'] != targetState.fs:
@@ -120,10 +140,7 @@ def _applyTargetState(targetState, md, httpclient):
         payload = marshal(targetState, targetStateFields)
         logger.info("Applying target state change " + md['name'] + " - " + str(payload))
         if RecordingDeviceStatus.INITIALISED.name == md.get('status'):
-            try:
-                httpclient.patch(md['serviceURL'], json=payload)
-            except Exception as e:
-                logger.exception(e)
+            return httpclient.patch(md['serviceURL'], json=payload).status_code
         else:
             logger.warning("Ignoring target state change until " + md['name'] + " is idle, currently " + md['status'])
     else:
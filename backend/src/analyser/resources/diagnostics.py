@@ -0,0 +1,57 @@
+import logging
+
+from flask_restful import Resource
+
+logger = logging.getLogger('analyser.diagnostics')
+
+
+class Diagnostics(Resource):
+    """
+    Exposes the internal state of the analyser that is useful when looking at how it copes under load.
+    """
+
+    def __init__(self, **kwargs):
+        self._deviceController = kwargs['deviceController']
+        self._measurementController = kwargs['measurementController']
+        self._reactor = kwargs['reactor']
+        self._httpclient = kwargs.get('httpclient')
+        self._compressionStats = kwargs.get('compressionStats')
+        self._ingestServer = kwargs.get('ingestServer')
+        self._fanOut = kwargs.get('fanOut')
+        self._dataCache = kwargs.get('dataCache')
+
+    def get(self):
+        """
+        :return: the depth of the reactor queue and of each device's data handler queue (along with how often queued
+        batches have been merged and how quickly the data is written to disk) plus the number of measurements in each
+        state, the connection reuse stats of the http client, how well the data received was compressed, the activity
+        on the streaming ingest channel, how long it takes to send a request to every device and how well the
+        measurement data cache is working.
+        """
+        devices = {}
+        for device in self._deviceController.getDevices():
+            handler = device.dataHandler
+            devices[device.deviceId] = {
+                'handlerQueueDepth': handler.getQueueDepth() if hasattr(handler, 'getQueueDepth') else None,
+                'handlerCoalescing': handler.getCoalescingStats() if hasattr(handler, 'getCoalescingStats') else None,
+                'handlerWrites': self._getWriteStats(handler)
+            }
+        return {
+            'reactorQueueDepth': self._reactor.getQueueDepth(),
+            'devices': devices,
+            'measurements': {
+                'active': len(self._measurementController.activeMeasurements),
+                'complete': len(self._measurementController.completeMeasurements),
+                'failed': len(self._measurementController.failedMeasurements)
+            },
+            'httpclient': self._httpclient.getStats() if hasattr(self._httpclient, 'getStats') else None,
+            'compression': self._compressionStats.toDict() if self._compressionStats is not None else None,
+            'ingest': self._ingestServer.getStats() if self._ingestServer is not None else None,
+            'fanOut': self._fanOut.getStats() if self._fanOut is not None else None,
+            'dataCache': self._dataCache.getStats() if self._dataCache is not None else None
+        }, 200
+
+    @staticmethod
+    def _getWriteStats(handler):
+        delegate = getattr(handler, 'delegate', handler)
+        return delegate.getStats() if hasattr(delegate, 'getStats') else None
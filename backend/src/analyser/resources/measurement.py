@@ -6,7 +6,9 @@ from flask import request
 from flask_restful import Resource, marshal_with
 
 from analyser.resources.measurements import measurementFields
-from core.interface import DATETIME_FORMAT
+from core.batch import SampleBatch, BINARY_CONTENT_TYPE
+from core.compression import DEFLATE, decompress
+from core.interface import DATETIME_FORMAT, SEQUENCE_HEADER
 
 logger = logging.getLogger('analyser.measurement')
 
@@ -139,6 +141,7 @@ class InitialiseMeasurement(Resource):
 class RecordData(Resource):
     def __init__(self, **kwargs):
         self._measurementController = kwargs['measurementController']
+        self._compressionStats = kwargs.get('compressionStats')
 
     def put(self, measurementId, deviceId):
         """
@@ -147,12 +150,25 @@ class RecordData(Resource):
         :param deviceId:
         :return:
         """
-        data = request.get_json()
-        if data is not None:
-            parsedData = json.loads(data)
+        if request.mimetype == BINARY_CONTENT_TYPE:
+            try:
+                payload = request.get_data()
+                if request.headers.get('Content-Encoding') == DEFLATE:
+                    payload = decompress(payload, stats=self._compressionStats)
+                parsedData = SampleBatch.fromBinary(payload)
+            except ValueError:
+                logger.exception('Invalid binary payload received ' + measurementId + '/' + deviceId)
+                return None, 400
+        else:
+            data = request.get_json()
+            parsedData = json.loads(data) if data is not None else None
+            if isinstance(parsedData, dict):
+                parsedData = SampleBatch.fromDict(parsedData)
+        if parsedData is not None:
             logger.debug('Received payload ' + measurementId + '/' + deviceId + ': ' +
                          str(len(parsedData)) + ' records')
-            if self._measurementController.recordData(measurementId, deviceId, parsedData):
+            sequence = request.headers.get(SEQUENCE_HEADER, type=int)
+            if self._measurementController.recordData(measurementId, deviceId, parsedData, sequence=sequence):
                 return None, 200
             else:
                 logger.warning('Unable to record payload ' + measurementId + '/' + deviceId)
@@ -162,6 +178,32 @@ class RecordData(Resource):
             return None, 400
 
 
+class RecordSpectrum(Resource):
+    def __init__(self, **kwargs):
+        self._measurementController = kwargs['measurementController']
+
+    def put(self, measurementId, deviceId):
+        """
+        Store the spectral summary calculated by the device for this measurement session.
+        :param measurementId:
+        :param deviceId:
+        :return:
+        """
+        data = request.get_json()
+        if data is not None:
+            summary = json.loads(data)
+            logger.info('Received spectral summary ' + measurementId + '/' + deviceId + ' of ' +
+                        str(summary.get('samples')) + ' samples')
+            if self._measurementController.recordSpectrum(measurementId, deviceId, summary):
+                return None, 200
+            else:
+                logger.warning('Unable to record spectral summary ' + measurementId + '/' + deviceId)
+                return None, 404
+        else:
+            logger.error('Invalid spectral summary received ' + measurementId + '/' + deviceId)
+            return None, 400
+
+
 class CompleteMeasurement(Resource):
     def __init__(self, **kwargs):
         self._measurementController = kwargs['measurementController']
@@ -0,0 +1,225 @@
+import math
+import struct
+
+import numpy as np
+
+# the content type of a batch in the binary wire format
+BINARY_CONTENT_TYPE = 'application/vnd.vibe.samplebatch'
+BINARY_MAGIC = b'VSB1'
+# magic, encoding, flags, column count, sample count, startIdx, fs
+BINARY_HEADER = struct.Struct('<4sBBHIqd')
+# name length then the name then gain, offset
+BINARY_COLUMN = struct.Struct('<dd')
+BINARY_ENCODINGS = {'float32': (0, np.dtype('<f4')), 'int16': (1, np.dtype('<i2')), 'float64': (2, np.dtype('<f8'))}
+# set if the time column is omitted from the body and recalculated from startIdx and fs
+FLAG_DERIVED_TIME = 0x01
+# set if the values are stored column by column as the difference from the previous sample, only used with int16
+FLAG_DELTA = 0x02
+TIME_COLUMN = 'time'
+
+
+class SampleBatch(object):
+    """
+    A columnar batch of samples, i.e. a single 2D ndarray with one row per sample and one column per value along with
+    the metadata required to make sense of it. A batch behaves like the list of lists it replaces (len, iteration and
+    indexing yield rows) so existing consumers continue to work while new consumers can work on the array directly.
+    :var samples: the (samples, columns) ndarray.
+    :var columns: the name of each column.
+    :var fs: the sample rate.
+    :var startIdx: the index of the first sample in this batch relative to the start of the measurement.
+    :var scales: a dict of column name -> [gain, offset] that converts a raw sensor value into the stored real value.
+    """
+
+    def __init__(self, samples, columns, fs, startIdx=0, scales=None):
+        self.samples = samples
+        self.columns = list(columns)
+        self.fs = fs
+        self.startIdx = startIdx
+        self.scales = {} if scales is None else scales
+
+    def __len__(self):
+        return self.samples.shape[0]
+
+    def __iter__(self):
+        return iter(self.samples.tolist())
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                raise ValueError('SampleBatch only supports contiguous slices')
+            return self.slice(start, stop)
+        return self.samples[item].tolist()
+
+    @property
+    def endIdx(self):
+        """
+        :return: the index of the sample that immediately follows this batch.
+        """
+        return self.startIdx + len(self)
+
+    def slice(self, start, end=None):
+        """
+        Creates a view onto a contiguous range of samples in this batch, no data is copied.
+        :param start: the first sample (relative to this batch) to include.
+        :param end: the sample to stop at (exclusive), defaults to the end of the batch.
+        :return: the sliced batch.
+        """
+        return SampleBatch(self.samples[start:end], self.columns, self.fs, startIdx=self.startIdx + start,
+                           scales=self.scales)
+
+    def toRows(self):
+        """
+        :return: the samples as a list of lists, i.e. the pre SampleBatch format.
+        """
+        return self.samples.tolist()
+
+    def toDict(self):
+        """
+        :return: the batch as a json friendly dict.
+        """
+        return {
+            'columns': self.columns,
+            'fs': self.fs,
+            'startIdx': self.startIdx,
+            'scales': self.scales,
+            'samples': self.toRows()
+        }
+
+    @staticmethod
+    def fromDict(payload):
+        """
+        The inverse of toDict.
+        :param payload: the dict.
+        :return: the batch.
+        """
+        columns = payload['columns']
+        samples = np.array(payload['samples'], dtype=np.float64).reshape(-1, len(columns))
+        return SampleBatch(samples, columns, payload['fs'], startIdx=payload.get('startIdx', 0),
+                           scales=payload.get('scales'))
+
+    def toBinary(self, encoding='float32', delta=False):
+        """
+        Packs the batch into the binary wire format, i.e. a small header describing the columns, fs, startIdx and
+        scales followed by the values as little endian float32 (or float64) or int16 sensor counts. The time column is
+        not sent as it can be recalculated from startIdx and fs. int16 is only used if every value column has a scale,
+        otherwise float32 is used. Sensor counts vary slowly so, if delta is set and int16 is used, each column is stored
+        in turn as the difference between consecutive samples which makes the payload far more compressible.
+        :param encoding: float32, float64 or int16.
+        :param delta: whether to delta encode int16 values.
+        :return: the bytes.
+        """
+        if encoding not in BINARY_ENCODINGS:
+            raise ValueError('Unknown encoding ' + str(encoding))
+        derivedTime = len(self.columns) > 0 and self.columns[0] == TIME_COLUMN
+        valueColumns = self.columns[1:] if derivedTime else self.columns
+        values = self.samples[:, 1:] if derivedTime else self.samples
+        if encoding == 'int16' and not all(c in self.scales for c in valueColumns):
+            encoding = 'float32'
+        code, dtype = BINARY_ENCODINGS[encoding]
+        delta = delta and encoding == 'int16'
+        flags = (FLAG_DERIVED_TIME if derivedTime else 0) | (FLAG_DELTA if delta else 0)
+        header = [BINARY_HEADER.pack(BINARY_MAGIC, code, flags, len(self.columns), len(self), int(self.startIdx),
+                                     float(self.fs))]
+        for column in self.columns:
+            name = column.encode('utf-8')
+            gain, offset = self.scales.get(column, [math.nan, math.nan])
+            header.append(struct.pack('<B', len(name)) + name + BINARY_COLUMN.pack(gain, offset))
+        if encoding == 'int16':
+            gains = np.array([self.scales[c][0] for c in valueColumns])
+            offsets = np.array([self.scales[c][1] for c in valueColumns])
+            body = np.rint((values - offsets) / gains).astype(dtype)
+            if delta:
+                # int16 arithmetic wraps so the deltas always fit and the cumulative sum restores the exact counts
+                body[1:] = body[1:] - body[:-1]
+                body = body.T
+        else:
+            body = values.astype(dtype)
+        return b''.join(header) + body.tobytes()
+
+    @staticmethod
+    def fromBinary(payload):
+        """
+        The inverse of toBinary.
+        :param payload: the bytes.
+        :return: the batch.
+        """
+        if len(payload) < BINARY_HEADER.size:
+            raise ValueError('Payload is too short to be a batch')
+        magic, code, flags, columnCount, sampleCount, startIdx, fs = BINARY_HEADER.unpack_from(payload, 0)
+        if magic != BINARY_MAGIC:
+            raise ValueError('Payload is not a batch')
+        dtype = next((d for c, d in BINARY_ENCODINGS.values() if c == code), None)
+        if dtype is None:
+            raise ValueError('Unknown encoding ' + str(code))
+        pos = BINARY_HEADER.size
+        columns = []
+        scales = {}
+        try:
+            for i in range(columnCount):
+                nameLength = payload[pos]
+                name = payload[pos + 1:pos + 1 + nameLength].decode('utf-8')
+                pos += 1 + nameLength
+                gain, offset = BINARY_COLUMN.unpack_from(payload, pos)
+                pos += BINARY_COLUMN.size
+                columns.append(name)
+                if not math.isnan(gain):
+                    scales[name] = [gain, offset]
+        except (IndexError, struct.error) as e:
+            raise ValueError('Payload is truncated in the column table') from e
+        derivedTime = flags & FLAG_DERIVED_TIME
+        valueColumns = columns[1:] if derivedTime else columns
+        body = np.frombuffer(payload, dtype=dtype, count=sampleCount * len(valueColumns), offset=pos)
+        if flags & FLAG_DELTA:
+            body = np.cumsum(body.reshape(len(valueColumns), sampleCount).T, axis=0, dtype=dtype)
+        else:
+            body = body.reshape(sampleCount, len(valueColumns))
+        samples = np.empty((sampleCount, len(columns)), dtype=np.float64)
+        values = samples[:, 1:] if derivedTime else samples
+        if dtype == BINARY_ENCODINGS['int16'][1]:
+            np.multiply(body, np.array([scales[c][0] for c in valueColumns]), out=values)
+            values += np.array([scales[c][1] for c in valueColumns])
+        else:
+            values[:] = body
+        if derivedTime:
+            samples[:, 0] = np.arange(startIdx, startIdx + sampleCount) / fs
+        return SampleBatch(samples, columns, fs, startIdx=startIdx, scales=scales)
+
+    def isFollowedBy(self, other):
+        """
+        :param other: another batch.
+        :return: true if other carries on from where this batch ends, i.e. the two can be merged into a single batch.
+        """
+        return isinstance(other, SampleBatch) and other.startIdx == self.endIdx and other.columns == self.columns \
+               and other.fs == self.fs and other.scales == self.scales
+
+    @staticmethod
+    def concat(batches):
+        """
+        Merges a sequence of contiguous batches into a single batch.
+        :param batches: the batches, each must follow on from the previous one.
+        :return: the merged batch.
+        """
+        if len(batches) == 1:
+            return batches[0]
+        for previous, following in zip(batches, batches[1:]):
+            if not previous.isFollowedBy(following):
+                raise ValueError('Batch starting at ' + str(following.startIdx) + ' does not follow batch ending at '
+                                 + str(previous.endIdx))
+        first = batches[0]
+        return SampleBatch(np.concatenate([b.samples for b in batches]), first.columns, first.fs,
+                           startIdx=first.startIdx, scales=first.scales)
+
+    @staticmethod
+    def fromRows(rows, columns, fs, startIdx=0, scales=None):
+        """
+        Adapts a list of lists into a batch.
+        :param rows: the rows.
+        :param columns: the column names.
+        :param fs: the sample rate.
+        :param startIdx: the index of the first sample.
+        :param scales: the scales.
+        :return: the batch.
+        """
+        samples = np.array(rows, dtype=np.float64).reshape(-1, len(columns))
+        return SampleBatch(samples, columns, fs, startIdx=startIdx, scales=scales)
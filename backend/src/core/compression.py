@@ -0,0 +1,77 @@
+import threading
+import time
+import zlib
+
+# the Content-Encoding of a compressed payload
+DEFLATE = 'deflate'
+
+
+class CompressionStats(object):
+    """
+    Tracks how well payloads compress and the time spent compressing (or decompressing) them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.payloads = 0
+        self.rawBytes = 0
+        self.encodedBytes = 0
+        self.seconds = 0.0
+
+    def record(self, rawBytes, encodedBytes, seconds):
+        """
+        :param rawBytes: the size of the uncompressed payload.
+        :param encodedBytes: the size of the compressed payload.
+        :param seconds: the time taken.
+        """
+        with self._lock:
+            self.payloads += 1
+            self.rawBytes += rawBytes
+            self.encodedBytes += encodedBytes
+            self.seconds += seconds
+
+    def toDict(self):
+        """
+        :return: the totals along with the compression ratio (raw / compressed) and the time taken per MB of raw data.
+        """
+        with self._lock:
+            return {
+                'payloads': self.payloads,
+                'rawBytes': self.rawBytes,
+                'encodedBytes': self.encodedBytes,
+                'ratio': round(self.rawBytes / self.encodedBytes, 3) if self.encodedBytes > 0 else None,
+                'seconds': round(self.seconds, 6),
+                'secondsPerMB': round(self.seconds / (self.rawBytes / 1e6), 6) if self.rawBytes > 0 else None
+            }
+
+
+def compress(payload, level, stats=None):
+    """
+    Compresses the payload with zlib.
+    :param payload: the bytes.
+    :param level: the zlib compression level, 1 (fastest) to 9 (smallest).
+    :param stats: the stats to update, if any.
+    :return: the compressed bytes.
+    """
+    start = time.perf_counter()
+    compressed = zlib.compress(payload, level)
+    if stats is not None:
+        stats.record(len(payload), len(compressed), time.perf_counter() - start)
+    return compressed
+
+
+def decompress(payload, stats=None):
+    """
+    The inverse of compress.
+    :param payload: the compressed bytes.
+    :param stats: the stats to update, if any.
+    :return: the bytes, raises ValueError if the payload is not valid zlib data.
+    """
+    start = time.perf_counter()
+    try:
+        decompressed = zlib.decompress(payload)
+    except zlib.error as e:
+        raise ValueError('Invalid compressed payload') from e
+    if stats is not None:
+        stats.record(len(decompressed), len(payload), time.perf_counter() - start)
+    return decompressed
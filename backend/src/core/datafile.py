@@ -0,0 +1,266 @@
+import argparse
+import glob
+import logging
+import math
+import os
+import struct
+
+import numpy as np
+
+from core.batch import BINARY_COLUMN, BINARY_ENCODINGS, TIME_COLUMN
+
+logger = logging.getLogger('core.datafile')
+
+DATA_FILE_NAME = 'data.bin'
+CSV_DATA_FILE_NAME = 'data.out'
+DATA_FILE_MAGIC = b'VMD1'
+# magic, encoding, flags, column count, fs, startIdx, sample count
+DATA_FILE_HEADER = struct.Struct('<4sBBHdqq')
+SAMPLE_COUNT_OFFSET = DATA_FILE_HEADER.size - 8
+# the names of the columns in a data.out written by a recorder, i.e. time, acceleration then gyro
+CSV_COLUMNS = [TIME_COLUMN, 'ac_x', 'ac_y', 'ac_z', 'gy_x', 'gy_y', 'gy_z']
+
+
+class DataFileWriter(object):
+    """
+    Writes a measurement to a data file. The file is a small header (fs, the columns and their scales, the index of the
+    first sample and the sample count) followed by the values of each sample, i.e. one block per batch appended as the
+    data arrives. The time column is not stored as it is recalculated from the sample index and fs. Values are stored as
+    little endian float32 or, if every value column has a scale, as the raw int16 sensor counts.
+    """
+
+    def __init__(self, path, columns, fs, scales=None, encoding='float32', startIdx=0):
+        """
+        :param path: the file to write.
+        :param columns: the column names, the first is assumed to be time if it is named as such.
+        :param fs: the sample rate.
+        :param scales: a dict of column name -> [gain, offset].
+        :param encoding: float32 or int16.
+        :param startIdx: the index of the first sample.
+        """
+        if encoding not in ('float32', 'int16'):
+            raise ValueError('Unknown encoding ' + str(encoding))
+        self.path = path
+        self.columns = list(columns)
+        self.fs = fs
+        self.scales = {} if scales is None else scales
+        self.derivedTime = len(self.columns) > 0 and self.columns[0] == TIME_COLUMN
+        self.valueColumns = self.columns[1:] if self.derivedTime else self.columns
+        if encoding == 'int16' and not all(c in self.scales for c in self.valueColumns):
+            encoding = 'float32'
+        self.encoding = encoding
+        self.sampleCount = 0
+        header = [DATA_FILE_HEADER.pack(DATA_FILE_MAGIC, BINARY_ENCODINGS[encoding][0], 0, len(self.columns),
+                                        float(fs), int(startIdx), 0)]
+        for column in self.columns:
+            name = column.encode('utf-8')
+            gain, offset = self.scales.get(column, [math.nan, math.nan])
+            header.append(struct.pack('<B', len(name)) + name + BINARY_COLUMN.pack(gain, offset))
+        self._file = open(path, mode='wb')
+        self._file.write(b''.join(header))
+
+    def append(self, samples):
+        """
+        Appends the samples to the file.
+        :param samples: a (samples, columns) ndarray in the same column order as the file.
+        """
+        values = samples[:, 1:] if self.derivedTime else samples
+        if self.encoding == 'int16':
+            gains = np.array([self.scales[c][0] for c in self.valueColumns])
+            offsets = np.array([self.scales[c][1] for c in self.valueColumns])
+            values = np.rint((values - offsets) / gains)
+        self.appendValues(values.astype(BINARY_ENCODINGS[self.encoding][1]))
+
+    def appendValues(self, values):
+        """
+        Appends values that are already in the stored form, i.e. without the time column and in the file's encoding.
+        :param values: a (samples, value columns) ndarray.
+        """
+        self._file.write(np.ascontiguousarray(values).tobytes())
+        self.sampleCount += values.shape[0]
+
+    def close(self):
+        """
+        Records the sample count in the header and closes the file.
+        """
+        if self._file is not None:
+            self._file.seek(SAMPLE_COUNT_OFFSET)
+            self._file.write(struct.pack('<q', self.sampleCount))
+            self._file.close()
+            self._file = None
+
+
+class DataFile(object):
+    """
+    A data file opened for reading, the values are memory mapped so nothing is read until it is used.
+    :var values: the (samples, value columns) memory mapped array of stored values.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the file to read.
+        """
+        with open(path, mode='rb') as f:
+            header = f.read(DATA_FILE_HEADER.size)
+            if len(header) < DATA_FILE_HEADER.size:
+                raise ValueError(path + ' is too short to be a data file')
+            magic, code, flags, columnCount, fs, startIdx, sampleCount = DATA_FILE_HEADER.unpack(header)
+            if magic != DATA_FILE_MAGIC:
+                raise ValueError(path + ' is not a data file')
+            self.encoding = next((name for name, (c, d) in BINARY_ENCODINGS.items() if c == code), None)
+            if self.encoding is None:
+                raise ValueError('Unknown encoding ' + str(code) + ' in ' + path)
+            self.columns = []
+            self.scales = {}
+            for i in range(columnCount):
+                name = f.read(f.read(1)[0]).decode('utf-8')
+                gain, offset = BINARY_COLUMN.unpack(f.read(BINARY_COLUMN.size))
+                self.columns.append(name)
+                if not math.isnan(gain):
+                    self.scales[name] = [gain, offset]
+            dataOffset = f.tell()
+        self.path = path
+        self.fs = fs
+        self.startIdx = startIdx
+        self.derivedTime = len(self.columns) > 0 and self.columns[0] == TIME_COLUMN
+        self.valueColumns = self.columns[1:] if self.derivedTime else self.columns
+        dtype = BINARY_ENCODINGS[self.encoding][1]
+        rowBytes = dtype.itemsize * len(self.valueColumns)
+        # a file that was not closed (e.g. the analyser died) has no sample count so work it out from the size
+        available = (os.path.getsize(path) - dataOffset) // rowBytes if rowBytes > 0 else 0
+        if sampleCount != available:
+            logger.warning(path + ' has ' + str(available) + ' samples, header says ' + str(sampleCount))
+        self.sampleCount = available
+        if available > 0:
+            self.values = np.memmap(path, dtype=dtype, mode='r', offset=dataOffset,
+                                    shape=(available, len(self.valueColumns)))
+        else:
+            self.values = np.empty((0, len(self.valueColumns)), dtype=dtype)
+
+    def __len__(self):
+        return self.sampleCount
+
+    def time(self):
+        """
+        :return: the time of each sample.
+        """
+        return np.arange(self.startIdx, self.startIdx + self.sampleCount) / self.fs
+
+    def column(self, name):
+        """
+        :param name: the column name.
+        :return: the real values in the column, a memory mapped view for a float encoding (so nothing is read until it
+        is used) or a float64 copy for int16 as the stored counts have to be scaled.
+        """
+        if self.derivedTime and name == TIME_COLUMN:
+            return self.time()
+        idx = self.valueColumns.index(name)
+        if self.encoding != 'int16':
+            return self.values[:, idx]
+        gain, offset = self.scales[name]
+        values = np.array(self.values[:, idx], dtype=np.float64)
+        values *= gain
+        values += offset
+        return values
+
+    def columnAt(self, idx):
+        """
+        :param idx: the index of the column.
+        :return: the real values in the column, see column.
+        """
+        return self.column(self.columns[idx])
+
+    def copyRange(self, path, start, end):
+        """
+        Copies the samples between start and end (inclusive, in seconds) to a new data file which starts from 0.
+        :param path: the new file.
+        :param start: the start time.
+        :param end: the end time.
+        :return: the no of samples copied.
+        """
+        time = self.time()
+        selected = np.nonzero((time >= start) & (time <= end))[0]
+        first = selected[0] if len(selected) > 0 else 0
+        last = selected[-1] + 1 if len(selected) > 0 else 0
+        startIdx = self.startIdx + first
+        if start > 0:
+            startIdx -= int(round(start * self.fs))
+        writer = DataFileWriter(path, self.columns, self.fs, scales=self.scales, encoding=self.encoding,
+                                startIdx=startIdx)
+        try:
+            # the stored values are copied as is so no precision is lost
+            writer.appendValues(self.values[first:last])
+        finally:
+            writer.close()
+        return last - first
+
+
+def csvColumns(count):
+    """
+    :param count: the no of columns in a row of a data.out.
+    :return: the names of the columns.
+    """
+    return CSV_COLUMNS[:count] + ['c' + str(i) for i in range(len(CSV_COLUMNS), count)]
+
+
+def estimateFs(time):
+    """
+    :param time: the time of each sample.
+    :return: the sample rate implied by the interval between samples, 1 if there are too few samples to tell.
+    """
+    return int(round(1 / np.diff(time).mean(), 0)) if len(time) > 1 else 1
+
+
+def convertCsvFile(csvPath):
+    """
+    Converts a data.out into a float32 data file in the same directory.
+    :param csvPath: the data.out.
+    :return: the path to the data file or None if the csv is empty.
+    """
+    data = np.loadtxt(csvPath, delimiter=',', ndmin=2)
+    if data.shape[0] == 0:
+        logger.warning('Ignoring empty ' + csvPath)
+        return None
+    columns = csvColumns(data.shape[1])
+    fs = estimateFs(data[:, 0])
+    dataPath = os.path.join(os.path.dirname(csvPath), DATA_FILE_NAME)
+    writer = DataFileWriter(dataPath, columns, fs, startIdx=int(round(data[0, 0] * fs)))
+    try:
+        writer.append(data)
+    finally:
+        writer.close()
+    return dataPath
+
+
+def convertMeasurements(dataDir, removeCsv=False):
+    """
+    Converts every data.out in the data dir that does not already have a data file.
+    :param dataDir: the analyser data dir.
+    :param removeCsv: if true, the data.out is deleted once it is converted.
+    :return: the no of files converted.
+    """
+    converted = 0
+    for csvPath in glob.glob(os.path.join(dataDir, '**', CSV_DATA_FILE_NAME), recursive=True):
+        if os.path.exists(os.path.join(os.path.dirname(csvPath), DATA_FILE_NAME)):
+            continue
+        dataPath = convertCsvFile(csvPath)
+        if dataPath is not None:
+            logger.info('Converted ' + csvPath + ' from ' + str(os.path.getsize(csvPath)) + ' to ' +
+                        str(os.path.getsize(dataPath)) + ' bytes')
+            converted += 1
+            if removeCsv:
+                os.remove(csvPath)
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts the data.out files in the analyser data dir to data.bin')
+    parser.add_argument('dataDir', help='the analyser data dir')
+    parser.add_argument('--remove', action='store_true', help='delete each data.out once it is converted')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print('Converted ' + str(convertMeasurements(args.dataDir, removeCsv=args.remove)) + ' measurements')
+
+
+if __name__ == '__main__':
+    main()
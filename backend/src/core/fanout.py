@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from enum import Enum
+
+logger = logging.getLogger('core.fanout')
+
+
+class FanOutStatus(Enum):
+    OK = 1
+    FAILED = 2
+    TIMEOUT = 3
+
+
+class FanOutResult(object):
+    """
+    The outcome of calling a function against a single target.
+    """
+
+    def __init__(self, status, value=None, error=None, elapsed=None):
+        """
+        :param status: the FanOutStatus, FAILED if the call raised an exception, TIMEOUT if it did not complete in time.
+        :param value: the value returned by the call.
+        :param error: the exception raised by the call.
+        :param elapsed: the time in seconds from the start of the fan out until the call completed, None if it timed out.
+        """
+        self.status = status
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    def __str__(self):
+        return 'FanOutResult[' + self.status.name + '-' + str(self.value) + '-' + str(self.elapsed) + ']'
+
+
+class FanOut(object):
+    """
+    Calls a function against many targets (e.g. sends the same request to every device) concurrently using a bounded
+    pool of workers. The fan out as a whole has a deadline so a few slow or dead targets cannot hold up the caller for
+    longer than that, any call that has not completed by then is reported as timed out and abandoned (it is left to
+    complete in the background if it has already started).
+    """
+
+    def __init__(self, name, maxWorkers=8, deadlineSeconds=2.0):
+        """
+        :param name: the name used in log messages.
+        :param maxWorkers: the maximum no of calls in progress at once.
+        :param deadlineSeconds: the time allowed for all calls to complete.
+        """
+        self.name = name
+        self.maxWorkers = maxWorkers
+        self.deadlineSeconds = deadlineSeconds
+        self._executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self._lock = threading.Lock()
+        self.fanOuts = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.maxElapsed = 0.0
+
+    def run(self, func, targets, deadlineSeconds=None):
+        """
+        Calls func with each target and waits for them all to complete or for the deadline to pass.
+        :param func: a function that accepts a target.
+        :param targets: the targets.
+        :param deadlineSeconds: overrides the default deadline.
+        :return: a dict of target vs FanOutResult.
+        """
+        deadline = self.deadlineSeconds if deadlineSeconds is None else deadlineSeconds
+        start = time.monotonic()
+
+        def timed(target):
+            try:
+                return FanOutResult(FanOutStatus.OK, value=func(target), elapsed=time.monotonic() - start)
+            except Exception as e:
+                logger.error(self.name + ' call to ' + str(target) + ' failed: ' + str(e))
+                return FanOutResult(FanOutStatus.FAILED, error=e, elapsed=time.monotonic() - start)
+
+        futures = {target: self._executor.submit(timed, target) for target in targets}
+        wait(futures.values(), timeout=deadline)
+        results = {}
+        for target, future in futures.items():
+            if future.done():
+                results[target] = future.result()
+            else:
+                future.cancel()
+                logger.warning(self.name + ' call to ' + str(target) + ' did not complete within ' + str(deadline) + 's')
+                results[target] = FanOutResult(FanOutStatus.TIMEOUT)
+        self._record(results.values())
+        return results
+
+    def _record(self, results):
+        with self._lock:
+            self.fanOuts += 1
+            for result in results:
+                self.calls += 1
+                if result.status is FanOutStatus.FAILED:
+                    self.failures += 1
+                elif result.status is FanOutStatus.TIMEOUT:
+                    self.timeouts += 1
+                if result.elapsed is not None and result.elapsed > self.maxElapsed:
+                    self.maxElapsed = result.elapsed
+
+    def getStats(self):
+        """
+        :return: the no of fan outs and calls made along with the no that failed or timed out and the slowest call.
+        """
+        with self._lock:
+            return {
+                'fanOuts': self.fanOuts,
+                'calls': self.calls,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'maxElapsed': round(self.maxElapsed, 6)
+            }
+
+    def shutdown(self):
+        """
+        Stops the workers once any calls in progress have completed.
+        """
+        self._executor.shutdown(wait=False)
@@ -1,15 +1,25 @@
 import abc
+import collections
 import csv
 import datetime
 import logging
 import os
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from queue import Queue, Empty
+from urllib.parse import urlparse
 
+import numpy as np
 from flask import json
 
-from core.httpclient import RequestsBasedHttpClient
-from core.interface import DATETIME_FORMAT, API_PREFIX
+from core.batch import SampleBatch, BINARY_CONTENT_TYPE
+from core.compression import CompressionStats, DEFLATE, compress
+from core.datafile import DataFileWriter, DATA_FILE_NAME, csvColumns, estimateFs
+from core.httpclient import PooledHttpClient
+from core.ingest import IngestClient
+from core.interface import DATETIME_FORMAT, API_PREFIX, SEQUENCE_HEADER
+from core.spool import DiskSpool
 
 
 class DataHandler:
@@ -31,7 +41,8 @@ class DataHandler:
     def handle(self, data):
         """
         A callback for handling some raw data.
-        :param data a list of dicts containing the sample data
+        :param data a SampleBatch containing the sample data, legacy producers may still supply a list of lists or
+        dicts.
         :return:
         """
         pass
@@ -46,6 +57,14 @@ class DataHandler:
         """
         pass
 
+    def handleSummary(self, summary):
+        """
+        A callback for handling a spectral summary of the measurement, called before stop. Handlers that cannot store
+        a summary ignore it.
+        :param summary: a json friendly dict.
+        """
+        pass
+
 
 class Discarder(DataHandler):
     """
@@ -64,10 +83,21 @@ class Discarder(DataHandler):
 
 class CSVLogger(DataHandler):
     """
-    A handler which logs the received data to CSV into target/measurementId/loggerName/data.out
+    A handler which logs the received data to CSV into target/measurementId/loggerName/data.out. A SampleBatch is
+    formatted in a single operation and written with a single write through a large buffer, values are written in full
+    (as the csv module would) unless a precision is set.
     """
 
-    def __init__(self, owner, name, target):
+    def __init__(self, owner, name, target, precision=None, bufferBytes=1024 * 1024, flushInterval=None, fsync=False,
+                 clock=time.monotonic):
+        """
+        :param precision: the no of significant digits to write, None writes each value in full.
+        :param bufferBytes: the size of the write buffer.
+        :param flushInterval: how often (in seconds) to flush the buffer to the file, 0 flushes after every batch and
+        None only flushes when the buffer is full or the measurement stops.
+        :param fsync: if true, each flush is followed by an fsync so the data is on disk rather than in the page cache.
+        :param clock: the clock used to time flushes.
+        """
         self.logger = logging.getLogger(owner + '.csvlogger')
         self.name = name
         self.target = target
@@ -75,20 +105,35 @@ class CSVLogger(DataHandler):
         self._csv = None
         self._csvfile = None
         self._first = True
+        self._targetDir = None
+        self.valueFormat = '%r' if precision is None else '%.' + str(int(precision)) + 'g'
+        self.bufferBytes = bufferBytes
+        self.flushInterval = flushInterval
+        self.fsync = fsync
+        self._clock = clock
+        self._lastFlush = None
+        self._rowFormats = {}
+        self._statsLock = threading.Lock()
+        self._bytesWritten = 0
+        self._rowsWritten = 0
+        self._writeSeconds = 0.0
+        self._flushes = 0
 
     def start(self, measurementId):
         targetDir = os.path.join(self.target, measurementId, self.name)
         if not os.path.exists(targetDir):
             os.makedirs(targetDir, exist_ok=True)
+        self._targetDir = targetDir
         targetPath = os.path.join(targetDir, 'data.out')
         if os.path.exists(targetPath):
             mode = 'w'
         else:
             mode = 'x'
-        self._csvfile = open(targetPath, mode=mode, newline='')
+        self._csvfile = open(targetPath, mode=mode, newline='', buffering=self.bufferBytes)
         self._csv = csv.writer(self._csvfile)
         self.started = True
         self._first = True
+        self._lastFlush = self._clock()
 
     def handle(self, data):
         """
@@ -97,31 +142,185 @@ class CSVLogger(DataHandler):
         :return:
         """
         self.logger.debug("Handling " + str(len(data)) + " data items")
-        for datum in data:
-            if isinstance(datum, dict):
-                # these have to wrapped in a list for python 3.4 due to a change in the implementation
-                # of OrderedDict in python 3.5+ (which means .keys() and .values() are sequences in 3.5+)
-                if self._first:
-                    self._csv.writerow(list(datum.keys()))
-                    self._first = False
-                self._csv.writerow(list(datum.values()))
-            elif isinstance(datum, list):
-                self._csv.writerow(datum)
-            else:
-                self.logger.warning("Ignoring unsupported data type " + str(type(datum)) + " : " + str(datum))
+        start = time.perf_counter()
+        if isinstance(data, SampleBatch):
+            text = self._format(data.samples)
+            self._csvfile.write(text)
+            written = len(text)
+        else:
+            written = 0
+            for datum in data:
+                if isinstance(datum, dict):
+                    # these have to wrapped in a list for python 3.4 due to a change in the implementation
+                    # of OrderedDict in python 3.5+ (which means .keys() and .values() are sequences in 3.5+)
+                    if self._first:
+                        self._csv.writerow(list(datum.keys()))
+                        self._first = False
+                    written += self._csv.writerow(list(datum.values()))
+                elif isinstance(datum, list):
+                    written += self._csv.writerow(datum)
+                else:
+                    self.logger.warning("Ignoring unsupported data type " + str(type(datum)) + " : " + str(datum))
+        if self.flushInterval is not None and self._clock() - self._lastFlush >= self.flushInterval:
+            self._flush()
+        with self._statsLock:
+            self._bytesWritten += written
+            self._rowsWritten += len(data)
+            self._writeSeconds += time.perf_counter() - start
+
+    def _format(self, samples):
+        """
+        Formats the samples as csv, i.e. one %-format of the whole batch rather than a write per row.
+        :param samples: the (samples, columns) ndarray.
+        :return: the text.
+        """
+        rows, columns = samples.shape
+        rowFormat = self._rowFormats.get(columns)
+        if rowFormat is None:
+            # matches the line terminator used by the csv module
+            rowFormat = ','.join([self.valueFormat] * columns) + '\r\n'
+            self._rowFormats[columns] = rowFormat
+        return (rowFormat * rows) % tuple(samples.ravel().tolist())
+
+    def _flush(self):
+        self._csvfile.flush()
+        if self.fsync:
+            os.fsync(self._csvfile.fileno())
+        self._lastFlush = self._clock()
+        with self._statsLock:
+            self._flushes += 1
+
+    def getStats(self):
+        """
+        :return: the no of rows and bytes written, the time spent writing them (and so the write rate in MB/s) and the
+        no of explicit flushes.
+        """
+        with self._statsLock:
+            return {
+                'rows': self._rowsWritten,
+                'bytes': self._bytesWritten,
+                'seconds': round(self._writeSeconds, 6),
+                'mbPerSecond': round(self._bytesWritten / 1e6 / self._writeSeconds, 3) if self._writeSeconds > 0
+                else None,
+                'flushes': self._flushes
+            }
+
+    def handleSummary(self, summary):
+        """
+        Writes the summary to spectrum.json alongside the data.
+        :param summary: the summary.
+        """
+        with open(os.path.join(self._targetDir, 'spectrum.json'), 'w') as f:
+            json.dump(summary, f)
 
     def stop(self, measurementId, failureReason=None):
         if self._csvfile is not None:
             self.logger.debug("Closing csvfile for " + measurementId)
+            if self.fsync:
+                self._flush()
             self._csvfile.close()
 
 
+class BinaryLogger(DataHandler):
+    """
+    A handler which writes the received data to a data file (see core.datafile) in
+    target/measurementId/loggerName/data.bin, this is several times smaller than the csv written by CSVLogger and can
+    be loaded without parsing it. Data sent as a list of samples (i.e. by an older recorder using the json wire format)
+    is assumed to be laid out as in a data.out, the sample rate is worked out from the time column.
+    """
+
+    def __init__(self, owner, name, target, encoding='float32'):
+        """
+        :param encoding: float32 or int16, int16 stores the raw sensor counts and is only used if the data has scales.
+        """
+        self.logger = logging.getLogger(owner + '.binarylogger')
+        self.name = name
+        self.target = target
+        self.encoding = encoding
+        self._writer = None
+        self._targetDir = None
+        self._pendingRows = []
+
+    def start(self, measurementId):
+        self._targetDir = os.path.join(self.target, measurementId, self.name)
+        os.makedirs(self._targetDir, exist_ok=True)
+        self._writer = None
+        self._pendingRows = []
+
+    def handle(self, data):
+        """
+        Appends the samples to the data file, the file is created when the first batch arrives as it describes the
+        columns, fs and scales of the data.
+        :param data: the samples.
+        :return:
+        """
+        if not isinstance(data, SampleBatch):
+            data = self._toBatch(data)
+            if data is None:
+                return
+        if self._writer is None:
+            self._writer = DataFileWriter(os.path.join(self._targetDir, DATA_FILE_NAME), data.columns, data.fs,
+                                          scales=data.scales, encoding=self.encoding, startIdx=data.startIdx)
+        self._writer.append(data.samples)
+
+    def _toBatch(self, rows, force=False):
+        """
+        Converts a list of samples into a batch, samples are held until there are enough to work out the sample rate.
+        :param rows: the samples.
+        :param force: if true, convert whatever samples are held.
+        :return: the batch or None if the samples are held.
+        """
+        if len(rows) > 0:
+            self._pendingRows.append(np.array(rows, dtype=np.float64, ndmin=2))
+        if len(self._pendingRows) == 0:
+            return None
+        samples = np.concatenate(self._pendingRows) if len(self._pendingRows) > 1 else self._pendingRows[0]
+        if self._writer is not None:
+            fs = self._writer.fs
+        elif samples.shape[0] > 1 or force:
+            fs = estimateFs(samples[:, 0])
+        else:
+            return None
+        self._pendingRows = []
+        return SampleBatch(samples, csvColumns(samples.shape[1]), fs, startIdx=int(round(samples[0, 0] * fs)))
+
+    def handleSummary(self, summary):
+        """
+        Writes the summary to spectrum.json alongside the data.
+        :param summary: the summary.
+        """
+        with open(os.path.join(self._targetDir, 'spectrum.json'), 'w') as f:
+            json.dump(summary, f)
+
+    def stop(self, measurementId, failureReason=None):
+        if len(self._pendingRows) > 0:
+            self.handle(self._toBatch([], force=True))
+        if self._writer is not None:
+            self.logger.debug("Closing data file for " + measurementId)
+            self._writer.close()
+            self._writer = None
+
+
 class AsyncHandler(DataHandler):
     """
-    A handler which hands the data off to another thread.
+    A handler which hands the data off to another thread. If the delegate cannot keep up then the queue backs up, once
+    it holds coalesceThreshold items the worker drains any contiguous batches already waiting and merges them into a
+    single call to the delegate so that the per call overhead (e.g. a http request) is paid once for the lot. If a
+    spool is configured then the in memory queue is bounded at maxQueueDepth, anything beyond that is written to disk
+    and fed back into the queue (in order) as the delegate catches up.
     """
 
-    def __init__(self, owner, delegate):
+    def __init__(self, owner, delegate, coalesceThreshold=4, maxCoalescedSamples=5000, maxCoalescedSeconds=5.0,
+                 spoolDir=None, spoolName=None, maxQueueDepth=100):
+        """
+        :param coalesceThreshold: the queue depth at which queued batches are merged, None disables merging.
+        :param maxCoalescedSamples: the maximum no of samples in a merged batch.
+        :param maxCoalescedSeconds: the maximum duration (in seconds) of data held in a merged batch, i.e. measured by
+        the sample rate rather than the wall clock.
+        :param spoolDir: if set, items that would take the queue beyond maxQueueDepth are spooled in this directory.
+        :param spoolName: the name of the spool, defaults to the name of the delegate.
+        :param maxQueueDepth: the maximum no of items held in memory when spooling.
+        """
         self.logger = logging.getLogger(owner + '.asynchandler')
         self.name = "Async"
         self.delegate = delegate
@@ -129,8 +328,21 @@ class AsyncHandler(DataHandler):
         self.worker = None
         self.working = False
         self.stopping = False
+        self.coalesceThreshold = coalesceThreshold
+        self.maxCoalescedSamples = maxCoalescedSamples
+        self.maxCoalescedSeconds = maxCoalescedSeconds
+        self._pending = collections.deque()
+        self._statsLock = threading.Lock()
+        self._itemsHandled = 0
+        self._delegateCalls = 0
+        self._coalescedCalls = 0
+        self.maxQueueDepth = maxQueueDepth
+        self.spool = None if spoolDir is None else DiskSpool(spoolDir, spoolName or delegate.name + '.queue')
+        self._spoolLock = threading.Lock()
 
     def start(self, measurementId):
+        if self.spool is not None:
+            self.spool.open(measurementId)
         self.delegate.start(measurementId)
         self.worker = threading.Thread(target=self.asyncHandle, daemon=True)
         self.working = True
@@ -138,34 +350,140 @@ class AsyncHandler(DataHandler):
         self.worker.start()
 
     def handle(self, data):
-        self.queue.put(data)
+        if self.spool is None:
+            self.queue.put(data)
+        else:
+            with self._spoolLock:
+                # once anything is spooled, everything is spooled until the spool empties so that order is preserved
+                if len(self.spool) > 0 or self.queue.qsize() >= self.maxQueueDepth:
+                    self.spool.append(data)
+                else:
+                    self.queue.put(data)
+
+    def _refill(self):
+        """
+        Moves spooled items back into the queue once the queue has drained to half of maxQueueDepth.
+        """
+        if self.spool is None or len(self.spool) == 0 or self.queue.qsize() > self.maxQueueDepth // 2:
+            return
+        with self._spoolLock:
+            while len(self.spool) > 0 and self.queue.qsize() < self.maxQueueDepth:
+                self.queue.put(self.spool.pop())
+
+    def getQueueDepth(self):
+        """
+        :return: the number of items waiting to be passed to the delegate.
+        """
+        return self.queue.qsize()
+
+    def getSpoolStats(self):
+        """
+        :return: the spool stats or None if there is no spool.
+        """
+        return self.spool.getStats() if self.spool is not None else None
+
+    def getCoalescingStats(self):
+        """
+        :return: the no of items handled, the no of calls made to the delegate, how many of those calls carried merged
+        batches and the coalescing ratio (items per delegate call).
+        """
+        with self._statsLock:
+            return {
+                'items': self._itemsHandled,
+                'delegateCalls': self._delegateCalls,
+                'coalescedCalls': self._coalescedCalls,
+                'ratio': round(self._itemsHandled / self._delegateCalls, 3) if self._delegateCalls > 0 else None
+            }
+
+    def handleSummary(self, summary):
+        """
+        Passes the summary to the delegate once all queued data has been handled.
+        :param summary: the summary.
+        """
+        self.queue.join()
+        self.delegate.handleSummary(summary)
 
     def stop(self, measurementId, failureReason=None):
         # TODO do we need to link this stop to the status of the accelerometer
         self.logger.info('Stopping async handler for ' + measurementId)
         self.stopping = True
         self.queue.join()
+        if self.spool is not None:
+            self.spool.close()
         self.delegate.stop(measurementId, failureReason=failureReason)
         self.logger.info('Stopped async handler for ' + measurementId)
         self.working = False
 
+    def _nextEvent(self):
+        """
+        :return: the item held back from the last merge, if any, otherwise the next item on the queue.
+        """
+        if len(self._pending) > 0:
+            return self._pending.popleft()
+        return self.queue.get(timeout=1)
+
+    def _coalesce(self, first):
+        """
+        Drains contiguous batches that are already on the queue and merges them with the first batch. The worker never
+        waits for more data to arrive so merging adds no latency of its own. An item that cannot be merged is held back
+        and handled next.
+        :param first: the batch taken from the queue.
+        :return: the batch to pass to the delegate and the no of queue items it represents.
+        """
+        if self.coalesceThreshold is None or not isinstance(first, SampleBatch) \
+                or self.queue.qsize() + 1 < self.coalesceThreshold:
+            return first, 1
+        maxSamples = self.maxCoalescedSamples
+        if self.maxCoalescedSeconds is not None and first.fs:
+            maxSamples = min(maxSamples, int(self.maxCoalescedSeconds * first.fs))
+        batches = [first]
+        sampleCount = len(first)
+        while sampleCount < maxSamples:
+            try:
+                following = self.queue.get_nowait()
+            except Empty:
+                break
+            if following is not None and batches[-1].isFollowedBy(following) \
+                    and sampleCount + len(following) <= maxSamples:
+                batches.append(following)
+                sampleCount += len(following)
+            else:
+                # held back as is, even if it is None, so it is still marked as done
+                self._pending.append(following)
+                break
+        return SampleBatch.concat(batches), len(batches)
+
     def asyncHandle(self):
         remaining = -1
         while self.working:
             try:
-                event = self.queue.get(timeout=1)
+                event = self._nextEvent()
                 if event is not None:
-                    self.delegate.handle(event)
-                    self.queue.task_done()
+                    event, items = self._coalesce(event)
+                    try:
+                        self.delegate.handle(event)
+                    finally:
+                        # refill before marking the items done so the queue is never seen as empty while items are
+                        # still spooled
+                        self._refill()
+                        for i in range(items):
+                            self.queue.task_done()
+                        with self._statsLock:
+                            self._itemsHandled += items
+                            self._delegateCalls += 1
+                            if items > 1:
+                                self._coalescedCalls += 1
                     if self.logger.isEnabledFor(logging.DEBUG):
                         self.logger.debug('async queue has ' + str(self.queue.qsize()) + ' items')
                     elif self.stopping:
                         if remaining == -1:
                             remaining = self.queue.qsize()
                         self.logger.info('Closing down asynchandler, ' + str(remaining) + ' items remaining')
-                        remaining -= 1
+                        remaining -= items
+                else:
+                    self.queue.task_done()
             except Empty:
-                pass
+                self._refill()
 
 
 class HttpPoster(DataHandler):
@@ -173,17 +491,74 @@ class HttpPoster(DataHandler):
     A handler which sends the data over http.
     """
 
-    def __init__(self, name, target, httpclient=RequestsBasedHttpClient()):
+    def __init__(self, name, target, httpclient=None, wireFormat='json', encoding='float32',
+                 spoolDir=None, retryInterval=1.0, drainTimeout=30.0, clock=time.time, sleeper=time.sleep,
+                 compressionLevel=None, streamPort=None, window=1, maxUnacknowledged=1000):
+        """
+        :param httpclient: the client used to talk to the target, a PooledHttpClient is created if not set. The copies
+        made of the poster for each device share the client and hence its connection pool.
+        :param wireFormat: json or binary, if binary then batches are sent in the binary wire format unless the target
+        rejects it (i.e. responds with a 415 or rejects the first binary batch sent) in which case json is used instead.
+        :param encoding: the encoding of values in the binary wire format, float32 or int16.
+        :param compressionLevel: if set, binary payloads are delta encoded and compressed with zlib at this level unless
+        the target rejects them (in the same way) in which case they are sent uncompressed.
+        :param spoolDir: if set, data that cannot be sent because the target is unreachable is written to a spool in
+        this directory and resent, in order, once the target is reachable again. If the target cannot be told that the
+        measurement is starting then that is retried, before any spooled data is resent, in the same way.
+        :param retryInterval: how often to retry the target while data is spooled.
+        :param drainTimeout: how long to keep trying to send spooled data when the measurement stops.
+        :param streamPort: if set, binary payloads are streamed to this port on the target over a single connection per
+        measurement rather than sent as a request per batch. Data is sent over http if the stream cannot be opened or
+        fails, batches sent over the stream are held until the target acknowledges them so any that it had not handled
+        when the stream failed are resent over http (or spooled).
+        :param maxUnacknowledged: the most batches held waiting for an acknowledgement, the stream is treated as failed
+        if the target falls further behind than this.
+        :param window: the maximum no of requests that can be in flight at once, if more than 1 then a batch can be
+        sent before the response to the previous one is received. The target puts the batches back in order.
+        """
         self.name = name
+        self.wireFormat = wireFormat
+        self.encoding = encoding
         self.logger = logging.getLogger(name + '.httpposter')
-        self.httpclient = httpclient
+        self.httpclient = PooledHttpClient() if httpclient is None else httpclient
         self.target = target[:-1] if target.endswith('/') else target
         self.deviceName = None
         self.rootURL = self.target + API_PREFIX + '/measurements/'
         self.sendURL = None
+        self.measurementId = None
         self.startResponseCode = None
+        self._startPending = False
         self.dataResponseCode = []
+        self.summaryResponseCode = None
         self.endResponseCode = None
+        self.spoolDir = spoolDir
+        self.spool = None
+        self.retryInterval = retryInterval
+        self.drainTimeout = drainTimeout
+        self._clock = clock
+        self._sleeper = sleeper
+        self._lastAttempt = 0
+        self.compressionLevel = compressionLevel
+        self.compressionStats = None
+        self.streamPort = streamPort
+        self._stream = None
+        self._unacknowledged = None
+        self.maxUnacknowledged = maxUnacknowledged
+        self.window = window
+        self._executor = None
+        self._inFlight = None
+        self._sequence = 0
+        # set once the target has accepted a binary (or compressed) batch, after which a 400 means the batch was bad
+        # rather than that the target does not understand the format
+        self._binaryAccepted = False
+        self._compressedAccepted = False
+        self._formatLock = None
+
+    def getCompressionStats(self):
+        """
+        :return: the compression stats for the current (or last) measurement or None if compression is off.
+        """
+        return self.compressionStats.toDict() if self.compressionStats is not None else None
 
     def start(self, measurementId):
         """
@@ -191,7 +566,57 @@ class HttpPoster(DataHandler):
         :param measurementId:
         """
         self.sendURL = self.rootURL + measurementId + '/' + self.deviceName
+        self.measurementId = measurementId
+        self._sequence = 0
+        # created here rather than in init as the poster is copied for each device, this also drops anything left over
+        # from the last measurement
+        self._unacknowledged = collections.deque()
+        self._inFlight = collections.deque()
+        self.dataResponseCode = []
+        self._formatLock = threading.Lock()
+        if self.window > 1:
+            # created here rather than in init as the poster is copied for each device
+            self._executor = ThreadPoolExecutor(max_workers=self.window)
+        if self.compressionLevel is not None:
+            self.compressionStats = CompressionStats()
+        if self.spoolDir is not None:
+            # created here rather than in init as the poster is copied for each device
+            self.spool = DiskSpool(self.spoolDir, self.deviceName + '.retry')
+            self.spool.open(measurementId)
+        self._sendStart()
+
+    def _sendStart(self):
+        """
+        tells the target the measurement is starting, if the target is unreachable and a spool is configured then all
+        data is spooled until this succeeds.
+        :return: true if the target has been told.
+        """
         self.startResponseCode = self._doPut(self.sendURL)
+        self._startPending = self.spool is not None and self.startResponseCode >= 500
+        if self._startPending:
+            self.logger.warning("Target returned " + str(self.startResponseCode) + " to start " + self.measurementId +
+                                ", spooling data until it is available")
+            self._lastAttempt = self._clock()
+            return False
+        if self.streamPort is not None and self.wireFormat == 'binary' and self.startResponseCode == 200:
+            self._openStream(self.measurementId)
+        return True
+
+    def _openStream(self, measurementId):
+        """
+        opens the streaming ingest channel for this measurement.
+        :param measurementId: the measurement.
+        """
+        stream = IngestClient(urlparse(self.target).hostname, self.streamPort)
+        try:
+            stream.open(measurementId, self.deviceName,
+                        contentEncoding=DEFLATE if self.compressionLevel is not None else None)
+            self._stream = stream
+            self.logger.info("Streaming data for " + measurementId + " to port " + str(self.streamPort))
+        except (IOError, ValueError) as e:
+            self.logger.warning("Unable to open stream to port " + str(self.streamPort) + ", sending data over http: " +
+                                str(e))
+            stream.abort()
 
     def _doPut(self, url, data=None):
         formattedPayload = None if data is None else json.dumps(data, sort_keys=True)
@@ -201,13 +626,193 @@ class HttpPoster(DataHandler):
             self.logger.exception(e)
             return 500
 
+    def _doPutBinary(self, url, body, contentEncoding=None, sequence=None):
+        headers = {'Content-Type': BINARY_CONTENT_TYPE}
+        if contentEncoding is not None:
+            headers['Content-Encoding'] = contentEncoding
+        if sequence is not None:
+            headers[SEQUENCE_HEADER] = str(sequence)
+        try:
+            return self.httpclient.put(url, data=body, headers=headers).status_code
+        except Exception as e:
+            self.logger.exception(e)
+            return 500
+
     def handle(self, data):
         """
-        puts the data in the target.
+        puts the data in the target, if the target is unreachable then the data is spooled (if a spool is configured)
+        and resent later. Once anything is spooled, new data joins the back of the spool so the target receives the data
+        in order.
         :param data: the data to post.
         :return:
         """
-        self.dataResponseCode.append(self._doPut(self.sendURL + '/data', data=data))
+        sequence = self._sequence
+        self._sequence += 1
+        if self.spool is not None and (self._startPending or len(self.spool) > 0):
+            self.spool.append(data, sequence=sequence)
+            self._replay()
+            return
+        if self._executor is not None and self._stream is None:
+            # wait for the oldest request to complete if the window is full
+            while len(self._inFlight) >= self.window:
+                self._onSent(*self._waitFor(self._inFlight.popleft()))
+            self._inFlight.append((data, sequence, self._executor.submit(self._send, data, sequence)))
+        else:
+            self._onSent(data, sequence, self._send(data, sequence))
+
+    @staticmethod
+    def _waitFor(inFlight):
+        data, sequence, future = inFlight
+        return data, sequence, future.result()
+
+    def _onSent(self, data, sequence, code):
+        """
+        records the outcome of sending the data, spooling it if the target was unavailable.
+        :param data: the data.
+        :param sequence: the sequence number of the data.
+        :param code: the response code.
+        """
+        self.dataResponseCode.append(code)
+        if self.spool is not None and code >= 500:
+            self.logger.warning("Target returned " + str(code) + ", spooling data until it is available")
+            self.spool.append(data, sequence=sequence)
+            self._lastAttempt = self._clock()
+
+    def _awaitInFlight(self):
+        """
+        waits for every in flight request to complete.
+        """
+        while len(self._inFlight) > 0:
+            self._onSent(*self._waitFor(self._inFlight.popleft()))
+
+    def _send(self, data, sequence=None):
+        """
+        sends the data in the configured wire format.
+        :param data: the data.
+        :param sequence: the sequence number of the data.
+        :return: the response code.
+        """
+        if self._stream is not None and isinstance(data, SampleBatch):
+            body = data.toBinary(encoding=self.encoding, delta=self.compressionLevel is not None)
+            if self.compressionLevel is not None:
+                body = compress(body, self.compressionLevel, stats=self.compressionStats)
+            try:
+                self._stream.send(body)
+                self._unacknowledged.append((data, sequence))
+                self._trimAcknowledged()
+                if len(self._unacknowledged) > self.maxUnacknowledged:
+                    raise IOError(str(len(self._unacknowledged)) + " batches have not been acknowledged")
+                return 200
+            except IOError as e:
+                self.logger.warning("Stream failed, sending data over http: " + str(e))
+                self._stream.abort()
+                self._stream = None
+                if len(self._unacknowledged) > 0 and self._unacknowledged[-1][0] is data:
+                    # the data was sent so it is resent along with everything else that was not acknowledged
+                    self._unacknowledged.pop()
+                self._resendUnacknowledged()
+        return self._sendOverHttp(data, sequence)
+
+    def _trimAcknowledged(self):
+        """
+        drops the batches the target has acknowledged, batches are sent over the stream in order so these are always at
+        the front.
+        """
+        while len(self._unacknowledged) > 0 and self._unacknowledged[0][0].endIdx <= self._stream.acknowledged:
+            self._unacknowledged.popleft()
+
+    def _resendUnacknowledged(self):
+        """
+        resends, over http, the batches sent over the stream that the target has not acknowledged. The target ignores
+        any it did handle.
+        """
+        unacknowledged = self._unacknowledged
+        self._unacknowledged = collections.deque()
+        if len(unacknowledged) > 0:
+            self.logger.warning("Resending " + str(len(unacknowledged)) + " unacknowledged batches over http")
+        for batch, sequence in unacknowledged:
+            self._onSent(batch, sequence, self._sendOverHttp(batch, sequence))
+
+    def _sendOverHttp(self, data, sequence=None):
+        """
+        sends the data in a http request. This can run on several executor threads at once so the wire format and
+        compression level are read, and any fallback applied, while holding the format lock but the request is sent
+        without it.
+        :param data: the data.
+        :param sequence: the sequence number of the data.
+        :return: the response code.
+        """
+        with self._formatLock:
+            wireFormat, compressionLevel = self.wireFormat, self.compressionLevel
+        if wireFormat == 'binary' and isinstance(data, SampleBatch):
+            if compressionLevel is not None:
+                body = compress(data.toBinary(encoding=self.encoding, delta=True), compressionLevel,
+                                stats=self.compressionStats)
+                code = self._doPutBinary(self.sendURL + '/data', body, contentEncoding=DEFLATE, sequence=sequence)
+                with self._formatLock:
+                    if not self._isUnsupported(code, self._compressedAccepted):
+                        self._compressedAccepted = self._compressedAccepted or code < 300
+                        return code
+                    if self.compressionLevel is not None:
+                        self.logger.warning("Target rejected compressed data with " + str(code) +
+                                            ", sending it uncompressed")
+                        self.compressionLevel = None
+            code = self._doPutBinary(self.sendURL + '/data', data.toBinary(encoding=self.encoding), sequence=sequence)
+            with self._formatLock:
+                if not self._isUnsupported(code, self._binaryAccepted):
+                    self._binaryAccepted = self._binaryAccepted or code < 300
+                    return code
+                if self.wireFormat == 'binary':
+                    # an analyser that does not understand the binary format rejects it so fall back to json from now on
+                    self.logger.warning("Target rejected binary data with " + str(code) + ", falling back to json")
+                    self.wireFormat = 'json'
+        payload = data.toDict() if isinstance(data, SampleBatch) else data
+        return self._doPut(self.sendURL + '/data', data=payload)
+
+    @staticmethod
+    def _isUnsupported(code, accepted):
+        """
+        :param code: the response code.
+        :param accepted: true if the target has already accepted data in this format.
+        :return: true if the response means the target does not understand the format. An analyser that predates the
+        format responds with a 400 so that is only taken to mean the format is unsupported if nothing has been accepted
+        yet, a 400 after that just means that one payload was bad.
+        """
+        return code == 415 or (code == 400 and not accepted)
+
+    def _replay(self, force=False):
+        """
+        resends the spooled data, oldest first, until the spool is empty or the target fails again. If the target has
+        not yet been told that the measurement is starting then that is sent first. An attempt is made at most once every
+        retryInterval unless forced.
+        :param force: if true, ignore the retryInterval.
+        :return: true if the spool is empty.
+        """
+        now = self._clock()
+        if not force and now - self._lastAttempt < self.retryInterval:
+            return False
+        self._lastAttempt = now
+        if self._startPending and not self._sendStart():
+            return False
+        replayed = 0
+        while len(self.spool) > 0:
+            code = self._send(*self.spool.peek(withSequence=True))
+            self.dataResponseCode.append(code)
+            if code >= 500:
+                if replayed > 0:
+                    self.logger.warning("Resent " + str(replayed) + " spooled items before the target failed again")
+                return False
+            self.spool.pop()
+            replayed += 1
+        self.logger.info("Resent " + str(replayed) + " spooled items, spool is empty")
+        return True
+
+    def handleSummary(self, summary):
+        """
+        puts the spectral summary in the target.
+        :param summary: the summary.
+        """
+        self.summaryResponseCode = self._doPut(self.sendURL + '/spectrum', data=summary)
 
     def stop(self, measurementId, failureReason=None):
         """
@@ -215,9 +820,44 @@ class HttpPoster(DataHandler):
         :param measurementId: the measurement that has completed.
         :return:
         """
+        if self._executor is not None:
+            self._awaitInFlight()
+            self._executor.shutdown()
+            self._executor = None
+        if self._stream is not None:
+            self._closeStream()
+        if self.spool is not None:
+            self._drain()
+            if self._startPending:
+                self.logger.error("Target was never told that " + measurementId + " started")
         if failureReason is None:
             self.endResponseCode = self._doPut(self.sendURL + "/complete")
         else:
             self.endResponseCode = self._doPut(self.sendURL + "/failed", data={'failureReason': failureReason})
         self.sendURL = None
         # TODO verify that the response codes are all ok
+
+    def _closeStream(self):
+        """
+        ends the stream, this waits for the target to handle everything sent so the measurement is only completed once
+        the target has all the data. Anything the target did not acknowledge is resent over http.
+        """
+        try:
+            reply = self._stream.close()
+            if not reply.get('ok'):
+                self.logger.error("Target reported a failed stream: " + str(reply.get('error')))
+        except (IOError, ValueError) as e:
+            self.logger.error("Unable to close stream cleanly: " + str(e))
+        self._trimAcknowledged()
+        self._stream = None
+        self._resendUnacknowledged()
+
+    def _drain(self):
+        """
+        keeps trying to send the spooled data for up to drainTimeout, the spool is left on disk if it cannot be sent.
+        """
+        deadline = self._clock() + self.drainTimeout
+        while not self._replay(force=True) and self._clock() < deadline:
+            self._sleeper(self.retryInterval)
+        self.spool.close()
+        self.spool = None
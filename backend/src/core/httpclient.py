@@ -1,6 +1,25 @@
 import abc
+import logging
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+logger = logging.getLogger('core.httpclient')
+
+# (connect, read) timeouts in seconds by method
+DEFAULT_TIMEOUTS = {
+    'get': (0.5, 2.0),
+    'put': (0.5, 5.0),
+    'patch': (0.5, 5.0),
+    'post': (0.5, 5.0),
+    'delete': (0.5, 5.0)
+}
+IDEMPOTENT_METHODS = {'get', 'put', 'delete'}
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
 
 class RequestException(Exception):
     """
@@ -101,6 +120,150 @@ class RequestsBasedHttpClient(HttpClient):
             raise RequestException("Unable to DELETE " + url) from e
 
 
+class PooledHttpClient(HttpClient):
+    """
+    An implementation of HttpClient which sends every request through a single requests session so connections to
+    each host are pooled and kept alive rather than opened for each request. Idempotent requests (GET, PUT, DELETE)
+    that fail to connect are retried with a bounded exponential backoff. A GET is also retried on a read timeout or a
+    502/503/504 whereas a PUT is not as it may have reached the server already and not every PUT is safe to repeat
+    (e.g. data PUTs append to the measurement).
+    :var requestCount: the number of requests sent, including retries.
+    :var retryCount: the number of retries.
+    :var failureCount: the number of requests which failed after all retries.
+    """
+
+    def __init__(self, timeouts=None, maxRetries=2, backoffSeconds=0.1, maxBackoffSeconds=1.0, poolConnections=10,
+                 poolMaxSize=10, sleeper=time.sleep):
+        """
+        :param timeouts: a dict of method -> (connect, read) timeouts which override the defaults.
+        :param maxRetries: the max no of times an idempotent request is retried.
+        :param backoffSeconds: the delay before the first retry, doubled on each subsequent retry.
+        :param maxBackoffSeconds: the longest delay between retries.
+        :param poolConnections: the number of hosts to keep a pool for.
+        :param poolMaxSize: the number of connections to keep open to each host.
+        """
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts is not None:
+            self.timeouts.update(timeouts)
+        self.maxRetries = maxRetries
+        self.backoffSeconds = backoffSeconds
+        self.maxBackoffSeconds = maxBackoffSeconds
+        self._sleeper = sleeper
+        self._adapter = HTTPAdapter(pool_connections=poolConnections, pool_maxsize=poolMaxSize, max_retries=0)
+        self._session = requests.Session()
+        self._session.mount('http://', self._adapter)
+        self._session.mount('https://', self._adapter)
+        self._lock = threading.Lock()
+        self.requestCount = 0
+        self.retryCount = 0
+        self.failureCount = 0
+
+    def get(self, url, **kwargs):
+        return self._send('get', url, 'Unable to GET from ', **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._send('post', url, 'Unable to POST to ', **kwargs)
+
+    def put(self, url, **kwargs):
+        return self._send('put', url, 'Unable to PUT ', **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self._send('patch', url, 'Unable to PATCH ', **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self._send('delete', url, 'Unable to DELETE ', **kwargs)
+
+    def _send(self, method, url, message, **kwargs):
+        """
+        Sends the request, retrying if appropriate.
+        :param method: the method.
+        :param url: the url.
+        :param message: the message to use if the request fails.
+        :param kwargs: passed to requests, a timeout given here overrides the configured timeout.
+        :return: the response.
+        """
+        kwargs.setdefault('timeout', self.timeouts.get(method))
+        attempt = 0
+        while True:
+            with self._lock:
+                self.requestCount += 1
+            try:
+                resp = self._session.request(method, url, **kwargs)
+                if resp.status_code in RETRYABLE_STATUS_CODES and self._canRetry(method, attempt, False):
+                    logger.warning(method.upper() + " " + url + " returned " + str(resp.status_code) + ", retrying")
+                else:
+                    return resp
+            except requests.exceptions.RequestException as e:
+                if not self._canRetry(method, attempt, self._failedToConnect(e)):
+                    with self._lock:
+                        self.failureCount += 1
+                    raise RequestException(message + url) from e
+                logger.warning(method.upper() + " " + url + " failed with " + type(e).__name__ + ", retrying")
+            with self._lock:
+                self.retryCount += 1
+            self._sleeper(min(self.backoffSeconds * (2 ** attempt), self.maxBackoffSeconds))
+            attempt += 1
+
+    @staticmethod
+    def _failedToConnect(e):
+        """
+        :param e: the exception.
+        :return: true if the request failed to connect, i.e. it timed out or was refused before anything was sent. A
+        connection that is aborted once the request has been sent (e.g. a pooled connection that the server has since
+        closed) does not count as the server may have handled the request.
+        """
+        if isinstance(e, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(e, requests.exceptions.ConnectionError) and len(e.args) > 0:
+            cause = e.args[0]
+            if isinstance(cause, MaxRetryError):
+                cause = cause.reason
+            return isinstance(cause, NewConnectionError)
+        return False
+
+    def _canRetry(self, method, attempt, failedToConnect):
+        """
+        :param method: the method.
+        :param attempt: the no of retries made so far.
+        :param failedToConnect: true if the request cannot have reached the server.
+        :return: true if the request should be retried.
+        """
+        if attempt >= self.maxRetries or method not in IDEMPOTENT_METHODS:
+            return False
+        return failedToConnect or method == 'get'
+
+    def getStats(self):
+        """
+        :return: the request counts along with, for each host, the number of connections opened and requests sent
+        over them so the degree of connection reuse can be seen.
+        """
+        hosts = {}
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                hosts[pool.scheme + '://' + pool.host + ':' + str(pool.port)] = {
+                    'connections': pool.num_connections,
+                    'requests': pool.num_requests
+                }
+        connections = sum(h['connections'] for h in hosts.values())
+        sent = sum(h['requests'] for h in hosts.values())
+        return {
+            'requests': self.requestCount,
+            'retries': self.retryCount,
+            'failures': self.failureCount,
+            'connections': connections,
+            'reuseRatio': round(1 - (connections / sent), 3) if sent > 0 else 0.0,
+            'hosts': hosts
+        }
+
+    def close(self):
+        """
+        Closes all pooled connections.
+        """
+        self._session.close()
+
+
 class RecordingHttpClient(HttpClient):
     """
     An implementation of httpclient intended for use by test cases as it simply records each call in a list.
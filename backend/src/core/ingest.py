@@ -0,0 +1,130 @@
+import json
+import select
+import socket
+import struct
+
+# every frame is the length of the payload followed by the payload, a zero length frame marks the end of the stream
+FRAME_HEADER = struct.Struct('!I')
+
+
+def encodeFrame(payload):
+    """
+    :param payload: the bytes.
+    :return: the payload as a frame.
+    """
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+class IngestClient(object):
+    """
+    The recorder end of a streaming ingest channel, i.e. a long lived connection to the analyser over which the batches
+    of a single measurement are written back to back. The stream opens with a json hello that identifies the
+    measurement and device, the analyser replies with a json status. Each batch is then sent as a frame without waiting
+    for a reply, the analyser periodically acknowledges the highest endIdx it has handled so the sender knows which
+    batches would have to be resent if the stream fails. When the measurement ends, an empty frame is sent and the
+    analyser replies once it has handled everything sent before it.
+    :var acknowledged: the highest endIdx acknowledged by the analyser.
+    """
+
+    def __init__(self, host, port, timeout=5.0):
+        """
+        :param host: the analyser host.
+        :param port: the analyser ingest port.
+        :param timeout: the connect, send and receive timeout.
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._sock = None
+        self._received = b''
+        self.acknowledged = 0
+        self.framesSent = 0
+        self.bytesSent = 0
+
+    def open(self, measurementId, deviceId, contentEncoding=None):
+        """
+        Connects and identifies the stream, raises IOError (or one of its subclasses) if the analyser refuses it.
+        :param measurementId: the measurement.
+        :param deviceId: the device.
+        :param contentEncoding: the encoding of each batch, if any.
+        """
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        hello = {'measurementId': measurementId, 'deviceId': deviceId, 'contentEncoding': contentEncoding}
+        self._sock.sendall(encodeFrame(json.dumps(hello).encode('utf-8')))
+        reply = self._readReply()
+        if not reply.get('ok'):
+            self.abort()
+            raise IOError('Analyser refused stream: ' + str(reply.get('error')))
+
+    def send(self, payload):
+        """
+        Writes the payload to the stream then reads any acknowledgements that have arrived, raises IOError if the
+        stream is broken or the analyser has closed it.
+        :param payload: the bytes.
+        """
+        self._sock.sendall(encodeFrame(payload))
+        self.framesSent += 1
+        self.bytesSent += FRAME_HEADER.size + len(payload)
+        while select.select([self._sock], [], [], 0)[0]:
+            self._receive()
+            while True:
+                reply = self._takeReply()
+                if reply is None:
+                    break
+                if 'ack' not in reply:
+                    raise IOError('Analyser closed stream: ' + str(reply.get('error')))
+
+    def close(self):
+        """
+        Ends the stream and waits for the analyser to confirm it has handled everything.
+        :return: the analyser's reply.
+        """
+        try:
+            self._sock.sendall(FRAME_HEADER.pack(0))
+            return self._readReply()
+        finally:
+            self.abort()
+
+    def abort(self):
+        """
+        Drops the connection.
+        """
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    def _readReply(self):
+        """
+        :return: the next reply that is not just an acknowledgement.
+        """
+        while True:
+            reply = self._takeReply()
+            if reply is None:
+                self._receive()
+            elif 'ok' in reply:
+                return reply
+
+    def _takeReply(self):
+        """
+        :return: the next complete reply received or None if there isn't one yet, the acknowledged endIdx is updated
+        from any reply that carries one.
+        """
+        if len(self._received) < FRAME_HEADER.size:
+            return None
+        end = FRAME_HEADER.size + FRAME_HEADER.unpack_from(self._received)[0]
+        if len(self._received) < end:
+            return None
+        reply = json.loads(self._received[FRAME_HEADER.size:end].decode('utf-8'))
+        self._received = self._received[end:]
+        if reply.get('ack') is not None:
+            self.acknowledged = max(self.acknowledged, reply['ack'])
+        return reply
+
+    def _receive(self):
+        chunk = self._sock.recv(65536)
+        if not chunk:
+            raise ConnectionError('Stream closed by analyser')
+        self._received += chunk
@@ -53,8 +53,13 @@ recordingDeviceFields = {
     'gyroSens': fields.Integer(attribute='gyroSensitivity'),
     # device status fields
     'status': EnumField,
-    'failureCode': fields.String
+    'failureCode': fields.String,
+    # the batch size actually in use, differs from samplesPerBatch when adaptive batching is on
+    'activeSamplesPerBatch': fields.Integer
 }
 
 DATETIME_FORMAT = '%Y%m%d_%H%M%S'
-API_PREFIX = '/api/1'
\ No newline at end of file
+API_PREFIX = '/api/1'
+
+# the header carrying the sequence number of a batch of data
+SEQUENCE_HEADER = 'X-Vibe-Sequence'
@@ -66,3 +66,9 @@ class Reactor(object):
             self._workQueue.put((requestType, list(*args)))
         else:
             logger.error("Ignoring unknown request on reactor " + self._name + " " + requestType)
+
+    def getQueueDepth(self):
+        """
+        :return: the number of requests waiting to be processed.
+        """
+        return self._workQueue.qsize()
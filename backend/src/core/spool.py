@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import struct
+import threading
+
+from core.batch import SampleBatch
+
+logger = logging.getLogger('core.spool')
+
+# the type of record, the sequence number of the item (or NO_SEQUENCE) then the length of the payload that follows
+RECORD_HEADER = struct.Struct('<BqI')
+NO_SEQUENCE = -1
+RECORD_BATCH = 0
+RECORD_JSON = 1
+COMPACT_CHUNK_BYTES = 1024 * 1024
+
+
+class DiskSpool(object):
+    """
+    A disk backed FIFO of data items. Each measurement gets its own append only segment file, items are written
+    through a large buffer (so the SD card sees big sequential writes) and read back in the order they were written.
+    Only the read and write positions are held in memory so the spool can hold far more data than fits in RAM. Batches
+    are stored in the binary wire format (as float64 so nothing is lost), any other item is stored as json. Each item can
+carry the sequence number it was assigned when it was first sent so it is resent with the same sequence number. The
+    segment is truncated whenever the spool empties so it only grows while the consumer is behind. A segment that still
+    holds data when it is closed is left on disk holding only the items that were not consumed, these are not resent
+    automatically (a measurement only accepts data while it is in progress) but can be read with readSegment.
+    """
+
+    def __init__(self, directory, name, bufferBytes=256 * 1024):
+        """
+        :param directory: the root directory of the spool, segments are written to directory/measurementId/name.spool
+        :param name: the name of this spool.
+        :param bufferBytes: the size of the write buffer.
+        """
+        self.directory = directory
+        self.name = name
+        self.bufferBytes = bufferBytes
+        self.path = None
+        self._lock = threading.RLock()
+        self._writer = None
+        self._reader = None
+        self._readOffset = 0
+        self._pending = 0
+        self._next = None
+        self.spooledItems = 0
+        self.replayedItems = 0
+        self.bytesWritten = 0
+
+    def open(self, measurementId):
+        """
+        Creates the segment for the measurement, replacing any existing segment.
+        :param measurementId: the measurement.
+        """
+        with self._lock:
+            self.close()
+            segmentDir = os.path.join(self.directory, measurementId)
+            os.makedirs(segmentDir, exist_ok=True)
+            self.path = os.path.join(segmentDir, self.name + '.spool')
+            self._writer = open(self.path, mode='wb', buffering=self.bufferBytes)
+            self._reader = open(self.path, mode='rb')
+            self._readOffset = 0
+            self._pending = 0
+            self._next = None
+
+    def __len__(self):
+        return self._pending
+
+    def append(self, data, sequence=None):
+        """
+        Adds the item to the end of the spool.
+        :param data: a SampleBatch or any json serialisable item.
+        :param sequence: the sequence number of the item, if any.
+        """
+        if isinstance(data, SampleBatch):
+            kind, payload = RECORD_BATCH, data.toBinary(encoding='float64')
+        else:
+            kind, payload = RECORD_JSON, json.dumps(data).encode('utf-8')
+        with self._lock:
+            if self._writer is None:
+                raise ValueError('Spool ' + self.name + ' is not open')
+            self._writer.write(RECORD_HEADER.pack(kind, NO_SEQUENCE if sequence is None else sequence, len(payload)))
+            self._writer.write(payload)
+            self._pending += 1
+            self.spooledItems += 1
+            self.bytesWritten += RECORD_HEADER.size + len(payload)
+
+    def peek(self, withSequence=False):
+        """
+        :param withSequence: if true, the sequence number of the item is returned as well.
+        :return: the item at the head of the spool without removing it or None if the spool is empty, if withSequence
+        then a tuple of the item and its sequence number (None if it has none).
+        """
+        with self._lock:
+            if self._pending == 0:
+                return (None, None) if withSequence else None
+            if self._next is None:
+                # the writer buffers so make sure everything written so far is visible to the reader
+                self._writer.flush()
+                self._reader.seek(self._readOffset)
+                item, sequence = _readRecord(self._reader.read(RECORD_HEADER.size), self._reader)
+                self._next = (item, sequence, self._reader.tell() - self._readOffset)
+            return self._next[:2] if withSequence else self._next[0]
+
+    def pop(self):
+        """
+        Removes the item at the head of the spool.
+        :return: the item or None if the spool is empty.
+        """
+        with self._lock:
+            item = self.peek()
+            if item is not None:
+                self._readOffset += self._next[2]
+                self._next = None
+                self._pending -= 1
+                self.replayedItems += 1
+                if self._pending == 0:
+                    self._writer.seek(0)
+                    self._writer.truncate()
+                    self._readOffset = 0
+            return item
+
+    def close(self):
+        """
+        Closes the segment, it is deleted if it is empty otherwise it is left on disk.
+        """
+        with self._lock:
+            if self._writer is None:
+                return
+            self._writer.close()
+            self._reader.close()
+            self._writer = None
+            self._reader = None
+            if self._pending > 0 and self._readOffset > 0:
+                self._compact()
+            if self._pending == 0:
+                os.remove(self.path)
+                try:
+                    os.rmdir(os.path.dirname(self.path))
+                except OSError:
+                    pass
+            else:
+                logger.error('Spool ' + self.path + ' closed with ' + str(self._pending) + ' unsent items')
+
+    def _compact(self):
+        """
+        Moves the items that were not consumed to the start of the segment so it only holds those items.
+        """
+        with open(self.path, mode='r+b') as f:
+            src = self._readOffset
+            dst = 0
+            while True:
+                f.seek(src)
+                chunk = f.read(COMPACT_CHUNK_BYTES)
+                if not chunk:
+                    break
+                f.seek(dst)
+                f.write(chunk)
+                src += len(chunk)
+                dst += len(chunk)
+            f.truncate(dst)
+        self._readOffset = 0
+
+    def getStats(self):
+        """
+        :return: the no of items waiting, the no of items spooled and replayed and the bytes written to disk.
+        """
+        return {
+            'pending': self._pending,
+            'spooled': self.spooledItems,
+            'replayed': self.replayedItems,
+            'bytesWritten': self.bytesWritten
+        }
+
+
+def _readRecord(header, f):
+    """
+    Reads the payload of a record.
+    :param header: the record header.
+    :param f: the segment, positioned at the start of the payload.
+    :return: a tuple of the item and its sequence number (None if it has none).
+    """
+    kind, sequence, length = RECORD_HEADER.unpack(header)
+    payload = f.read(length)
+    item = SampleBatch.fromBinary(payload) if kind == RECORD_BATCH else json.loads(payload.decode('utf-8'))
+    return item, None if sequence == NO_SEQUENCE else sequence
+
+
+def readSegment(path, withSequence=False):
+    """
+    Reads the items in a segment left on disk, i.e. data that could not be sent, so it can be recovered by hand.
+    :param path: the segment.
+    :param withSequence: if true, yield a tuple of each item and its sequence number.
+    :return: a generator of the items in the order they were spooled.
+    """
+    with open(path, mode='rb') as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            item, sequence = _readRecord(header, f)
+            yield (item, sequence) if withSequence else item
@@ -6,17 +6,18 @@ from flask import Flask
 from flask_restful import Api
 
 from core.handler import AsyncHandler
-from core.httpclient import RequestsBasedHttpClient
+from core.httpclient import PooledHttpClient
 from core.interface import API_PREFIX
 from core.reactor import Reactor
 from recorder.common.config import Config
 from recorder.common.heartbeater import Heartbeater
+from recorder.common.spectrum import SpectralSummariser
 from recorder.resources.measurements import Measurements, Measurement, AbortMeasurement
-from recorder.resources.recordingdevices import RecordingDevices, RecordingDevice, SelfTest
+from recorder.resources.recordingdevices import RecordingDevices, RecordingDevice, SelfTest, Telemetry
 
 cfg = Config()
 reactor = Reactor()
-httpclient = RequestsBasedHttpClient()
+httpclient = PooledHttpClient()
 heartbeater = Heartbeater(httpclient, cfg)
 inject = {
     'recordingDevices': cfg.recordingDevices,
@@ -41,6 +42,8 @@ api.add_resource(RecordingDevices, API_PREFIX + '/devices', resource_class_kwarg
 api.add_resource(RecordingDevice, API_PREFIX + '/devices/<deviceId>', resource_class_kwargs=inject)
 # GET: triggers a self test and returns the results
 api.add_resource(SelfTest, API_PREFIX + '/devices/<deviceId>/selftest', resource_class_kwargs=inject)
+# GET: the acquisition telemetry for the current or last measurement
+api.add_resource(Telemetry, API_PREFIX + '/devices/<deviceId>/telemetry', resource_class_kwargs=inject)
 # GET: the measurements made by this device in this session
 api.add_resource(Measurements, API_PREFIX + '/devices/<deviceId>/measurements', resource_class_kwargs=inject)
 # GET: the state of this measurement
@@ -75,12 +78,24 @@ def wireHandlers(cfg):
         heartbeater.serverURL = httpPoster.target
         heartbeater.ping()
 
+    summaryCfg = cfg.getSpectralSummary()
     if activeHandler is not None:
         for device in cfg.recordingDevices.values():
             if activeHandler is httpPoster:
                 httpPoster.deviceName = device.name
             copied = copy.copy(activeHandler)
-            device.dataHandler = copied if not cfg.useAsyncHandlers else AsyncHandler('recorder', copied)
+            if summaryCfg is not None:
+                copied = SpectralSummariser(copied, includeRawData=summaryCfg.get('includeRawData', False),
+                                            segmentLength=summaryCfg.get('segmentLength'))
+            if cfg.useAsyncHandlers:
+                handlerArgs = cfg.getAsyncHandlerOptions()
+                spoolCfg = cfg.getSpool()
+                if spoolCfg is not None:
+                    handlerArgs.update({'spoolDir': spoolCfg['dir'], 'spoolName': device.name + '.queue',
+                                        'maxQueueDepth': spoolCfg.get('maxQueueDepth', 100)})
+                device.dataHandler = AsyncHandler('recorder', copied, **handlerArgs)
+            else:
+                device.dataHandler = copied
 
 
 def main(args=None):
@@ -1,10 +1,13 @@
 import abc
 import logging
 import sys
+import threading
 import time
 
 from core.handler import Discarder
 from core.interface import RecordingDeviceStatus
+from .ringbuffer import SampleRingBuffer
+from .telemetry import AcquisitionTelemetry
 
 SAMPLE_TIME = 'time'
 ACCEL_X = 'ac_x'
@@ -25,14 +28,22 @@ class Accelerometer(object):
     """
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, fs=None, samplesPerBatch=None, dataHandler=None):
+    def __init__(self, fs=None, samplesPerBatch=None, dataHandler=None, bufferSeconds=30, batchSizer=None,
+                 scheduler=None):
         """
         Initialises the accelerometer to use a default sample rate of 500Hz, a samplesPerBatch that accommodates 1/4s
         worth of data and a dataHandler function that simply logs data to the screen.
         :param: fs: the sample rate
         :param: samplesPerBatch: the number of samples that each provideData block should yield.
         :param: dataHandler: a function that accepts the data produced by initialiseDevice and does something with it.
+        :param: bufferSeconds: how much data the ring buffer between the reader and the handler can hold.
+        :param: batchSizer: an optional AdaptiveBatchSizer which, if provided, varies the batch size during a
+        measurement according to how quickly the handler deals with the data.
+        :param: scheduler: an optional AcquisitionScheduler which, if provided, reads from the device instead of a
+        dedicated reader thread.
         """
+        self.batchSizer = batchSizer
+        self.scheduler = scheduler
         if fs is None:
             self.fs = 500
         else:
@@ -51,6 +62,33 @@ class Accelerometer(object):
         self.measurementOverflowed = False
         self._sampleIdx = 0
         self.status = RecordingDeviceStatus.NEW
+        self.bufferSeconds = bufferSeconds
+        self.ringBuffer = None
+        self._elapsedTime = 0
+        self.telemetry = AcquisitionTelemetry()
+
+    @property
+    def samplesPerBatch(self):
+        """
+        :return: the configured batch size.
+        """
+        return self._samplesPerBatch
+
+    @samplesPerBatch.setter
+    def samplesPerBatch(self, samplesPerBatch):
+        """
+        Sets the configured batch size, this is also the size used by the next batch if adaptive batching is on.
+        :param samplesPerBatch: the batch size.
+        """
+        self._samplesPerBatch = samplesPerBatch
+        self.activeSamplesPerBatch = samplesPerBatch
+
+    def getFifoStats(self):
+        """
+        Provides information about the state of the device buffer since the last call, used to drive adaptive batching.
+        :return: the peak proportion of the device buffer in use (or None if unknown) and whether it overflowed.
+        """
+        return None, False
 
     def doInit(self):
         try:
@@ -65,8 +103,10 @@ class Accelerometer(object):
 
     def start(self, measurementId, durationInSeconds=None):
         """
-        Initialises the device if required then enters a read loop taking data from the provider and passing it to the
-         handler. It will continue until either breakRead is true or the duration (if provided) has passed.
+        Initialises the device if required then starts a reader thread (or registers with the scheduler) which takes
+        data from the provider and writes it into a ring buffer while this thread passes the buffered data to the
+        handler. The reader never waits for the handler so a slow handler cannot cause the device to overflow. It will
+        continue until either breakRead is true or the duration (if provided) has passed.
         :return:
         """
         logger.info(">> measurement " + measurementId +
@@ -79,22 +119,39 @@ class Accelerometer(object):
         self.doInit()
         # this must follow doInit because doInit sets status to INITIALISED
         self.status = RecordingDeviceStatus.RECORDING
-        elapsedTime = 0
+        self._elapsedTime = 0
+        self._prepareRingBuffer()
+        self.telemetry.startMeasurement(measurementId, self.fs)
+        reader = None
         try:
             self._sampleIdx = 0
+            if self.scheduler is None:
+                reader = threading.Thread(name=measurementId + '-reader', target=self._acquire,
+                                          args=(measurementId, durationInSeconds), daemon=True)
+                reader.start()
+            else:
+                self.scheduler.register(self, measurementId, durationInSeconds)
             while True:
-                logger.debug(measurementId + " provideData ")
-                self.dataHandler.handle(self.provideData())
-                elapsedTime = time.time() - self.startTime
-                if self.breakRead or durationInSeconds is not None and elapsedTime > durationInSeconds:
-                    logger.debug(measurementId + " breaking provideData")
-                    self.startTime = 0
+                batch = self.ringBuffer.read(minSamples=self.activeSamplesPerBatch)
+                if batch is None:
                     break
+                handleStart = time.time()
+                self.dataHandler.handle(batch)
+                handlerLatency = time.time() - handleStart
+                self.telemetry.batchHandled(handlerLatency)
+                if self.batchSizer is not None:
+                    self._adaptBatchSize(len(batch), handlerLatency)
         except:
             self.status = RecordingDeviceStatus.FAILED
             self.failureCode = str(sys.exc_info())
             logger.exception(measurementId + " failed")
+            self.breakRead = True
         finally:
+            if reader is not None:
+                reader.join()
+            elif self.scheduler is not None:
+                self.scheduler.deregister(self)
+            elapsedTime = self._elapsedTime
             expectedSamples = self.fs * (durationInSeconds if durationInSeconds is not None else elapsedTime)
             if self._sampleIdx < expectedSamples:
                 self.status = RecordingDeviceStatus.FAILED
@@ -104,16 +161,100 @@ class Accelerometer(object):
             if self.measurementOverflowed:
                 self.status = RecordingDeviceStatus.FAILED
                 self.failureCode = "Measurement overflow detected"
+            if self.ringBuffer.overruns > 0:
+                self.status = RecordingDeviceStatus.FAILED
+                self.failureCode = "Ring buffer overrun, " + str(self.ringBuffer.droppedSamples) + " samples dropped"
+            logger.info(measurementId + " ring buffer high water mark " + str(self.ringBuffer.highWaterMark) + "/" +
+                        str(self.ringBuffer.capacity) + " samples")
             if self.status == RecordingDeviceStatus.FAILED:
                 logger.error("<< measurement " + measurementId + " - FAILED - " + self.failureCode)
             else:
                 self.status = RecordingDeviceStatus.INITIALISED
                 logger.info("<< measurement " + measurementId + " - " + self.status.name)
+            self.telemetry.endMeasurement(self.status.name, ringBuffer=self.ringBuffer)
             self.dataHandler.stop(measurementId, self.failureCode)
             if self.status == RecordingDeviceStatus.FAILED:
                 logger.warning("Reinitialising device after measurement failure")
                 self.doInit()
 
+    def _adaptBatchSize(self, handledSamples, handlerLatency):
+        """
+        Updates the batch size used by the reader from the latency of the handler and the state of the device buffer.
+        :param handledSamples: the no of samples just handled.
+        :param handlerLatency: how long the handler took.
+        """
+        fifoFill, overflowed = self.getFifoStats()
+        self.activeSamplesPerBatch = self.batchSizer.nextSize(self.activeSamplesPerBatch, self.fs, handledSamples,
+                                                              handlerLatency, fifoFill=fifoFill,
+                                                              overflowed=overflowed)
+
+    def _prepareRingBuffer(self):
+        """
+        Ensures we have an empty ring buffer large enough to hold bufferSeconds of data at the current sample rate.
+        """
+        maxBatch = self.samplesPerBatch if self.batchSizer is None else max(self.batchSizer.getBounds(self.fs)[1],
+                                                                            self.samplesPerBatch)
+        capacity = max(int(self.fs * self.bufferSeconds), int(maxBatch) * 2)
+        if self.ringBuffer is None or self.ringBuffer.capacity != capacity:
+            self.ringBuffer = SampleRingBuffer(capacity)
+        else:
+            self.ringBuffer.reset()
+
+    def _acquire(self, measurementId, durationInSeconds):
+        """
+        The reader loop, reads from the device into the ring buffer until the measurement completes.
+        :param measurementId: the measurement.
+        :param durationInSeconds: how long to run for, runs until break if None.
+        """
+        try:
+            while True:
+                logger.debug(measurementId + " provideData ")
+                if not self.store(self.provideData(), measurementId, durationInSeconds):
+                    break
+        except:
+            self.acquisitionFailed(measurementId)
+        finally:
+            self.ringBuffer.close()
+
+    def store(self, batch, measurementId, durationInSeconds):
+        """
+        Writes a batch read from the device into the ring buffer.
+        :param batch: the batch.
+        :param measurementId: the measurement.
+        :param durationInSeconds: how long the measurement runs for, runs until break if None.
+        :return: true if the measurement should continue.
+        """
+        self.ringBuffer.write(batch)
+        self._elapsedTime = time.time() - self.startTime
+        if self.breakRead or durationInSeconds is not None and self._elapsedTime > durationInSeconds:
+            logger.debug(measurementId + " breaking provideData")
+            self.startTime = 0
+            return False
+        return True
+
+    def acquisitionFailed(self, measurementId):
+        """
+        Records a failure to read from the device.
+        :param measurementId: the measurement.
+        """
+        self.status = RecordingDeviceStatus.FAILED
+        self.failureCode = str(sys.exc_info())
+        logger.exception(measurementId + " failed")
+
+    def drain(self):
+        """
+        Reads whatever data the device has available, used by an AcquisitionScheduler. Devices that can provide data
+        without waiting should override this, the default simply reads a batch.
+        :return: a SampleBatch.
+        """
+        return self.provideData()
+
+    def getDrainInterval(self):
+        """
+        :return: how often, in seconds, drain should be called.
+        """
+        return 0.0
+
     def signalStop(self):
         """
         Signals the accelerometer to stop reading after the next read completes.
@@ -126,8 +267,7 @@ class Accelerometer(object):
     def provideData(self):
         """
         reads the underlying device to provide a batch of raw data.
-        :return: a list of data where each item is a single sample of data converted into real values and stored as a
-        dict.
+        :return: a SampleBatch containing the samples converted into real values.
         """
         pass
 
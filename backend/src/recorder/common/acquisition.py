@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger('recorder.acquisition')
+
+
+class DeviceThroughput(object):
+    """
+    The acquisition stats for a single device.
+    :var drains: the number of times the device was drained.
+    :var samples: the number of samples read.
+    :var busTime: the time spent reading from the device.
+    :var lateDrains: the number of drains that happened later than the device's drain interval required.
+    """
+
+    def __init__(self):
+        self.drains = 0
+        self.samples = 0
+        self.busTime = 0.0
+        self.lateDrains = 0
+        self.startTime = None
+        self.lastDrainTime = None
+
+    def getSamplesPerSecond(self):
+        """
+        :return: the rate at which samples have been read since the device was registered.
+        """
+        if self.startTime is None or self.lastDrainTime is None or self.lastDrainTime <= self.startTime:
+            return 0.0
+        return self.samples / (self.lastDrainTime - self.startTime)
+
+    def toDict(self):
+        return {
+            'drains': self.drains,
+            'samples': self.samples,
+            'busTime': round(self.busTime, 6),
+            'lateDrains': self.lateDrains,
+            'samplesPerSecond': round(self.getSamplesPerSecond(), 3)
+        }
+
+
+class _Registration(object):
+    def __init__(self, device, measurementId, durationInSeconds, lock):
+        self.device = device
+        self.measurementId = measurementId
+        self.durationInSeconds = durationInSeconds
+        self.lock = lock
+        self.nextDrainTime = time.time()
+
+
+class AcquisitionScheduler(object):
+    """
+    Reads from every recording device on a single thread. Each device is drained when its FIFO is predicted to be a
+    quarter full, the drains are interleaved across devices and each one is made while holding the lock for the bus the
+    device is attached to so nothing else can talk to the bus mid read. This replaces the reader thread per device which
+    would otherwise contend for the bus.
+    """
+
+    def __init__(self, name='acquisition', clock=time.time):
+        self.name = name
+        self._clock = clock
+        self._condition = threading.Condition()
+        self._registrations = {}
+        self._thread = None
+        self.throughput = {}
+
+    def register(self, device, measurementId, durationInSeconds=None):
+        """
+        Starts reading from the device into its ring buffer, the ring buffer is closed when the measurement completes.
+        :param device: the device.
+        :param measurementId: the measurement.
+        :param durationInSeconds: how long to read for, reads until break if None.
+        """
+        lock = getattr(getattr(device, 'i2c_io', None), 'lock', None)
+        with self._condition:
+            self._registrations[device.name] = _Registration(device, measurementId, durationInSeconds, lock)
+            stats = DeviceThroughput()
+            stats.startTime = self._clock()
+            self.throughput[device.name] = stats
+            logger.info("Registered " + device.name + " for " + measurementId)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(name=self.name, target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def deregister(self, device):
+        """
+        Stops reading from the device, once this returns no drain of the device is in progress.
+        :param device: the device.
+        """
+        with self._condition:
+            registration = self._registrations.pop(device.name, None)
+            if registration is not None:
+                logger.info("Deregistered " + device.name + " from " + registration.measurementId)
+                device.ringBuffer.close()
+
+    def getStats(self):
+        """
+        :return: the throughput stats of each device keyed by device name.
+        """
+        return {name: stats.toDict() for name, stats in self.throughput.items()}
+
+    def _run(self):
+        """
+        The acquisition loop, sleeps until the next device is due and then drains it.
+        """
+        logger.info("Starting acquisition")
+        while True:
+            with self._condition:
+                if len(self._registrations) == 0:
+                    logger.info("Stopping acquisition, no devices registered")
+                    self._thread = None
+                    return
+                registration = min(self._registrations.values(), key=lambda r: r.nextDrainTime)
+                delay = registration.nextDrainTime - self._clock()
+                if delay > 0:
+                    # release the lock while waiting so devices can come and go
+                    self._condition.wait(delay)
+                    continue
+                self._drain(registration)
+
+    def _drain(self, registration):
+        """
+        Drains a single device into its ring buffer, deregistering it if the measurement is complete.
+        :param registration: the device registration.
+        """
+        device = registration.device
+        stats = self.throughput[device.name]
+        start = self._clock()
+        if stats.lastDrainTime is not None and start - stats.lastDrainTime > device.getDrainInterval() * 2:
+            stats.lateDrains += 1
+        keepGoing = False
+        try:
+            if registration.lock is not None:
+                with registration.lock:
+                    batch = device.drain()
+            else:
+                batch = device.drain()
+            end = self._clock()
+            stats.drains += 1
+            stats.samples += len(batch)
+            stats.busTime += end - start
+            stats.lastDrainTime = end
+            keepGoing = device.store(batch, registration.measurementId, registration.durationInSeconds)
+        except:
+            device.acquisitionFailed(registration.measurementId)
+        if keepGoing:
+            registration.nextDrainTime = start + device.getDrainInterval()
+        else:
+            self._registrations.pop(device.name, None)
+            device.ringBuffer.close()
@@ -0,0 +1,73 @@
+import logging
+
+logger = logging.getLogger('recorder.batchsizer')
+
+
+class AdaptiveBatchSizer(object):
+    """
+    Chooses the number of samples to read per batch from what happened to the last batch. If the handler spends most of
+    the time covered by a batch shipping it then the per batch overhead (e.g. an http request over a congested network)
+    dominates so the batch grows to amortise it. If the FIFO overflowed, or came close to it, then the batch shrinks so
+    the reader spends less time between FIFO reads. If the handler is comfortably keeping up then the batch slowly
+    shrinks back towards the minimum to keep latency down. The size is always kept within minSeconds and maxSeconds
+    worth of data.
+    """
+
+    def __init__(self, minSeconds=0.05, maxSeconds=2.0, growLatencyRatio=0.5, shrinkLatencyRatio=0.1,
+                 fifoFillLimit=0.75, growFactor=1.5, shrinkFactor=0.9, overflowFactor=0.5):
+        """
+        :param minSeconds: the smallest batch, in seconds of data.
+        :param maxSeconds: the largest batch, in seconds of data.
+        :param growLatencyRatio: grow if handling a batch takes more than this proportion of the time it covers.
+        :param shrinkLatencyRatio: shrink if handling a batch takes less than this proportion of the time it covers.
+        :param fifoFillLimit: shrink if the FIFO was fuller than this.
+        :param growFactor: the multiplier applied when growing.
+        :param shrinkFactor: the multiplier applied when the handler is comfortably keeping up.
+        :param overflowFactor: the multiplier applied when the FIFO is at risk.
+        """
+        if minSeconds <= 0 or maxSeconds < minSeconds:
+            raise ValueError('Invalid batch bounds ' + str(minSeconds) + '-' + str(maxSeconds))
+        self.minSeconds = minSeconds
+        self.maxSeconds = maxSeconds
+        self.growLatencyRatio = growLatencyRatio
+        self.shrinkLatencyRatio = shrinkLatencyRatio
+        self.fifoFillLimit = fifoFillLimit
+        self.growFactor = growFactor
+        self.shrinkFactor = shrinkFactor
+        self.overflowFactor = overflowFactor
+        self.lastLatencyRatio = None
+
+    def getBounds(self, fs):
+        """
+        :param fs: the sample rate.
+        :return: the min and max batch size in samples.
+        """
+        return max(1, int(self.minSeconds * fs)), max(1, int(self.maxSeconds * fs))
+
+    def nextSize(self, currentSize, fs, handledSamples, handlerLatency, fifoFill=None, overflowed=False):
+        """
+        Calculates the size of the next batch.
+        :param currentSize: the current batch size.
+        :param fs: the sample rate.
+        :param handledSamples: the number of samples passed to the handler.
+        :param handlerLatency: the time taken by the handler, in seconds.
+        :param fifoFill: the peak proportion of the FIFO in use while reading, if known.
+        :param overflowed: true if the FIFO overflowed.
+        :return: the new batch size.
+        """
+        if handledSamples > 0:
+            self.lastLatencyRatio = handlerLatency / (handledSamples / fs)
+        if overflowed or (fifoFill is not None and fifoFill > self.fifoFillLimit):
+            newSize = currentSize * self.overflowFactor
+        elif self.lastLatencyRatio is not None and self.lastLatencyRatio > self.growLatencyRatio:
+            newSize = currentSize * self.growFactor
+        elif self.lastLatencyRatio is not None and self.lastLatencyRatio < self.shrinkLatencyRatio:
+            newSize = currentSize * self.shrinkFactor
+        else:
+            newSize = currentSize
+        minSize, maxSize = self.getBounds(fs)
+        newSize = int(min(max(round(newSize), minSize), maxSize))
+        if newSize != currentSize:
+            logger.debug("Batch size %d -> %d [latency ratio: %s, fifo fill: %s, overflowed: %s]", currentSize,
+                         newSize, self.lastLatencyRatio, fifoFill, overflowed)
+        return newSize
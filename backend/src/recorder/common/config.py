@@ -1,9 +1,14 @@
 from collections import OrderedDict
+from os import path
 
 from core.BaseConfig import BaseConfig
 from core.handler import CSVLogger, HttpPoster
-from .i2c_io import WhiteNoiseProvider, mock_io
+from .acquisition import AcquisitionScheduler
+from .batchsizer import AdaptiveBatchSizer
+from .fifopacer import FifoPacer
+from .i2c_io import WhiteNoiseProvider, mock_io, mux_io, SMBUS_BLOCK_LIMIT
 from .mpu6050 import mpu6050
+from .replay import ReplayProvider
 from .smbus_io import smbus_io
 
 
@@ -48,19 +53,68 @@ class Config(BaseConfig):
         """
         return self.config.get('useAsyncHandler', True)
 
+    def getAsyncHandlerOptions(self):
+        """
+        :return: the kwargs for an AsyncHandler, coalescing of queued batches is on unless asyncCoalescing is false,
+        it can also be set to a dict containing coalesceThreshold, maxCoalescedSamples and maxCoalescedSeconds.
+        """
+        coalescingCfg = self.config.get('asyncCoalescing', True)
+        if coalescingCfg is False:
+            return {'coalesceThreshold': None}
+        if coalescingCfg is True:
+            return {}
+        return {k: v for k, v in coalescingCfg.items()
+                if k in ['coalesceThreshold', 'maxCoalescedSamples', 'maxCoalescedSeconds']}
+
+    def getSpool(self):
+        """
+        :return: the spool config, a dict containing the dir to spool to and (optionally) maxQueueDepth, retryInterval
+        and drainTimeout, or None if spooling is off. Spooling is off by default, if it is on then it spools to the spool
+        dir under the config dir unless a dir is given.
+        """
+        spoolCfg = self.config.get('spool')
+        if spoolCfg is None or spoolCfg is False:
+            return None
+        spool = {'dir': path.join(self._getConfigPath(), 'spool')}
+        if isinstance(spoolCfg, dict):
+            spool.update(spoolCfg)
+        return spool
+
+    def getSpectralSummary(self):
+        """
+        :return: the spectral summary config, a dict containing includeRawData and (optionally) segmentLength, or None
+        if the devices should not summarise the data.
+        """
+        summaryCfg = self.config.get('spectralSummary')
+        if summaryCfg is None or summaryCfg is False:
+            return None
+        if summaryCfg is True:
+            return {'includeRawData': False}
+        return summaryCfg
+
     def getPingInterval(self):
         """
         :return: the server ping interval if set, defaults to 5s.
         """
         return self.config.get('pingInterval', 5)
 
-    def createDevice(self, deviceCfg):
+    def useSharedAcquisition(self):
+        """
+        :return: if all devices are read by a single AcquisitionScheduler, defaults to True if there is more than one
+        device.
+        """
+        return self.config.get('sharedAcquisition', len(self.config['accelerometers']) > 1)
+
+    def createDevice(self, deviceCfg, buses=None, scheduler=None):
         """
         Creates a measurement deviceCfg from the input configuration.
         :param: deviceCfg: the deviceCfg cfg.
-        :param: handlers: the loaded handlers.
+        :param: buses: the smbus_io created so far keyed by busId, devices on the same bus share the io (and its lock).
+        :param: scheduler: the AcquisitionScheduler shared by all devices, if any.
         :return: the constructed deviceCfg.
         """
+        if buses is None:
+            buses = {}
         ioCfg = deviceCfg['io']
         type = deviceCfg['type']
         if type == 'mpu6050':
@@ -70,29 +124,92 @@ class Config(BaseConfig):
                 provider = ioCfg.get('provider')
                 if provider is not None and provider == 'white noise':
                     dataProvider = WhiteNoiseProvider()
+                elif provider is not None and provider == 'replay':
+                    self.logger.warning("Replaying " + ioCfg['file'] + " at " + str(ioCfg.get('speed', 1.0)) + "x")
+                    dataProvider = ReplayProvider.fromFile(ioCfg['file'], speed=ioCfg.get('speed', 1.0),
+                                                           loop=ioCfg.get('loop', True),
+                                                           wavScale=ioCfg.get('wavScale', 1.0))
                 else:
-                    raise ValueError(provider + " is not a supported mock io data provider")
+                    raise ValueError(str(provider) + " is not a supported mock io data provider")
                 self.logger.warning("Loading mock data provider for mpu6050")
-                io = mock_io(dataProvider=dataProvider.provide)
+                io = mock_io(dataProvider=dataProvider.provide,
+                             maxReadBytes=ioCfg.get('maxReadBytes', SMBUS_BLOCK_LIMIT),
+                             writeHandler=dataProvider.write)
             elif ioCfg['type'] == 'smbus':
                 busId = ioCfg['busId']
-                self.logger.warning("Loading smbus %d", busId)
-                io = smbus_io(busId)
+                io = buses.get(busId)
+                if io is None:
+                    maxReadBytes = ioCfg.get('maxReadBytes', 1024)
+                    self.logger.warning("Loading smbus %d with max read of %d bytes", busId, maxReadBytes)
+                    io = smbus_io(busId, maxReadBytes=maxReadBytes)
+                    buses[busId] = io
+                muxCfg = ioCfg.get('mux')
+                if muxCfg is not None:
+                    muxAddress = self._toAddress(muxCfg.get('address', 0x70))
+                    self.logger.warning("Using channel %d on mux %s", muxCfg['channel'], hex(muxAddress))
+                    io = mux_io(io, muxCfg['channel'], muxAddress=muxAddress)
             else:
                 raise ValueError(ioCfg['type'] + " is not a supported io provider")
-            self.logger.warning("Loading mpu6050 " + name + "/" + str(fs))
-            return mpu6050(io, name=name, fs=fs) if name is not None else mpu6050(io, fs=fs)
+            # pacing relies on the FIFO filling in real time so only makes sense for a real device
+            pacer = FifoPacer() if deviceCfg.get('pacing', ioCfg['type'] == 'smbus') else None
+            self.logger.warning("Loading mpu6050 " + name + "/" + str(fs) + (" with pacing" if pacer else ""))
+            bufferSeconds = deviceCfg.get('bufferSeconds', 30)
+            batchSizer = self._createBatchSizer(deviceCfg.get('adaptiveBatching'))
+            i2cAddress = self._toAddress(deviceCfg.get('address', mpu6050.MPU6050_ADDRESS))
+            kwargs = {
+                'fs': fs,
+                'pacer': pacer,
+                'bufferSeconds': bufferSeconds,
+                'batchSizer': batchSizer,
+                'i2cAddress': i2cAddress,
+                'scheduler': scheduler
+            }
+            if name is not None:
+                kwargs['name'] = name
+            return mpu6050(io, **kwargs)
         else:
             raise ValueError(type + " is not a supported device")
 
+    def _createBatchSizer(self, batchingCfg):
+        """
+        Creates the batch sizer for adaptive batching, if it is enabled.
+        :param batchingCfg: the adaptiveBatching cfg, either true or a dict of min/max batch size in seconds.
+        :return: the batch sizer or None if adaptive batching is off.
+        """
+        if batchingCfg is None or batchingCfg is False:
+            return None
+        if batchingCfg is True:
+            batchingCfg = {}
+        minSeconds = batchingCfg.get('minSeconds', 0.05)
+        maxSeconds = batchingCfg.get('maxSeconds', 2.0)
+        self.logger.warning("Using adaptive batching between " + str(minSeconds) + "s and " + str(maxSeconds) + "s")
+        return AdaptiveBatchSizer(minSeconds=minSeconds, maxSeconds=maxSeconds)
+
+    @staticmethod
+    def _toAddress(address):
+        """
+        :param address: an i2c address as an int or a (hex) string.
+        :return: the address as an int.
+        """
+        return int(address, 0) if isinstance(address, str) else address
+
     def _loadRecordingDevices(self):
         """
         Loads the recordingDevices specified in the configuration.
         :param: handlers the loaded handlers.
         :return: the constructed recordingDevices in a dict keyed by name.
         """
-        return {device.name: device for device in
-                [self.createDevice(deviceCfg) for deviceCfg in self.config['accelerometers']]}
+        buses = {}
+        self.scheduler = AcquisitionScheduler() if self.useSharedAcquisition() else None
+        if self.scheduler is not None:
+            self.logger.warning("Using a shared acquisition scheduler")
+        devices = {}
+        for deviceCfg in self.config['accelerometers']:
+            device = self.createDevice(deviceCfg, buses=buses, scheduler=self.scheduler)
+            if device.name in devices:
+                raise ValueError("Duplicate device name " + device.name)
+            devices[device.name] = device
+        return devices
 
     def _loadMeasurements(self):
         """
@@ -111,10 +228,18 @@ class Config(BaseConfig):
         target = handler['target']
         if handler['type'] == 'log':
             self.logger.warning("Initialising csvlogger to log data to " + target)
-            return CSVLogger('recorder', handler['name'], target)
+            return CSVLogger('recorder', handler['name'], target, precision=handler.get('precision'),
+                             flushInterval=handler.get('flushInterval'), fsync=handler.get('fsync', False))
         elif handler['type'] == 'post':
             self.logger.warning("Initialising http logger to log data to " + target)
-            return HttpPoster(handler['name'], target)
+            spoolCfg = self.getSpool()
+            return HttpPoster(handler['name'], target, wireFormat=handler.get('format', 'json'),
+                              encoding=handler.get('encoding', 'float32'),
+                              spoolDir=spoolCfg['dir'] if spoolCfg is not None else None,
+                              retryInterval=spoolCfg.get('retryInterval', 1.0) if spoolCfg is not None else 1.0,
+                              drainTimeout=spoolCfg.get('drainTimeout', 30.0) if spoolCfg is not None else 30.0,
+                              compressionLevel=handler.get('compression'), streamPort=handler.get('streamPort'),
+                              window=handler.get('window', 1))
 
     def _loadHandlers(self):
         """
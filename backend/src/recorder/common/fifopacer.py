@@ -0,0 +1,123 @@
+import logging
+import time
+
+logger = logging.getLogger('recorder.fifopacer')
+
+MPU6050_FIFO_SIZE_BYTES = 1024
+
+
+class FifoPacer(object):
+    """
+    Paces reads from a FIFO by predicting how much data it holds from the rate at which it fills. The reader sleeps
+    until enough data for an efficient read should be available instead of repeatedly polling the device, the fill
+    rate is corrected from the counts actually observed so drift in the device clock (or an inaccurate fs) does not
+    accumulate. The reader never waits for more than targetFill of the FIFO so there is always headroom before it
+    overflows.
+    """
+
+    def __init__(self, fifoSizeBytes=MPU6050_FIFO_SIZE_BYTES, targetFill=0.25, smoothing=0.2,
+                 clock=time.time, sleeper=time.sleep):
+        """
+        :param fifoSizeBytes: the size of the FIFO.
+        :param targetFill: the proportion of the FIFO we aim to drain in a single read.
+        :param smoothing: the weight given to each new observation of the fill rate.
+        :param clock: the time source.
+        :param sleeper: the sleep function.
+        """
+        self.fifoSizeBytes = fifoSizeBytes
+        self.targetFill = targetFill
+        self.smoothing = smoothing
+        self._clock = clock
+        self._sleeper = sleeper
+        self.nominalBytesPerSecond = None
+        self.bytesPerSecond = None
+        self._lastCount = None
+        self._lastCountTime = None
+        self._bytesReadSinceCount = 0
+        self.polls = 0
+        self.sleeps = 0
+        self.sleepTime = 0.0
+
+    def setNominalRate(self, bytesPerSecond):
+        """
+        Sets the rate at which the FIFO should fill, the current estimate is discarded if this differs from the
+        existing nominal rate.
+        :param bytesPerSecond: the expected fill rate.
+        """
+        if bytesPerSecond != self.nominalBytesPerSecond:
+            logger.debug("Nominal fill rate is now %d bytes/s", bytesPerSecond)
+            self.nominalBytesPerSecond = bytesPerSecond
+            self.bytesPerSecond = bytesPerSecond
+            self._lastCount = None
+            self._lastCountTime = None
+            self._bytesReadSinceCount = 0
+
+    def observe(self, fifoCount):
+        """
+        Records a count read from the device and uses it to correct the estimated fill rate.
+        :param fifoCount: the number of bytes in the FIFO.
+        """
+        now = self._clock()
+        self.polls += 1
+        if self._lastCountTime is not None:
+            elapsed = now - self._lastCountTime
+            remaining = self._lastCount - self._bytesReadSinceCount
+            if elapsed > 0 and fifoCount >= remaining:
+                observedRate = (fifoCount - remaining) / elapsed
+                updated = ((1.0 - self.smoothing) * self.bytesPerSecond) + (self.smoothing * observedRate)
+                # keep the estimate within sane bounds so a burst of bad observations can't stall the reader
+                self.bytesPerSecond = min(max(updated, self.nominalBytesPerSecond * 0.5),
+                                          self.nominalBytesPerSecond * 2.0)
+        self._lastCount = fifoCount
+        self._lastCountTime = now
+        self._bytesReadSinceCount = 0
+
+    def consumed(self, bytesRead):
+        """
+        Records data read from the FIFO since the last count.
+        :param bytesRead: the no of bytes read.
+        """
+        self._bytesReadSinceCount += bytesRead
+
+    def fifoWasReset(self):
+        """
+        Records that the FIFO has been emptied.
+        """
+        self._lastCount = 0
+        self._lastCountTime = self._clock()
+        self._bytesReadSinceCount = 0
+
+    def predict(self):
+        """
+        :return: the predicted number of bytes in the FIFO right now or None if we have no basis for a prediction.
+        """
+        if self._lastCountTime is None:
+            return None
+        elapsed = self._clock() - self._lastCountTime
+        predicted = self._lastCount - self._bytesReadSinceCount + (self.bytesPerSecond * elapsed)
+        return min(predicted, self.fifoSizeBytes)
+
+    def waitFor(self, requiredBytes):
+        """
+        Sleeps until the FIFO should contain enough data for an efficient read, i.e. the smaller of requiredBytes and
+        the target fill level.
+        :param requiredBytes: the number of bytes the reader needs.
+        :return: the time slept.
+        """
+        predicted = self.predict()
+        if predicted is None or not self.bytesPerSecond:
+            return 0.0
+        target = min(requiredBytes, self.fifoSizeBytes * self.targetFill)
+        if predicted >= target:
+            return 0.0
+        delay = (target - predicted) / self.bytesPerSecond
+        self.sleeps += 1
+        self.sleepTime += delay
+        self._sleeper(delay)
+        return delay
+
+    def getSleepPollRatio(self):
+        """
+        :return: the number of times we slept per count read from the device.
+        """
+        return self.sleeps / self.polls if self.polls > 0 else 0.0
@@ -34,6 +34,8 @@ class Heartbeater(object):
             try:
                 data = marshal(md, recordingDeviceFields)
                 data['serviceURL'] = self.cfg.getServiceURL() + API_PREFIX + '/devices/' + name
+                if getattr(md, 'telemetry', None) is not None:
+                    data['telemetry'] = md.telemetry.getSummary()
                 targetURL = self.serverURL + API_PREFIX + '/devices/' + name
                 logger.info("Pinging " + targetURL)
                 resp = self.httpclient.put(targetURL, json=data)
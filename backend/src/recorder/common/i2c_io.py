@@ -1,17 +1,22 @@
 import abc
+import threading
 from queue import Queue
 
-from .mpu6050 import mpu6050
+from .mpu6050 import mpu6050, SMBUS_BLOCK_LIMIT
 
 
 class i2c_io(object):
     """
     A thin wrapper on the smbus for reading and writing data. Exists to allow unit testing without a real device
     connected.
+    :var maxReadBytes: the max no of bytes that can be read by a single call to readBulk.
+    :var lock: held for the duration of each transaction, also held by anything that needs a sequence of
+    transactions to complete without interruption (e.g. an AcquisitionScheduler draining a FIFO).
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, maxReadBytes=SMBUS_BLOCK_LIMIT):
+        self.maxReadBytes = maxReadBytes
+        self.lock = threading.RLock()
 
     """
     Writes data to the device.
@@ -24,6 +29,16 @@ class i2c_io(object):
     def write(self, i2cAddress, register, val):
         pass
 
+    """
+    Writes a single byte to the device without a register, e.g. to select a channel on a multiplexer.
+    :param: i2cAddress: the address to write to.
+    :param: val: the value to write.
+    """
+
+    @abc.abstractmethod
+    def writeByte(self, i2cAddress, val):
+        pass
+
     """
     Reads data from the device.
     :param: i2cAddress: the address to read from.
@@ -47,16 +62,42 @@ class i2c_io(object):
     def readBlock(self, i2cAddress, register, length):
         pass
 
+    """
+    Reads up to maxReadBytes from the device in as few transactions as possible, the default implementation simply
+    issues a series of block reads.
+    :param: i2cAddress: the address to read from.
+    :param: register: the register to read from.
+    :param: length: no of bytes to read.
+    :return: the data read.
+    """
+
+    def readBulk(self, i2cAddress, register, length):
+        data = []
+        for offset in range(0, length, SMBUS_BLOCK_LIMIT):
+            data.extend(self.readBlock(i2cAddress, register, min(SMBUS_BLOCK_LIMIT, length - offset)))
+        return data
+
 
 class mock_io(i2c_io):
-    def __init__(self, dataProvider=None):
-        super().__init__()
+    def __init__(self, dataProvider=None, maxReadBytes=SMBUS_BLOCK_LIMIT, writeHandler=None):
+        """
+        :param dataProvider: a function, accepting a register and (optionally) a length, that provides the data read.
+        :param maxReadBytes: the max read size.
+        :param writeHandler: an optional function, accepting a register and a value, that is told about each write.
+        """
+        super().__init__(maxReadBytes=maxReadBytes)
         self.valuesWritten = []
         self.dataProvider = dataProvider
+        self.writeHandler = writeHandler
         self.valsToRead = Queue()
 
     def write(self, i2cAddress, register, val):
         self.valuesWritten.append([i2cAddress, register, val])
+        if self.writeHandler is not None:
+            self.writeHandler(register, val)
+
+    def writeByte(self, i2cAddress, val):
+        self.valuesWritten.append([i2cAddress, None, val])
 
     def readBlock(self, i2cAddress, register, length):
         if self.dataProvider is not None:
@@ -65,6 +106,9 @@ class mock_io(i2c_io):
                 return ret
         return self.valsToRead.get_nowait()
 
+    def readBulk(self, i2cAddress, register, length):
+        return self.readBlock(i2cAddress, register, length)
+
     def read(self, i2cAddress, register):
         if self.dataProvider is not None:
             ret = self.dataProvider(register)
@@ -73,11 +117,66 @@ class mock_io(i2c_io):
         return self.valsToRead.get_nowait()
 
 
+class mux_io(i2c_io):
+    """
+    An i2c_io for a device attached to one channel of an i2c multiplexer (e.g. a TCA9548A), this selects the channel
+    before each transaction if it is not already selected. Every mux_io attached to the same bus must share the same
+    parent io so that the channel selection and the subsequent transaction happen under the same lock.
+    """
+
+    def __init__(self, parent, channel, muxAddress=0x70):
+        """
+        :param parent: the io for the bus the multiplexer is attached to.
+        :param channel: the channel the device is attached to.
+        :param muxAddress: the address of the multiplexer.
+        """
+        super().__init__(maxReadBytes=parent.maxReadBytes)
+        self.parent = parent
+        self.channel = channel
+        self.muxAddress = muxAddress
+        self.lock = parent.lock
+        if not hasattr(parent, 'selectedMuxChannels'):
+            parent.selectedMuxChannels = {}
+
+    def _select(self):
+        if self.parent.selectedMuxChannels.get(self.muxAddress) != self.channel:
+            self.parent.writeByte(self.muxAddress, 1 << self.channel)
+            self.parent.selectedMuxChannels[self.muxAddress] = self.channel
+
+    def write(self, i2cAddress, register, val):
+        with self.lock:
+            self._select()
+            return self.parent.write(i2cAddress, register, val)
+
+    def writeByte(self, i2cAddress, val):
+        with self.lock:
+            self._select()
+            return self.parent.writeByte(i2cAddress, val)
+
+    def read(self, i2cAddress, register):
+        with self.lock:
+            self._select()
+            return self.parent.read(i2cAddress, register)
+
+    def readBlock(self, i2cAddress, register, length):
+        with self.lock:
+            self._select()
+            return self.parent.readBlock(i2cAddress, register, length)
+
+    def readBulk(self, i2cAddress, register, length):
+        with self.lock:
+            self._select()
+            return self.parent.readBulk(i2cAddress, register, length)
+
+
 class MockIoDataProvider:
     @abc.abstractmethod
     def provide(self, register):
         pass
 
+    def write(self, register, val):
+        pass
+
 
 class WhiteNoiseProvider(MockIoDataProvider):
     """
@@ -1,12 +1,19 @@
 import collections
 import logging
+import math
 import struct
 from _ctypes import ArgumentError
 from time import sleep, time
 
+import numpy as np
+
+from core.batch import SampleBatch
 from .accelerometer import Accelerometer, ACCEL_X, ACCEL_Y, ACCEL_Z, GYRO_X, GYRO_Y, GYRO_Z, TEMP, SAMPLE_TIME
+from .fifopacer import MPU6050_FIFO_SIZE_BYTES
 
 SENSOR_SCALE_FACTOR = 32768.0
+# the max no of bytes that can be read in a single SMBus block read
+SMBUS_BLOCK_LIMIT = 32
 DEFAULT_GYRO_SENSITIVITY = 500.0
 DEFAULT_ACCELEROMETER_SENSITIVITY = 2.0
 DEFAULT_TEMPERATURE_GAIN = 1.0 / 340.0
@@ -25,6 +32,7 @@ class mpu6050(Accelerometer):
 
     # converted from Jeff Rowberg code https://github.com/jrowberg/i2cdevlib/blob/master/Arduino/MPU6050/MPU6050.h
     MPU6050_ADDRESS = 0x68  # default I2C Address
+    MPU6050_ALT_ADDRESS = 0x69  # I2C Address when AD0 is pulled high
 
     # bit masks for enabling the which sensors are written to the FIFO
     enableAccelerometerMask = 0b00001000
@@ -245,12 +253,29 @@ class mpu6050(Accelerometer):
         # Enable data ready interrupt    LDByteWriteI2C(MPU6050_ADDRESS, MPU6050_RA_INT_ENABLE, 0x00);
         MPU6050_RA_FIFO_R_W]  # LDByteWriteI2C(MPU6050_ADDRESS, MPU6050_RA_FIFO_R_W, 0x00);
 
-    def __init__(self, i2c_io, fs=None, name='mpu6050', samplesPerBatch=None, dataHandler=None):
+    def __init__(self, i2c_io, fs=None, name='mpu6050', samplesPerBatch=None, dataHandler=None, pacer=None,
+                 bufferSeconds=30, batchSizer=None, i2cAddress=MPU6050_ADDRESS, scheduler=None):
         """
         initialises to a default state set to measure acceleration only.
-        """
-        super().__init__(fs, samplesPerBatch, dataHandler)
+        :param i2cAddress: the address of the device on the bus, 0x68 or 0x69 depending on the state of AD0.
+        :param pacer: an optional FifoPacer which, if provided, is used to sleep until data should be available rather
+        than busy polling the FIFO count.
+        :param bufferSeconds: how much data can be buffered between the device and the handler.
+        :param batchSizer: an optional AdaptiveBatchSizer.
+        :param scheduler: an optional AcquisitionScheduler which, if provided, drains the FIFO instead of a dedicated
+        reader thread.
+        """
+        super().__init__(fs, samplesPerBatch, dataHandler, bufferSeconds=bufferSeconds, batchSizer=batchSizer,
+                         scheduler=scheduler)
+        self.i2cAddress = i2cAddress
+        self.fifoPeakBytes = 0
+        self.fifoOverflows = 0
+        self._reportedFifoOverflows = 0
         self.name = name
+        self.pacer = pacer
+        self.i2cTransactions = 0
+        self.i2cBytesRead = 0
+        self.i2c_io = i2c_io
         self.fifoSensorMask = self.enableAccelerometerMask
         self._accelEnabled = True
         self._gyroEnabled = False
@@ -259,16 +284,16 @@ class mpu6050(Accelerometer):
         self.gyroSensitivity = DEFAULT_GYRO_SENSITIVITY
         self._accelerationFactor = self.accelerometerSensitivity / SENSOR_SCALE_FACTOR
         self._gyroFactor = self.gyroSensitivity / SENSOR_SCALE_FACTOR
-        self.i2c_io = i2c_io
         self.doInit()
 
     def _setSampleSizeBytes(self):
         """
-        updates the current record of the packet size per sample and the relationship between this and the fifo reads. 
+        updates the current record of the packet size per sample and the relationship between this and the fifo reads,
+        i.e. the max no of samples the io can read in one go.
         """
         self.sampleSizeBytes = self.getPacketSize()
         if self.sampleSizeBytes > 0:
-            self.maxBytesPerFifoRead = (32 // self.sampleSizeBytes)
+            self.maxBytesPerFifoRead = (self.i2c_io.maxReadBytes // self.sampleSizeBytes)
 
     def getPacketSize(self):
         """
@@ -296,13 +321,13 @@ class mpu6050(Accelerometer):
         self.setGyroSensitivity(self._gyroFactor * 32768.0)
         self.setSampleRate(self.fs)
         for loop in self.ZeroRegister:
-            self.i2c_io.write(self.MPU6050_ADDRESS, loop, 0)
+            self.i2c_io.write(self.i2cAddress, loop, 0)
         # Sets clock source to gyro reference w/ PLL
-        self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_PWR_MGMT_1, 0b00000010)
+        self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_PWR_MGMT_1, 0b00000010)
         # Controls frequency of wakeups in accel low power mode plus the sensor standby modes
-        self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_PWR_MGMT_2, 0x00)
+        self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_PWR_MGMT_2, 0x00)
         # Enables any I2C master interrupt source to generate an interrupt
-        self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_INT_ENABLE, 0x01)
+        self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_INT_ENABLE, 0x01)
         # enable the FIFO
         self.enableFifo()
         logger.debug("Initialised device")
@@ -395,7 +420,7 @@ class mpu6050(Accelerometer):
         :param value: the target sensitivity.
         """
         try:
-            self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_GYRO_CONFIG,
+            self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_GYRO_CONFIG,
                               {250: 0, 500: 8, 1000: 16, 2000: 24}[value])
             self._gyroFactor = value / 32768.0
             self.gyroSensitivity = value
@@ -416,7 +441,7 @@ class mpu6050(Accelerometer):
         # in binary we get 2 = 0, 4 = 1000, 8 = 10000, 16 = 11000
         # so the 1st 3 bits are always 0
         try:
-            self.i2c_io.write(self.MPU6050_ADDRESS,
+            self.i2c_io.write(self.i2cAddress,
                               self.MPU6050_RA_ACCEL_CONFIG,
                               {2: 0, 4: 8, 8: 16, 16: 24}[value])
             self._accelerationFactor = value / 32768.0
@@ -434,7 +459,7 @@ class mpu6050(Accelerometer):
         :return:
         """
         sampleRateDenominator = int((8000 / min(targetSampleRate, 1000)) - 1)
-        self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_SMPLRT_DIV, sampleRateDenominator)
+        self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_SMPLRT_DIV, sampleRateDenominator)
         self.fs = 8000.0 / (sampleRateDenominator + 1.0)
         logger.debug("Set sample rate = %d", self.fs)
 
@@ -444,12 +469,14 @@ class mpu6050(Accelerometer):
         :return:
         """
         logger.debug("Resetting FIFO")
-        self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_USER_CTRL, 0b00000000)
+        self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_USER_CTRL, 0b00000000)
         pass
-        self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_USER_CTRL, 0b00000100)
+        self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_USER_CTRL, 0b00000100)
         pass
-        self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_USER_CTRL, 0b01000000)
+        self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_USER_CTRL, 0b01000000)
         self.getInterruptStatus()
+        if self.pacer is not None:
+            self.pacer.fifoWasReset()
 
     def enableFifo(self):
         """
@@ -457,9 +484,9 @@ class mpu6050(Accelerometer):
         :return:
         """
         logger.debug("Enabling FIFO")
-        self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_FIFO_EN, 0)
+        self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_FIFO_EN, 0)
         self.resetFifo()
-        self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_FIFO_EN, self.fifoSensorMask)
+        self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_FIFO_EN, self.fifoSensorMask)
         logger.debug("Enabled FIFO")
 
     def getInterruptStatus(self):
@@ -469,7 +496,10 @@ class mpu6050(Accelerometer):
          0b00001000 = I2C_MST_INT = I2C master interrupt has fired
          0b00000001 = DATA_RDY_INT = data is available to read
         """
-        return self.i2c_io.read(self.MPU6050_ADDRESS, self.MPU6050_RA_INT_STATUS)
+        self.i2cTransactions += 1
+        self.i2cBytesRead += 1
+        self.telemetry.i2cRead(1)
+        return self.i2c_io.read(self.i2cAddress, self.MPU6050_RA_INT_STATUS)
 
     def getFifoCount(self):
         """
@@ -477,54 +507,81 @@ class mpu6050(Accelerometer):
         :return: the number of bytes available on the FIFO which will be proportional to the number of samples available
         based on the values the device is configured to sample.
         """
-        bytes = self.i2c_io.readBlock(self.MPU6050_ADDRESS, self.MPU6050_RA_FIFO_COUNTH, 2)
+        self.i2cTransactions += 1
+        self.i2cBytesRead += 2
+        self.telemetry.i2cRead(2)
+        bytes = self.i2c_io.readBlock(self.i2cAddress, self.MPU6050_RA_FIFO_COUNTH, 2)
         count = (bytes[0] << 8) + bytes[1]
         logger.debug("FIFO Count: %d", count)
+        self.telemetry.fifoCount(count)
+        if self.pacer is not None:
+            self.pacer.observe(count)
         return count
 
     def getDataFromFIFO(self, bytesToRead):
         """
         reads the specified number of bytes from the FIFO, should be called after a call to getFifoCount to ensure there
         is new data available (to avoid reading duplicate data).
-        :param bytesToRead: the number of bytes to read.
+        :param bytesToRead: the number of bytes to read, this may be up to the io's maxReadBytes.
         :return: the bytes read.
         """
-        return self.i2c_io.readBlock(self.MPU6050_ADDRESS, self.MPU6050_RA_FIFO_R_W, bytesToRead)
+        self.i2cTransactions += 1
+        self.i2cBytesRead += bytesToRead
+        self.telemetry.i2cRead(bytesToRead)
+        if self.pacer is not None:
+            self.pacer.consumed(bytesToRead)
+        if bytesToRead > SMBUS_BLOCK_LIMIT:
+            return self.i2c_io.readBulk(self.i2cAddress, self.MPU6050_RA_FIFO_R_W, bytesToRead)
+        else:
+            return self.i2c_io.readBlock(self.i2cAddress, self.MPU6050_RA_FIFO_R_W, bytesToRead)
 
     def provideData(self):
         """
         reads a batchSize batch of data from the FIFO while attempting to optimise the number of times we have to read
         from the device itself.
-        :return: a list of data where each item is a single sample of data converted into real values and stored as a
-        dict.
+        :return: a SampleBatch containing the samples converted into real values.
         """
-        samples = []
+        samplesPerBatch = self.activeSamplesPerBatch
+        # the raw bytes for the whole batch are collected here and decoded in one go once the batch is complete
+        rawBatch = bytearray(math.ceil(samplesPerBatch) * self.sampleSizeBytes)
+        rawBatchBytes = 0
+        samplesRead = 0
         fifoBytesAvailable = 0
         fifoWasReset = False
-        logger.debug(">> provideData target %d samples", self.samplesPerBatch)
+        logger.debug(">> provideData target %d samples", samplesPerBatch)
+        if self.pacer is not None:
+            self.pacer.setNominalRate(self.fs * self.sampleSizeBytes)
         iterations = 0
         # allow 1.5x the expected duration of the batch
-        breakTime = time() + ((self.samplesPerBatch / self.fs) * 1.5)
+        breakTime = time() + ((samplesPerBatch / self.fs) * 1.5)
         overdue = False
-        while len(samples) < self.samplesPerBatch and not overdue:
+        while samplesRead < samplesPerBatch and not overdue:
             iterations += 1
-            if iterations > self.samplesPerBatch and iterations % 100 == 0:
+            # a paced loop iterates rarely so check every time, otherwise avoid the cost of checking the time
+            if self.pacer is not None or (iterations > samplesPerBatch and iterations % 100 == 0):
                 if time() > breakTime:
                     logger.warning("Breaking measurement after %d iterations, batch overdue", iterations)
                     overdue = True
             if fifoBytesAvailable < self.sampleSizeBytes or fifoWasReset:
+                if self.pacer is not None:
+                    self.pacer.waitFor((samplesPerBatch - samplesRead) * self.sampleSizeBytes)
                 interrupt = self.getInterruptStatus()
                 fifoBytesAvailable = self.getFifoCount()
+                self.fifoPeakBytes = max(self.fifoPeakBytes, fifoBytesAvailable)
                 fifoWasReset = False
             logger.debug("Start sample loop [available: %d , required: %d]", fifoBytesAvailable, self.sampleSizeBytes)
             if interrupt & 0x10:
                 logger.error("FIFO OVERFLOW, RESETTING [available: %d , interrupt: %d]", fifoBytesAvailable, interrupt)
                 self.measurementOverflowed = True
+                self.fifoOverflows += 1
+                self.telemetry.fifoOverflowed()
                 self.resetFifo()
                 fifoWasReset = True
-            elif fifoBytesAvailable == 1024:
+            elif fifoBytesAvailable == MPU6050_FIFO_SIZE_BYTES:
                 logger.error("FIFO FULL, RESETTING [available: %d , interrupt: %d]", fifoBytesAvailable, interrupt)
                 self.measurementOverflowed = True
+                self.fifoOverflows += 1
+                self.telemetry.fifoOverflowed()
                 self.resetFifo()
                 fifoWasReset = True
             elif interrupt & 0x02 or interrupt & 0x01:
@@ -532,12 +589,14 @@ class mpu6050(Accelerometer):
                 while fifoBytesAvailable < self.sampleSizeBytes:
                     logger.debug("Waiting for sample [available: %d , required: %d]", fifoBytesAvailable,
                                  self.sampleSizeBytes)
+                    if self.pacer is not None:
+                        self.pacer.waitFor(self.sampleSizeBytes)
                     fifoBytesAvailable = self.getFifoCount()
                 logger.debug("Processing data [available: %d , required: %d]", fifoBytesAvailable, self.sampleSizeBytes)
                 fifoReadBytes = self.sampleSizeBytes
                 # TODO this chunk of code is a bit messy, tidy it up
                 # if we have more than 1 sample available then ensure we read as many as we can at once (albeit within
-                # the limits of the max i2c read size of 32 bytes)
+                # the limits of the max read size supported by the io)
                 if fifoBytesAvailable > self.sampleSizeBytes:
                     fifoReadBytes = min(fifoBytesAvailable // self.sampleSizeBytes,
                                         self.maxBytesPerFifoRead) * self.sampleSizeBytes
@@ -545,7 +604,7 @@ class mpu6050(Accelerometer):
                                  fifoReadBytes)
                 # but don't read more than we need to fulfil the batch
                 samplesToRead = fifoReadBytes // self.sampleSizeBytes
-                excessSamples = self.samplesPerBatch - len(samples) - samplesToRead
+                excessSamples = samplesPerBatch - samplesRead - samplesToRead
                 if excessSamples < 0:
                     samplesToRead += excessSamples
                     fifoReadBytes = int(samplesToRead * self.sampleSizeBytes)
@@ -553,16 +612,111 @@ class mpu6050(Accelerometer):
                                  fifoReadBytes)
                 else:
                     logger.debug("Reading [available: %d , reading: %d]", fifoBytesAvailable, fifoReadBytes)
-                # read the bytes from the fifo, break it into sample sized chunks and convert to the actual values
+                # read the bytes from the fifo and stash them until we have the whole batch
                 fifoBytes = self.getDataFromFIFO(fifoReadBytes)
-                samples.extend([self.unpackSample(fifoBytes[i:i + self.sampleSizeBytes])
-                                for i in range(0, len(fifoBytes), self.sampleSizeBytes)])
+                rawBatch[rawBatchBytes:rawBatchBytes + fifoReadBytes] = fifoBytes
+                rawBatchBytes += fifoReadBytes
+                samplesRead += samplesToRead
                 # track the count here so we can avoid going back to the FIFO each time
                 fifoBytesAvailable -= fifoReadBytes
                 logger.debug("End sample loop [available: %d , required: %d]", fifoBytesAvailable, self.sampleSizeBytes)
+        samples = self._toBatch(rawBatch[:rawBatchBytes])
+        self.telemetry.batchRead(len(samples), iterations, overdue)
         logger.debug("<< provideData %d samples", len(samples))
         return samples
 
+    def drain(self):
+        """
+        Reads everything currently available in the FIFO without waiting for more data to arrive, used when the FIFO
+        is drained by an AcquisitionScheduler which interleaves reads across several devices.
+        :return: a SampleBatch containing the samples read, this may be empty.
+        """
+        interrupt = self.getInterruptStatus()
+        fifoBytesAvailable = self.getFifoCount()
+        self.fifoPeakBytes = max(self.fifoPeakBytes, fifoBytesAvailable)
+        if interrupt & 0x10 or fifoBytesAvailable == MPU6050_FIFO_SIZE_BYTES:
+            logger.error("FIFO OVERFLOW, RESETTING [available: %d , interrupt: %d]", fifoBytesAvailable, interrupt)
+            self.measurementOverflowed = True
+            self.fifoOverflows += 1
+            self.telemetry.fifoOverflowed()
+            self.resetFifo()
+            fifoBytesAvailable = 0
+        samplesAvailable = fifoBytesAvailable // self.sampleSizeBytes
+        rawBatch = bytearray(samplesAvailable * self.sampleSizeBytes)
+        rawBatchBytes = 0
+        while rawBatchBytes < len(rawBatch):
+            fifoReadBytes = min(len(rawBatch) - rawBatchBytes, self.maxBytesPerFifoRead * self.sampleSizeBytes)
+            rawBatch[rawBatchBytes:rawBatchBytes + fifoReadBytes] = self.getDataFromFIFO(fifoReadBytes)
+            rawBatchBytes += fifoReadBytes
+        batch = self._toBatch(rawBatch)
+        self.telemetry.batchRead(len(batch), 1, False)
+        return batch
+
+    def getDrainInterval(self):
+        """
+        :return: the time it takes to fill a quarter of the FIFO, i.e. how often the FIFO should be drained.
+        """
+        return (MPU6050_FIFO_SIZE_BYTES / 4) / (self.fs * self.sampleSizeBytes)
+
+    def _toBatch(self, rawBatch):
+        """
+        Decodes the raw FIFO data into a SampleBatch.
+        :param rawBatch: the raw data.
+        :return: the batch.
+        """
+        startIdx = self._sampleIdx
+        valueColumns = self._getValueColumns()
+        return SampleBatch(self.unpackBatch(rawBatch),
+                           [SAMPLE_TIME] + [c[0] for c in valueColumns],
+                           self.fs,
+                           startIdx=startIdx,
+                           scales={c[0]: [c[1], c[2]] for c in valueColumns})
+
+    def getFifoStats(self):
+        """
+        :return: the peak FIFO fill since the last call and whether it overflowed in that time.
+        """
+        fill = self.fifoPeakBytes / MPU6050_FIFO_SIZE_BYTES
+        overflowed = self.fifoOverflows != self._reportedFifoOverflows
+        self.fifoPeakBytes = 0
+        self._reportedFifoOverflows = self.fifoOverflows
+        return fill, overflowed
+
+    def _getValueColumns(self):
+        """
+        describes each value in a sample (in FIFO order) along with the gain and offset that converts the raw value
+        into a real value.
+        :return: a list of (name, gain, offset) tuples.
+        """
+        columns = []
+        if self.isAccelerometerEnabled():
+            columns.extend([(axis, self._accelerationFactor, 0.0) for axis in [ACCEL_X, ACCEL_Y, ACCEL_Z]])
+        if self.isTemperatureEnabled():
+            columns.append((TEMP, self._temperatureGain, self._temperatureOffset))
+        if self.isGyroEnabled():
+            columns.extend([(axis, self._gyroFactor, 0.0) for axis in [GYRO_X, GYRO_Y, GYRO_Z]])
+        return columns
+
+    def unpackBatch(self, rawData):
+        """
+        unpacks a batch of samples in a single pass, this yields the same values as calling unpackSample on each sample
+        in turn.
+        :param rawData: the raw bytes read from the FIFO, must contain a whole number of samples.
+        :return: an ndarray of shape (samples, 1 + values per sample) where the first column is the sample time.
+        """
+        valuesPerSample = self.sampleSizeBytes // 2
+        counts = np.frombuffer(rawData, dtype='>i2').reshape(-1, valuesPerSample)
+        sampleCount = counts.shape[0]
+        valueColumns = self._getValueColumns()
+        gains = np.array([c[1] for c in valueColumns])
+        offsets = np.array([c[2] for c in valueColumns])
+        unpacked = np.empty((sampleCount, valuesPerSample + 1))
+        unpacked[:, 0] = np.arange(self._sampleIdx, self._sampleIdx + sampleCount) / self.fs
+        np.multiply(counts, gains, out=unpacked[:, 1:])
+        unpacked[:, 1:] += offsets
+        self._sampleIdx += sampleCount
+        return unpacked
+
     def unpackSample(self, rawData):
         """
         unpacks a single sample of data (where sample length is based on the currently enabled sensors).
@@ -612,16 +766,16 @@ class mpu6050(Accelerometer):
         try:
             logger.debug(">> selfTest")
             # enable self test on all axes and set range to +/-250
-            self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_GYRO_CONFIG, 0b11100000)
+            self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_GYRO_CONFIG, 0b11100000)
             # enable self test on all axes and set range to +/-8g
-            self.i2c_io.write(self.MPU6050_ADDRESS, self.MPU6050_RA_ACCEL_CONFIG, 0b11110000)
+            self.i2c_io.write(self.i2cAddress, self.MPU6050_RA_ACCEL_CONFIG, 0b11110000)
             # sleep to let the test run
             sleep(0.5)
             # read the resulting raw data
-            rawData = [self.i2c_io.read(self.MPU6050_ADDRESS, 0x0D),
-                       self.i2c_io.read(self.MPU6050_ADDRESS, 0x0E),
-                       self.i2c_io.read(self.MPU6050_ADDRESS, 0x0F),
-                       self.i2c_io.read(self.MPU6050_ADDRESS, 0x10)]
+            rawData = [self.i2c_io.read(self.i2cAddress, 0x0D),
+                       self.i2c_io.read(self.i2cAddress, 0x0E),
+                       self.i2c_io.read(self.i2cAddress, 0x0F),
+                       self.i2c_io.read(self.i2cAddress, 0x10)]
             # each value is a 5 bit unsigned int that packs in both gyro and acceleration results
             # acceleration is in bits 5-7
             acceleration = {
@@ -0,0 +1,202 @@
+import logging
+import time
+
+import numpy as np
+
+from .fifopacer import MPU6050_FIFO_SIZE_BYTES
+from .i2c_io import MockIoDataProvider
+from .mpu6050 import mpu6050, DEFAULT_TEMPERATURE_OFFSET, DEFAULT_TEMPERATURE_GAIN
+
+logger = logging.getLogger('recorder.replay')
+
+ACCEL_SENSITIVITY_BY_CONFIG = {0: 2, 8: 4, 16: 8, 24: 16}
+GYRO_SENSITIVITY_BY_CONFIG = {0: 250, 8: 500, 16: 1000, 24: 2000}
+
+
+class ReplayProvider(MockIoDataProvider):
+    """
+    A mock io provider which replays a recorded measurement through the mpu6050 register protocol. The FIFO fills in
+    line with wall clock time at the sample rate the device has been configured to use multiplied by the speed so the
+    reader sees realistic FIFO counts and, if it falls behind, a FIFO overflow. Samples that overflow the FIFO are lost
+    just as they would be on a real device. The recording is looped if the replay runs past the end of it.
+    """
+
+    def __init__(self, samples, speed=1.0, loop=True, clock=time.time, recordedFs=None):
+        """
+        :param samples: an ndarray of shape (samples, 3) or (samples, 6) holding acceleration (in g) and, optionally,
+        gyro (in deg/s) values.
+        :param speed: the multiple of real time at which to replay.
+        :param loop: whether to loop when the end of the recording is reached, the FIFO stops filling if not.
+        :param clock: the time source.
+        :param recordedFs: the sample rate of the recording, if known.
+        """
+        if samples.ndim != 2 or samples.shape[1] not in (3, 6):
+            raise ValueError('Replay data must have 3 or 6 columns, not ' + str(samples.shape))
+        if speed <= 0:
+            raise ValueError('Speed must be > 0')
+        self.samples = samples
+        self.speed = speed
+        self.loop = loop
+        self._clock = clock
+        self.recordedFs = recordedFs
+        self.fs = 500.0
+        self.fifoSensorMask = 0
+        self.sampleSizeBytes = 0
+        self._accelSensitivity = 2
+        self._gyroSensitivity = 500
+        self._counts = None
+        self._startTime = None
+        self._readIdx = 0
+        self._overflowed = False
+        self.overflows = 0
+        self.samplesLost = 0
+
+    @staticmethod
+    def fromFile(path, speed=1.0, loop=True, wavScale=1.0):
+        """
+        Loads the samples to replay from a data.out (csv of time, x, y, z and, optionally, further columns with the
+        gyro values in the last 3) or a wav file (where channels 1-3 are x, y and z, missing channels are zero).
+        :param path: the file.
+        :param speed: the multiple of real time at which to replay.
+        :param loop: whether to loop at the end of the recording.
+        :param wavScale: the acceleration, in g, represented by a full scale wav sample.
+        :return: the provider.
+        """
+        if path.lower().endswith('.wav'):
+            import soundfile as sf
+            data, fs = sf.read(path, always_2d=True)
+            samples = np.zeros((data.shape[0], 3))
+            channels = min(data.shape[1], 3)
+            samples[:, 0:channels] = data[:, 0:channels] * wavScale
+        else:
+            data = np.loadtxt(path, delimiter=',', ndmin=2)
+            fs = int(round(1 / (np.diff(data[:, 0]).mean()), 0))
+            if data.shape[1] >= 7:
+                samples = np.hstack((data[:, 1:4], data[:, -3:]))
+            else:
+                samples = data[:, 1:4]
+        logger.info("Loaded " + str(samples.shape[0]) + " samples at " + str(fs) + "Hz from " + path)
+        return ReplayProvider(samples, speed=speed, loop=loop, recordedFs=fs)
+
+    def write(self, register, val):
+        """
+        Tracks the device configuration written by the mpu6050.
+        :param register: the register.
+        :param val: the value.
+        """
+        if register == mpu6050.MPU6050_RA_SMPLRT_DIV:
+            self.fs = 8000.0 / (val + 1.0)
+            if self.recordedFs is not None and self.recordedFs != self.fs:
+                logger.warning("Replaying a " + str(self.recordedFs) + "Hz recording at " + str(self.fs) + "Hz")
+        elif register == mpu6050.MPU6050_RA_ACCEL_CONFIG:
+            self._accelSensitivity = ACCEL_SENSITIVITY_BY_CONFIG.get(val, self._accelSensitivity)
+            self._counts = None
+        elif register == mpu6050.MPU6050_RA_GYRO_CONFIG:
+            self._gyroSensitivity = GYRO_SENSITIVITY_BY_CONFIG.get(val, self._gyroSensitivity)
+            self._counts = None
+        elif register == mpu6050.MPU6050_RA_FIFO_EN:
+            self.fifoSensorMask = val
+            self.sampleSizeBytes = 0
+            if val & mpu6050.enableAccelerometerMask:
+                self.sampleSizeBytes += 6
+            if val & mpu6050.enableTemperatureMask:
+                self.sampleSizeBytes += 2
+            if val & mpu6050.enableGyroMask:
+                self.sampleSizeBytes += 6
+            self._counts = None
+        elif register == mpu6050.MPU6050_RA_USER_CTRL and val & 0b00000100:
+            self._resetFifo()
+
+    def _resetFifo(self):
+        """
+        Empties the FIFO, the replay continues from wherever wall clock time says it should be.
+        """
+        now = self._clock()
+        if self._startTime is None:
+            self._startTime = now
+        self._readIdx = self._producedSamples(now)
+        self._overflowed = False
+
+    def _producedSamples(self, now):
+        """
+        :param now: the time.
+        :return: the number of samples the device has produced since the replay started.
+        """
+        # the tolerance stops float error turning an exact number of samples into one less
+        produced = int((now - self._startTime) * self.fs * self.speed + 1e-6)
+        if not self.loop:
+            produced = min(produced, self.samples.shape[0])
+        return produced
+
+    def _availableSamples(self):
+        """
+        Updates the FIFO state from the wall clock, discarding samples if the FIFO has overflowed.
+        :return: the number of samples in the FIFO.
+        """
+        if self._startTime is None or self.sampleSizeBytes == 0:
+            return 0
+        produced = self._producedSamples(self._clock())
+        capacity = MPU6050_FIFO_SIZE_BYTES // self.sampleSizeBytes
+        available = produced - self._readIdx
+        if available > capacity:
+            lost = available - capacity
+            if not self._overflowed:
+                self.overflows += 1
+            self._overflowed = True
+            self.samplesLost += lost
+            self._readIdx += lost
+            available = capacity
+        return available
+
+    def provide(self, register, length=None):
+        if register is mpu6050.MPU6050_RA_INT_STATUS:
+            self._availableSamples()
+            status = 0x01
+            if self._overflowed:
+                status |= 0x10
+                self._overflowed = False
+            return status
+        elif register is mpu6050.MPU6050_RA_FIFO_COUNTH:
+            available = self._availableSamples()
+            count = MPU6050_FIFO_SIZE_BYTES if self._overflowed else available * self.sampleSizeBytes
+            return [count >> 8, count & 0xFF]
+        elif register is mpu6050.MPU6050_RA_FIFO_R_W:
+            return self._readFifo(length)
+        else:
+            if length is None:
+                return 0b00000000
+            else:
+                return [0] * length
+
+    def _readFifo(self, length):
+        """
+        Reads the next length bytes from the FIFO.
+        :param length: the no of bytes.
+        :return: the bytes.
+        """
+        sampleCount = length // self.sampleSizeBytes
+        idx = np.arange(self._readIdx, self._readIdx + sampleCount) % self.samples.shape[0]
+        self._readIdx += sampleCount
+        return self._getCounts()[idx].tobytes()
+
+    def _getCounts(self):
+        """
+        :return: the recording converted to the raw big endian values the FIFO would hold given the current
+        configuration.
+        """
+        if self._counts is None:
+            columns = []
+            if self.fifoSensorMask & mpu6050.enableAccelerometerMask:
+                columns.append(self.samples[:, 0:3] / (self._accelSensitivity / 32768.0))
+            if self.fifoSensorMask & mpu6050.enableTemperatureMask:
+                # a constant 25C
+                temp = (25.0 - DEFAULT_TEMPERATURE_OFFSET) / DEFAULT_TEMPERATURE_GAIN
+                columns.append(np.full((self.samples.shape[0], 1), temp))
+            if self.fifoSensorMask & mpu6050.enableGyroMask:
+                if self.samples.shape[1] == 6:
+                    columns.append(self.samples[:, 3:6] / (self._gyroSensitivity / 32768.0))
+                else:
+                    columns.append(np.zeros((self.samples.shape[0], 3)))
+            counts = np.hstack(columns) if columns else np.zeros((self.samples.shape[0], 0))
+            self._counts = np.clip(np.round(counts), -32768, 32767).astype('>i2')
+        return self._counts
@@ -0,0 +1,135 @@
+import logging
+import threading
+
+import numpy as np
+
+from core.batch import SampleBatch
+
+logger = logging.getLogger('recorder.ringbuffer')
+
+
+class SampleRingBuffer(object):
+    """
+    A fixed size ring buffer of samples which decouples the thread reading from the device from the thread passing
+    data to the handler. The writer never blocks, if the consumer falls so far behind that a batch does not fit then the
+    samples that do not fit are dropped and counted as an overrun. The storage is a single ndarray which is allocated on
+    the first write (when the number of columns is known) and reused for every subsequent measurement.
+    :var capacity: the number of samples the buffer can hold.
+    :var highWaterMark: the most samples held at any one time since the last reset.
+    :var overruns: the number of writes which did not entirely fit in the buffer.
+    :var droppedSamples: the number of samples lost to overruns.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        if self.capacity <= 0:
+            raise ValueError('capacity must be > 0')
+        self._storage = None
+        self._condition = threading.Condition()
+        self._columns = None
+        self._fs = None
+        self._scales = None
+        self._head = 0
+        self._size = 0
+        self._nextIdx = 0
+        self._closed = False
+        self.highWaterMark = 0
+        self.overruns = 0
+        self.droppedSamples = 0
+        self.samplesWritten = 0
+
+    def reset(self):
+        """
+        Empties the buffer and clears the stats ready for a new measurement.
+        """
+        with self._condition:
+            self._head = 0
+            self._size = 0
+            self._nextIdx = 0
+            self._closed = False
+            self.highWaterMark = 0
+            self.overruns = 0
+            self.droppedSamples = 0
+            self.samplesWritten = 0
+
+    def close(self):
+        """
+        Signals that no more data will be written, readers waiting for data wake up immediately.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        return self._size
+
+    def write(self, batch):
+        """
+        Copies the batch into the buffer.
+        :param batch: a SampleBatch.
+        :return: the number of samples that were dropped because the buffer was full.
+        """
+        count = len(batch)
+        if count == 0:
+            return 0
+        with self._condition:
+            if self._storage is None or self._storage.shape[1] != batch.samples.shape[1]:
+                logger.info("Allocating ring buffer for %d samples of %d columns", self.capacity,
+                            batch.samples.shape[1])
+                self._storage = np.empty((self.capacity, batch.samples.shape[1]), dtype=np.float64)
+            if self._size == 0:
+                self._nextIdx = batch.startIdx
+            self._columns = batch.columns
+            self._fs = batch.fs
+            self._scales = batch.scales
+            accepted = min(count, self.capacity - self._size)
+            tail = (self._head + self._size) % self.capacity
+            firstChunk = min(accepted, self.capacity - tail)
+            self._storage[tail:tail + firstChunk] = batch.samples[:firstChunk]
+            if accepted > firstChunk:
+                self._storage[0:accepted - firstChunk] = batch.samples[firstChunk:accepted]
+            self._size += accepted
+            self.samplesWritten += accepted
+            self.highWaterMark = max(self.highWaterMark, self._size)
+            dropped = count - accepted
+            if dropped > 0:
+                self.overruns += 1
+                self.droppedSamples += dropped
+                logger.error("Ring buffer overrun, dropped %d of %d samples", dropped, count)
+            self._condition.notify_all()
+            return dropped
+
+    def read(self, maxSamples=None, timeout=None, minSamples=1):
+        """
+        Takes data from the buffer, waiting for some to arrive if the buffer does not hold enough.
+        :param maxSamples: the most samples to return, defaults to everything available.
+        :param timeout: how long to wait for data, waits indefinitely (or until closed) if None.
+        :param minSamples: the number of samples to wait for, whatever is available is returned once closed.
+        :return: a SampleBatch holding a copy of the data or None if no data arrived in time.
+        """
+        with self._condition:
+            minSamples = min(max(int(minSamples), 1), self.capacity)
+            self._condition.wait_for(lambda: self._size >= minSamples or self._closed, timeout)
+            if self._size == 0:
+                return None
+            count = self._size if maxSamples is None else min(self._size, int(maxSamples))
+            firstChunk = min(count, self.capacity - self._head)
+            if firstChunk == count:
+                samples = self._storage[self._head:self._head + count].copy()
+            else:
+                samples = np.concatenate((self._storage[self._head:], self._storage[0:count - firstChunk]))
+            batch = SampleBatch(samples, self._columns, self._fs, startIdx=self._nextIdx, scales=self._scales)
+            self._head = (self._head + count) % self.capacity
+            self._size -= count
+            self._nextIdx += count
+            return batch
+
+    def getFillRatio(self):
+        """
+        :return: the proportion of the buffer in use at the high water mark.
+        """
+        return self.highWaterMark / self.capacity
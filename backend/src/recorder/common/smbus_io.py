@@ -1,6 +1,6 @@
-from smbus2 import SMBus
+from smbus2 import SMBus, i2c_msg
 
-from .i2c_io import i2c_io
+from .i2c_io import i2c_io, SMBUS_BLOCK_LIMIT
 
 
 class smbus_io(i2c_io):
@@ -8,8 +8,13 @@ class smbus_io(i2c_io):
     an implementation of i2c_io which talks over the smbus.
     """
 
-    def __init__(self, busId=1):
-        super().__init__()
+    def __init__(self, busId=1, maxReadBytes=1024):
+        """
+        :param busId: the bus to connect to.
+        :param maxReadBytes: the max no of bytes to read in a single combined transaction, set to 32 if the i2c
+        adapter does not support combined transactions.
+        """
+        super().__init__(maxReadBytes=maxReadBytes)
         self.bus = SMBus(bus=busId)
 
     """
@@ -17,18 +22,43 @@ class smbus_io(i2c_io):
     """
 
     def write(self, i2cAddress, register, val):
-        return self.bus.write_byte_data(i2cAddress, register, val)
+        with self.lock:
+            return self.bus.write_byte_data(i2cAddress, register, val)
+
+    """
+    Delegates to smbus.write_byte
+    """
+
+    def writeByte(self, i2cAddress, val):
+        with self.lock:
+            return self.bus.write_byte(i2cAddress, val)
 
     """
     Delegates to smbus.read_byte_data
     """
 
     def read(self, i2cAddress, register):
-        return self.bus.read_byte_data(i2cAddress, register)
+        with self.lock:
+            return self.bus.read_byte_data(i2cAddress, register)
 
     """
     Delegates to smbus.read_i2c_block_data
     """
 
     def readBlock(self, i2cAddress, register, length):
-        return self.bus.read_i2c_block_data(i2cAddress, register, length)
+        with self.lock:
+            return self.bus.read_i2c_block_data(i2cAddress, register, length)
+
+    """
+    Reads the data in a single combined transaction (i.e. a write of the register address followed by a read of length
+    bytes) via i2c_rdwr, this avoids the 32 byte limit imposed by an SMBus block read.
+    """
+
+    def readBulk(self, i2cAddress, register, length):
+        with self.lock:
+            if length <= SMBUS_BLOCK_LIMIT or self.maxReadBytes <= SMBUS_BLOCK_LIMIT:
+                return super().readBulk(i2cAddress, register, length)
+            write = i2c_msg.write(i2cAddress, [register])
+            read = i2c_msg.read(i2cAddress, length)
+            self.bus.i2c_rdwr(write, read)
+            return list(read)
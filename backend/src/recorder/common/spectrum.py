@@ -0,0 +1,210 @@
+import logging
+
+import numpy as np
+
+from core.batch import SampleBatch
+from core.handler import DataHandler
+from .accelerometer import ACCEL_X, ACCEL_Y, ACCEL_Z
+
+logger = logging.getLogger('recorder.spectrum')
+
+AXES = [('x', ACCEL_X), ('y', ACCEL_Y), ('z', ACCEL_Z)]
+
+
+def getSegmentLength(fs):
+    """
+    :param fs: the sample rate.
+    :return: the segment length the analyser uses for a signal of this sample rate, i.e. ~1Hz resolution.
+    """
+    return 1 << (int(fs) - 1).bit_length()
+
+
+def highPassPowerResponse(freqs, fs, f3=2, order=2):
+    """
+    The power response of the butterworth high pass the analyser applies via filtfilt before analysing a signal. The
+    digital filter is designed via the bilinear transform with prewarping so the magnitude response is known exactly,
+    filtfilt applies the filter twice so the power response is the square of the magnitude squared response.
+    :param freqs: the frequencies.
+    :param fs: the sample rate.
+    :param f3: the f3 of the filter.
+    :param order: the filter order.
+    :return: the power response at each frequency.
+    """
+    with np.errstate(divide='ignore'):
+        ratio = np.tan(np.pi * f3 / fs) / np.tan(np.pi * np.asarray(freqs) / fs)
+    magnitudeSquared = 1.0 / (1.0 + ratio ** (2 * order))
+    return magnitudeSquared ** 2
+
+
+class WelchAccumulator(object):
+    """
+    Accumulates a Welch estimate of a multichannel signal as it streams through. The signal is cut into hann windowed
+    segments which overlap by half, each segment is transformed and its power is added to a running sum (for the mean)
+    and a running max. The segment length, window, overlap and one sided scaling match those used by the analyser
+    (scipy.signal.welch and scipy.signal.spectrogram) so the results agree with an analysis of the full signal.
+    The analyser high passes the whole signal via filtfilt before analysing it (with detrend=False) which cannot be done
+    as the data streams through (and scipy is not available on the recorder) so the mean of each segment is removed
+    instead and the filter's power response is applied to the result. The two agree to within 1% above 5Hz, below
+    that (i.e. close to the 2Hz corner of the filter) the difference grows to a few %.
+    """
+
+    def __init__(self, fs, channels, segmentLength=None):
+        """
+        :param fs: the sample rate.
+        :param channels: the number of channels.
+        :param segmentLength: the segment length, defaults to the analyser's choice for the sample rate.
+        """
+        self.fs = fs
+        self.channels = channels
+        self.segmentLength = getSegmentLength(fs) if segmentLength is None else int(segmentLength)
+        self.step = self.segmentLength - self.segmentLength // 2
+        self.segments = 0
+        self.samples = 0
+        self._pending = np.empty((0, channels))
+        self._powerSum = None
+        self._powerMax = None
+
+    def accept(self, data):
+        """
+        Adds the data to the estimate.
+        :param data: an ndarray of shape (samples, channels).
+        """
+        self.samples += data.shape[0]
+        pending = np.concatenate((self._pending, data)) if self._pending.shape[0] > 0 else data
+        segmentCount = 0 if pending.shape[0] < self.segmentLength else \
+            (pending.shape[0] - self.segmentLength) // self.step + 1
+        if segmentCount > 0:
+            starts = np.arange(segmentCount) * self.step
+            # segments is (segment, sample, channel)
+            segments = pending[starts[:, None] + np.arange(self.segmentLength)]
+            power = self._power(segments, self.segmentLength)
+            if self._powerSum is None:
+                self._powerSum = power.sum(axis=0)
+                self._powerMax = power.max(axis=0)
+            else:
+                self._powerSum += power.sum(axis=0)
+                np.maximum(self._powerMax, power.max(axis=0), out=self._powerMax)
+            self.segments += segmentCount
+            pending = pending[segmentCount * self.step:]
+        self._pending = np.array(pending, copy=True)
+
+    @staticmethod
+    def _window(length):
+        """
+        :param length: the window length.
+        :return: a periodic hann window, as used by scipy.
+        """
+        return 0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(length) / length)
+
+    def _power(self, segments, length):
+        """
+        :param segments: the segments, of shape (segment, sample, channel).
+        :param length: the segment length.
+        :return: the unscaled power of each segment, of shape (segment, frequency, channel).
+        """
+        # removing the mean stands in for the high pass applied by the analyser, it stops the gravity component leaking
+        # into the low frequency bins but is not identical to it (see the class docstring)
+        detrended = segments - segments.mean(axis=1, keepdims=True)
+        spectrum = np.fft.rfft(detrended * self._window(length)[None, :, None], axis=1)
+        return spectrum.real ** 2 + spectrum.imag ** 2
+
+    def getResult(self, highPass=True):
+        """
+        Completes the estimate.
+        :param highPass: whether to apply the analyser's high pass filter response.
+        :return: the frequencies and, for each of psd, spectrum and peakSpectrum, an ndarray of shape (frequency,
+        channel) or None if no data was received.
+        """
+        if self.segments == 0:
+            if self._pending.shape[0] < 2:
+                return None
+            # the analyser uses a single segment of the whole signal when it is shorter than the segment length
+            length = self._pending.shape[0]
+            power = self._power(self._pending[None, :, :], length)[0]
+            powerMean, powerMax = power, power
+        else:
+            length = self.segmentLength
+            powerMean, powerMax = self._powerSum / self.segments, self._powerMax
+        window = self._window(length)
+        freqs = np.fft.rfftfreq(length, 1.0 / self.fs)
+        oneSided = np.full(freqs.shape[0], 2.0)
+        oneSided[0] = 1.0
+        if length % 2 == 0:
+            oneSided[-1] = 1.0
+        if highPass:
+            oneSided = oneSided * highPassPowerResponse(freqs, self.fs)
+        densityScale = (oneSided / (self.fs * (window ** 2).sum()))[:, None]
+        spectrumScale = (oneSided / (window.sum() ** 2))[:, None]
+        return freqs, {
+            'psd': powerMean * densityScale,
+            'spectrum': np.sqrt(powerMean * spectrumScale),
+            'peakSpectrum': np.sqrt(powerMax * spectrumScale)
+        }
+
+
+class SpectralSummariser(DataHandler):
+    """
+    A handler which accumulates a Welch estimate of each acceleration axis as the data streams through and sends the
+    result to the delegate (via handleSummary) when the measurement completes. The raw data is only passed on to the
+    delegate if includeRawData is set, this allows a long measurement to be analysed without shipping every sample.
+    """
+
+    def __init__(self, delegate, includeRawData=False, segmentLength=None):
+        self.name = delegate.name
+        self.delegate = delegate
+        self.includeRawData = includeRawData
+        self.segmentLength = segmentLength
+        self.accumulator = None
+        self._columnIdx = None
+
+    def start(self, measurementId):
+        self.accumulator = None
+        self._columnIdx = None
+        self.delegate.start(measurementId)
+
+    def handle(self, data):
+        if isinstance(data, SampleBatch):
+            self._accumulate(data)
+        else:
+            logger.warning("Ignoring unsupported data type " + str(type(data)) + " in spectral summary")
+        if self.includeRawData:
+            self.delegate.handle(data)
+
+    def _accumulate(self, batch):
+        if self.accumulator is None:
+            available = [(axis, column) for axis, column in AXES if column in batch.columns]
+            if len(available) == 0:
+                return
+            self._columnIdx = [(axis, batch.columns.index(column)) for axis, column in available]
+            self.accumulator = WelchAccumulator(batch.fs, len(self._columnIdx), segmentLength=self.segmentLength)
+        self.accumulator.accept(batch.samples[:, [idx for _, idx in self._columnIdx]])
+
+    def getSummary(self):
+        """
+        :return: the summary as a json friendly dict or None if there is no data.
+        """
+        if self.accumulator is None:
+            return None
+        result = self.accumulator.getResult()
+        if result is None:
+            return None
+        freqs, analyses = result
+        return {
+            'fs': self.accumulator.fs,
+            'segmentLength': self.accumulator.segmentLength,
+            'segments': self.accumulator.segments,
+            'samples': self.accumulator.samples,
+            'freqs': freqs.tolist(),
+            'axes': {
+                axis: {name: values[:, channel].tolist() for name, values in analyses.items()}
+                for channel, (axis, _) in enumerate(self._columnIdx)
+            }
+        }
+
+    def stop(self, measurementId, failureReason=None):
+        if failureReason is None:
+            summary = self.getSummary()
+            if summary is not None:
+                logger.info("Sending spectral summary of " + str(summary['samples']) + " samples for " + measurementId)
+                self.delegate.handleSummary(summary)
+        self.delegate.stop(measurementId, failureReason=failureReason)
@@ -0,0 +1,221 @@
+import collections
+import threading
+import time
+
+
+class AcquisitionTelemetry(object):
+    """
+    Collects metrics about how well a device is keeping up with the data it produces, both for the current (or last)
+    measurement and over a rolling window of recent activity. The device reports each i2c transaction, each FIFO count,
+    each batch read from the device and each batch passed to the handler.
+    """
+
+    def __init__(self, windowSeconds=10, clock=time.time):
+        """
+        :param windowSeconds: the length of the rolling window.
+        :param clock: the time source.
+        """
+        self.windowSeconds = windowSeconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._batches = collections.deque()
+        self._handled = collections.deque()
+        self._pendingReads = 0
+        self._pendingBytes = 0
+        self._pendingFifoPeak = 0
+        self.measurement = None
+        self.lastMeasurement = None
+
+    def startMeasurement(self, measurementId, nominalFs):
+        """
+        Starts collecting metrics for a new measurement.
+        :param measurementId: the measurement.
+        :param nominalFs: the sample rate the device should achieve.
+        """
+        with self._lock:
+            self.measurement = {
+                'measurementId': measurementId,
+                'startTime': self._clock(),
+                'endTime': None,
+                'nominalFs': nominalFs,
+                'samples': 0,
+                'batches': 0,
+                'i2cReads': 0,
+                'i2cBytes': 0,
+                'loopIterations': 0,
+                'fifoHighWaterBytes': 0,
+                'fifoOverflows': 0,
+                'overdueBatches': 0,
+                'handledBatches': 0,
+                'handlerTime': 0.0,
+                'maxHandlerTime': 0.0,
+                'status': None
+            }
+
+    def endMeasurement(self, status, ringBuffer=None):
+        """
+        Completes the current measurement.
+        :param status: the final status of the measurement.
+        :param ringBuffer: the ring buffer used by the measurement, if any.
+        """
+        with self._lock:
+            if self.measurement is not None:
+                self.measurement['endTime'] = self._clock()
+                self.measurement['status'] = status
+                if ringBuffer is not None:
+                    self.measurement['ringBufferHighWaterMark'] = ringBuffer.highWaterMark
+                    self.measurement['ringBufferOverruns'] = ringBuffer.overruns
+                self.lastMeasurement = self.measurement
+                self.measurement = None
+
+    def i2cRead(self, byteCount):
+        """
+        Records a single read transaction.
+        :param byteCount: the bytes read.
+        """
+        with self._lock:
+            self._pendingReads += 1
+            self._pendingBytes += byteCount
+            if self.measurement is not None:
+                self.measurement['i2cReads'] += 1
+                self.measurement['i2cBytes'] += byteCount
+
+    def fifoCount(self, count):
+        """
+        Records the number of bytes seen in the FIFO.
+        :param count: the count.
+        """
+        with self._lock:
+            self._pendingFifoPeak = max(self._pendingFifoPeak, count)
+            if self.measurement is not None:
+                self.measurement['fifoHighWaterBytes'] = max(self.measurement['fifoHighWaterBytes'], count)
+
+    def fifoOverflowed(self):
+        """
+        Records a FIFO overflow.
+        """
+        with self._lock:
+            if self.measurement is not None:
+                self.measurement['fifoOverflows'] += 1
+
+    def batchRead(self, samples, iterations, overdue):
+        """
+        Records a batch read from the device.
+        :param samples: the no of samples in the batch.
+        :param iterations: the no of times the read loop iterated to complete the batch.
+        :param overdue: true if the batch took too long to read.
+        """
+        now = self._clock()
+        with self._lock:
+            self._batches.append((now, samples, self._pendingReads, self._pendingBytes, iterations, overdue,
+                                  self._pendingFifoPeak))
+            self._pendingReads = 0
+            self._pendingBytes = 0
+            self._pendingFifoPeak = 0
+            self._expire(self._batches, now)
+            if self.measurement is not None:
+                self.measurement['samples'] += samples
+                self.measurement['batches'] += 1
+                self.measurement['loopIterations'] += iterations
+                if overdue:
+                    self.measurement['overdueBatches'] += 1
+
+    def batchHandled(self, elapsed):
+        """
+        Records the time taken by the handler to deal with a batch.
+        :param elapsed: the time taken in seconds.
+        """
+        now = self._clock()
+        with self._lock:
+            self._handled.append((now, elapsed))
+            self._expire(self._handled, now)
+            if self.measurement is not None:
+                self.measurement['handledBatches'] += 1
+                self.measurement['handlerTime'] += elapsed
+                self.measurement['maxHandlerTime'] = max(self.measurement['maxHandlerTime'], elapsed)
+
+    def _expire(self, events, now):
+        while len(events) > 0 and now - events[0][0] >= self.windowSeconds:
+            events.popleft()
+
+    @staticmethod
+    def _summarise(measurement, now):
+        """
+        Adds the derived rates to a measurement.
+        :param measurement: the measurement.
+        :param now: the current time, used if the measurement is still running.
+        :return: the measurement with the rates.
+        """
+        summary = dict(measurement)
+        end = measurement['endTime'] if measurement['endTime'] is not None else now
+        elapsed = end - measurement['startTime']
+        summary['elapsed'] = round(elapsed, 3)
+        summary['achievedFs'] = round(measurement['samples'] / elapsed, 3) if elapsed > 0 else 0.0
+        summary['i2cReadsPerSecond'] = round(measurement['i2cReads'] / elapsed, 3) if elapsed > 0 else 0.0
+        summary['i2cBytesPerSecond'] = round(measurement['i2cBytes'] / elapsed, 3) if elapsed > 0 else 0.0
+        batches = measurement['batches']
+        summary['loopIterationsPerBatch'] = round(measurement['loopIterations'] / batches, 3) if batches else 0.0
+        handled = measurement['handledBatches']
+        summary['meanHandlerTime'] = round(measurement['handlerTime'] / handled, 6) if handled else 0.0
+        return summary
+
+    def getRolling(self):
+        """
+        :return: the metrics over the rolling window.
+        """
+        now = self._clock()
+        with self._lock:
+            self._expire(self._batches, now)
+            self._expire(self._handled, now)
+            batches = list(self._batches)
+            handled = list(self._handled)
+        # rates are measured between the first and last batch in the window so the first batch only marks the start
+        span = batches[-1][0] - batches[0][0] if batches else 0.0
+        counted = batches[1:]
+        handlerTimes = [h[1] for h in handled]
+        return {
+            'windowSeconds': self.windowSeconds,
+            'batches': len(batches),
+            'achievedFs': round(sum(b[1] for b in counted) / span, 3) if span > 0 else 0.0,
+            'i2cReadsPerSecond': round(sum(b[2] for b in counted) / span, 3) if span > 0 else 0.0,
+            'i2cBytesPerSecond': round(sum(b[3] for b in counted) / span, 3) if span > 0 else 0.0,
+            'loopIterationsPerBatch': round(sum(b[4] for b in batches) / len(batches), 3) if batches else 0.0,
+            'overdueBatches': sum(1 for b in batches if b[5]),
+            'fifoHighWaterBytes': max((b[6] for b in batches), default=0),
+            'meanHandlerTime': round(sum(handlerTimes) / len(handlerTimes), 6) if handlerTimes else 0.0,
+            'maxHandlerTime': round(max(handlerTimes, default=0.0), 6)
+        }
+
+    def toDict(self):
+        """
+        :return: the current measurement (if any), the last measurement (if any) and the rolling metrics.
+        """
+        now = self._clock()
+        with self._lock:
+            current = self.measurement
+            last = self.lastMeasurement
+        return {
+            'current': self._summarise(current, now) if current is not None else None,
+            'last': self._summarise(last, now) if last is not None else None,
+            'rolling': self.getRolling()
+        }
+
+    def getSummary(self):
+        """
+        :return: the headline metrics for inclusion in the heartbeat.
+        """
+        rolling = self.getRolling()
+        with self._lock:
+            measurement = self.measurement if self.measurement is not None else self.lastMeasurement
+        summary = {
+            'achievedFs': rolling['achievedFs'],
+            'i2cBytesPerSecond': rolling['i2cBytesPerSecond'],
+            'fifoHighWaterBytes': rolling['fifoHighWaterBytes'],
+            'overdueBatches': rolling['overdueBatches'],
+            'maxHandlerTime': rolling['maxHandlerTime']
+        }
+        if measurement is not None:
+            summary['measurementId'] = measurement['measurementId']
+            summary['nominalFs'] = measurement['nominalFs']
+            summary['fifoOverflows'] = measurement['fifoOverflows']
+        return summary
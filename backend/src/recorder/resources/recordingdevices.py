@@ -120,3 +120,33 @@ class SelfTest(Resource):
         device = self.recordingDevices.get(deviceId)
         passed, results = device.performSelfTest()
         return results, 200 if passed else 500
+
+
+class Telemetry(Resource):
+    def __init__(self, **kwargs):
+        self.recordingDevices = kwargs['recordingDevices']
+
+    def get(self, deviceId):
+        """
+        provides the acquisition telemetry for the current (or last) measurement along with the rolling metrics and, if
+        the data is handled asynchronously, the handler coalescing and spool stats and, if the data is sent to the
+        analyser, the compression stats.
+        :param: deviceId the device id.
+        :return: the telemetry and 200 or 404 if the device is unknown.
+        """
+        device = self.recordingDevices.get(deviceId)
+        if device is None:
+            return None, 404
+        telemetry = device.telemetry.toDict()
+        if device.scheduler is not None:
+            telemetry['acquisition'] = device.scheduler.getStats().get(device.name)
+        if hasattr(device.dataHandler, 'getCoalescingStats'):
+            telemetry['handler'] = device.dataHandler.getCoalescingStats()
+            telemetry['spool'] = device.dataHandler.getSpoolStats()
+        # the poster is usually wrapped by other handlers
+        handler = device.dataHandler
+        while hasattr(handler, 'delegate'):
+            handler = handler.delegate
+        if hasattr(handler, 'getCompressionStats'):
+            telemetry['compression'] = handler.getCompressionStats()
+        return telemetry, 200
@@ -0,0 +1,109 @@
+import copy
+
+import numpy as np
+
+from analyser.common.datacache import MeasurementDataCache, sizeOf
+from analyser.common.signal import Signal, TriAxisSignal, loadTriAxisSignalFromDataFile
+from core.datafile import DataFileWriter, DATA_FILE_NAME
+
+
+def triAxis(samples):
+    return TriAxisSignal(x=Signal(np.zeros(samples), 500),
+                         y=Signal(np.zeros(samples), 500),
+                         z=Signal(np.zeros(samples), 500))
+
+
+def test_sizeIncludesCachedAnalysisButNotMappedData(tmpdir):
+    data = {'d1': triAxis(1000)}
+    assert sizeOf(data) == (3 * 8000, 0)
+    data['d1'].cache['analysis'] = {'x': (np.zeros(100), np.zeros(100))}
+    assert sizeOf(data) == (3 * 8000 + 1600, 0)
+    path = str(tmpdir.join('mapped.npy'))
+    np.save(path, np.zeros((2, 1000)))
+    mapped = np.load(path, mmap_mode='r')
+    assert sizeOf({'d2': Signal(np.asarray(mapped[0]), 500)}) == (0, 8000)
+
+
+def test_floatDataLoadedFromADataFileIsMapped(tmpdir):
+    path = str(tmpdir.join(DATA_FILE_NAME))
+    writer = DataFileWriter(path, ['time', 'ac_x', 'ac_y', 'ac_z'], 500)
+    samples = np.zeros((5000, 4))
+    samples[:, 0] = np.arange(5000) / 500
+    writer.append(samples)
+    writer.close()
+    cache = MeasurementDataCache(maxBytes=200000)
+    cache.get('first', lambda: {'d1': loadTriAxisSignalFromDataFile(path)})
+    cache.get('second', lambda: {'d1': loadTriAxisSignalFromDataFile(path)})
+    stats = cache.getStats()
+    assert stats['residentBytes'] == 0
+    assert stats['mappedBytes'] == 2 * 3 * 5000 * 4
+    assert stats['evictions'] == 0
+
+
+def test_int16DataLoadedFromADataFileCountsAgainstTheBudget(tmpdir):
+    path = str(tmpdir.join(DATA_FILE_NAME))
+    scales = {c: [1 / 16384, 0.0] for c in ['ac_x', 'ac_y', 'ac_z']}
+    writer = DataFileWriter(path, ['time', 'ac_x', 'ac_y', 'ac_z'], 500, scales=scales, encoding='int16')
+    samples = np.zeros((5000, 4))
+    samples[:, 0] = np.arange(5000) / 500
+    writer.append(samples)
+    writer.close()
+    cache = MeasurementDataCache(maxBytes=200000)
+    cache.get('first', lambda: {'d1': loadTriAxisSignalFromDataFile(path)})
+    stats = cache.getStats()
+    # the counts are scaled into float64 copies
+    assert stats['residentBytes'] == 3 * 5000 * 8
+    assert stats['mappedBytes'] == 0
+    # the second measurement takes the cache over budget so the first is evicted
+    cache.get('second', lambda: {'d1': loadTriAxisSignalFromDataFile(path)})
+    assert cache.getStats()['evictions'] == 1
+
+
+def test_leastRecentlyUsedIsEvictedOnceOverBudget():
+    cache = MeasurementDataCache(maxBytes=50000)
+    loads = []
+
+    def loader(key):
+        def load():
+            loads.append(key)
+            return {'d1': triAxis(1000)}
+
+        return load
+
+    first = cache.get('first', loader('first'))
+    cache.get('second', loader('second'))
+    # using first makes second the least recently used
+    assert cache.get('first', loader('first')) is first
+    cache.get('third', loader('third'))
+    assert loads == ['first', 'second', 'third']
+    stats = cache.getStats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 3
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+    assert stats['residentBytes'] == 48000
+    cache.get('first', loader('first'))
+    cache.get('second', loader('second'))
+    assert loads == ['first', 'second', 'third', 'second']
+
+
+def test_entryIsMeasuredAgainAsAnalysisIsAdded():
+    cache = MeasurementDataCache(maxBytes=50000)
+    first = cache.get('first', lambda: {'d1': triAxis(1000)})
+    cache.get('second', lambda: {'d1': triAxis(1000)})
+    assert cache.getStats()['entries'] == 2
+    cache.get('second', lambda: None)['d1'].cache['analysis'] = {'x': np.zeros(1000)}
+    # first is the least recently used so goes when second grows
+    cache.get('second', lambda: None)
+    assert cache.getStats()['entries'] == 1
+    assert cache.get('first', lambda: first) is first
+    # the most recently used entry is always kept even if it is over budget on its own
+    cache.setMaxBytes(1000)
+    assert cache.getStats()['entries'] == 1
+    cache.invalidate('first')
+    assert cache.getStats()['entries'] == 0
+
+
+def test_copiesShareTheCache():
+    cache = MeasurementDataCache()
+    assert copy.deepcopy({'cache': cache})['cache'] is cache
@@ -114,3 +114,28 @@ def test_measurementsAreScheduledForInitialisedDevices(deviceController, httpcli
     assert args[2]['json']['duration'] == 10
     assert 'at' in args[2]['json']
     assert args[2]['json']['at'] == startTime.strftime(DATETIME_FORMAT)
+
+
+def test_unresponsiveDevicesDoNotDelayScheduling(tmpdirPath, targetStateController):
+    from core.fanout import FanOut, FanOutStatus
+
+    class SlowHttpClient(RecordingHttpClient):
+        def put(self, url, **kwargs):
+            if url.startswith('slow'):
+                sleep(1)
+            return super().put(url, **kwargs)
+
+    controller = DeviceController(targetStateController, tmpdirPath, SlowHttpClient(),
+                                  maxAgeSeconds=DEVICE_MAX_AGE_SECONDS, fanOut=FanOut('test', deadlineSeconds=0.2))
+    try:
+        for name in ['slow', 'fast1', 'fast2']:
+            controller.accept(name, {'status': RecordingDeviceStatus.INITIALISED.name, 'serviceURL': name})
+        results = controller.scheduleMeasurement('next', 10, datetime.datetime.utcnow())
+        byId = {device.deviceId: result for device, result in results.items()}
+        assert byId['slow'].status is FanOutStatus.TIMEOUT
+        assert byId['fast1'].status is FanOutStatus.OK
+        assert byId['fast1'].value == 200
+        assert byId['fast1'].elapsed < 0.2
+        assert byId['fast2'].value == 200
+    finally:
+        controller.shutdown()
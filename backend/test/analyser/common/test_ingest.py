@@ -0,0 +1,188 @@
+import datetime
+import threading
+
+import pytest
+
+from analyser.common.ingest import IngestServer
+from analyser.common.measurementcontroller import ActiveMeasurement, DataStream, RecordStatus
+from analyser.common.targetstatecontroller import TargetState
+from core.batch import SampleBatch
+from core.compression import CompressionStats
+from core.handler import HttpPoster, DataHandler
+from core.httpclient import RecordingHttpClient
+from core.ingest import IngestClient
+
+
+class RecordingHandler(DataHandler):
+    def __init__(self):
+        self.events = []
+        self.threads = set()
+
+    def start(self, measurementId):
+        pass
+
+    def handle(self, data):
+        self.events.append(data)
+        self.threads.add(threading.current_thread().name)
+
+    def stop(self, measurementId, failureReason=None):
+        pass
+
+
+class StubMeasurementController(object):
+    """
+    Provides a stream for a single known measurement and device.
+    """
+
+    def __init__(self):
+        self.measurement = ActiveMeasurement('m1', datetime.datetime.utcnow(), 10, TargetState())
+        self.measurement.updateDeviceStatus('d1', RecordStatus.RECORDING)
+        self.handler = RecordingHandler()
+        self.lookups = 0
+
+    def openDataStream(self, measurementId, deviceId):
+        self.lookups += 1
+        if measurementId == self.measurement.id and deviceId == 'd1':
+            return DataStream(self.measurement, deviceId, self.handler)
+        return None
+
+
+@pytest.fixture
+def controller():
+    return StubMeasurementController()
+
+
+@pytest.fixture
+def server(controller):
+    server = IngestServer(controller, host='127.0.0.1', port=0, compressionStats=CompressionStats())
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_streamedBatchesAreHandledInOrderWithASingleLookup(server, controller, sampleBatches):
+    client = IngestClient('127.0.0.1', server.port)
+    client.open(controller.measurement.id, 'd1')
+    batches = sampleBatches.contiguous(20, signal='sine')
+    for batch in batches:
+        client.send(batch.toBinary(encoding='int16'))
+    reply = client.close()
+    assert reply == {'ok': True, 'batches': 20, 'ack': 20 * 125}
+    assert client.acknowledged == 20 * 125
+    assert controller.lookups == 1
+    assert [e.startIdx for e in controller.handler.events] == [b.startIdx for b in batches]
+    assert controller.handler.events[3].toRows() == batches[3].toRows()
+    assert controller.measurement.recordingDevices['d1']['count'] == 20 * 125
+    # the event loop is not blocked by the handler
+    assert 'IngestServer' not in controller.handler.threads
+    stats = server.getStats()
+    assert stats['streams'] == 1
+    assert stats['batches'] == 20
+
+
+def test_startFailsIfThePortIsInUse(server, controller):
+    clash = IngestServer(controller, host='127.0.0.1', port=server.port)
+    with pytest.raises(OSError):
+        clash.start()
+    # stopping a server that never started does nothing
+    clash.stop()
+
+
+def test_streamForUnknownMeasurementIsRefused(server):
+    client = IngestClient('127.0.0.1', server.port)
+    with pytest.raises(IOError):
+        client.open('unknown', 'd1')
+
+
+def test_posterStreamsCompressedBatches(server, controller, sampleBatches):
+    httpclient = RecordingHttpClient()
+    poster = HttpPoster('remote', 'http://127.0.0.1:8080', httpclient=httpclient, wireFormat='binary',
+                        encoding='int16', compressionLevel=6, streamPort=server.port)
+    poster.deviceName = 'd1'
+    poster.start(controller.measurement.id)
+    batches = sampleBatches.contiguous(10, signal='sine')
+    for batch in batches:
+        poster.handle(batch)
+    poster.stop(controller.measurement.id)
+    # only the start and complete go over http
+    assert [url.rsplit('/', 1)[-1] for _, url, _ in httpclient.record] == ['d1', 'complete']
+    assert [e.toRows() for e in controller.handler.events] == [b.toRows() for b in batches]
+    assert server.getStats()['batches'] == 10
+    assert poster.getCompressionStats()['ratio'] > 1
+
+
+def test_posterSendsOverHttpIfTheStreamCannotBeOpened(controller, sampleBatches):
+    httpclient = RecordingHttpClient()
+    server = IngestServer(controller, host='127.0.0.1', port=0)
+    server.start()
+    port = server.port
+    server.stop()
+    poster = HttpPoster('remote', 'http://127.0.0.1:8080', httpclient=httpclient, wireFormat='binary',
+                        streamPort=port)
+    poster.deviceName = 'd1'
+    poster.start('m1')
+    poster.handle(sampleBatches.contiguous(1, signal='sine')[0])
+    poster.stop('m1')
+    assert [url.rsplit('/', 1)[-1] for _, url, _ in httpclient.record] == ['d1', 'data', 'complete']
+
+
+class BreakingStream(object):
+    """
+    A stream which acknowledges the first few batches then fails.
+    """
+
+    def __init__(self, acknowledgeUpTo, failAfter):
+        self.acknowledgeUpTo = acknowledgeUpTo
+        self.failAfter = failAfter
+        self.acknowledged = 0
+        self.sent = 0
+
+    def send(self, payload):
+        if self.sent == self.failAfter:
+            raise ConnectionError('Stream closed by analyser')
+        self.sent += 1
+        self.acknowledged = min(self.sent * 125, self.acknowledgeUpTo)
+
+    def abort(self):
+        pass
+
+
+def test_posterResendsUnacknowledgedBatchesOverHttpWhenTheStreamFails(sampleBatches):
+    httpclient = RecordingHttpClient()
+    poster = HttpPoster('remote', 'http://127.0.0.1:8080', httpclient=httpclient, wireFormat='binary')
+    poster.deviceName = 'd1'
+    poster.start('m1')
+    # the target acknowledged the first 3 batches, handled nothing after that and broke when the 6th was sent
+    poster._stream = BreakingStream(3 * 125, 5)
+    batches = sampleBatches.contiguous(8, signal='sine')
+    for batch in batches:
+        poster.handle(batch)
+    poster.stop('m1')
+    resent = [SampleBatch.fromBinary(kwargs['data']).startIdx for _, url, kwargs in httpclient.record
+              if url.endswith('/data')]
+    assert resent == [b.startIdx for b in batches[3:]]
+    assert poster.dataResponseCode == [200] * 10
+
+
+def test_copiesOfThePosterResendOnlyTheirOwnUnacknowledgedBatches(sampleBatches):
+    import copy
+    httpclient = RecordingHttpClient()
+    poster = HttpPoster('remote', 'http://127.0.0.1:8080', httpclient=httpclient, wireFormat='binary')
+    # the recorder copies the poster for each device
+    posters = []
+    for device in ['d1', 'd2']:
+        poster.deviceName = device
+        posters.append(copy.copy(poster))
+    for p in posters:
+        p.start('m1')
+        p._stream = BreakingStream(125, 3)
+    batches = sampleBatches.contiguous(4, signal='sine')
+    for batch in batches:
+        for p in posters:
+            p.handle(batch)
+    for p in posters:
+        p.stop('m1')
+    for device in ['d1', 'd2']:
+        resent = [SampleBatch.fromBinary(kwargs['data']).startIdx for _, url, kwargs in httpclient.record
+                  if url.endswith('/' + device + '/data')]
+        assert resent == [b.startIdx for b in batches[1:]]
@@ -532,3 +532,58 @@ def trim_and_rename_deletes_old(measurementController):
 def rename_device_is_an_inplace_edit(measurementController):
     pass
 
+
+
+def test_streamedBatchesAreDeliveredInOrderAndGapsAreReported():
+    from analyser.common.measurementcontroller import ActiveMeasurement, DataStream
+    from core.batch import SampleBatch
+    import numpy as np
+    am = ActiveMeasurement('m1', datetime.datetime.utcnow(), 10, TargetState())
+    am.updateDeviceStatus('d1', RecordStatus.RECORDING)
+    handler = MagicMock()
+    stream = DataStream(am, 'd1', handler)
+    samples = np.arange(80, dtype=np.float64).reshape(-1, 4)
+
+    def batch(start, end):
+        return SampleBatch(samples[start:end], ['time', 'ac_x', 'ac_y', 'ac_z'], 500, startIdx=start)
+
+    stream.record(batch(4, 8), sequence=1)
+    assert handler.handle.call_count == 0
+    stream.record(batch(0, 4), sequence=0)
+    # a replayed batch is only passed on once
+    stream.record(batch(0, 4), sequence=0)
+    stream.record(batch(12, 20), sequence=3)
+    assert [c[0][0].startIdx for c in handler.handle.call_args_list] == [0, 4]
+    gaps = stream.flush()
+    assert gaps == [[8, 12]]
+    assert [c[0][0].startIdx for c in handler.handle.call_args_list] == [0, 4, 12]
+    assert am.recordingDevices['d1']['count'] == 16
+
+
+def test_completionIsDetectedAsSoonAsTheLastDeviceCompletes(measurementController, deviceController):
+    device = {'status': RecordingDeviceStatus.INITIALISED.name, 'serviceURL': 'hello'}
+    device.update(targetStateAsDict())
+    deviceController.accept('d1', device)
+    # a long measurement so only the completion of the device can move it to complete
+    startTime = datetime.datetime.utcnow()
+    measurementId = getMeasurementId(startTime, 'long')
+    accepted, message = measurementController.schedule('long', 3600, startTime, 'desc')
+    assert accepted
+    assert measurementController.startMeasurement(measurementId, 'd1')
+    assert measurementController.completeMeasurement(measurementId, 'd1')
+    sleep(0.05)
+    assert len(measurementController.getMeasurements(MeasurementStatus.COMPLETE)) == 1
+    assert measurementController.getMeasurement(measurementId, MeasurementStatus.COMPLETE) is not None
+
+
+def test_caretakerSleepsUntilTheNextDeadline(measurementController):
+    startTime = datetime.datetime.utcnow()
+    accepted, message = measurementController.schedule('later', 0.1, startTime + datetime.timedelta(seconds=0.2), 'desc')
+    assert accepted
+    # the earliest deadline is 1s after the measurement ends
+    deadlines = sorted(d[0] for d in measurementController._deadlines)
+    assert deadlines[0] == startTime + datetime.timedelta(seconds=1.3)
+    sleep(1.0)
+    assert len(measurementController.getMeasurements(MeasurementStatus.FAILED)) == 0
+    sleep(0.6)
+    assert len(measurementController.getMeasurements(MeasurementStatus.FAILED)) == 1
@@ -0,0 +1,53 @@
+import datetime
+
+from analyser.common.measurementcontroller import ActiveMeasurement
+from analyser.common.registry import MeasurementRegistry, ACTIVE, COMPLETE, FAILED
+from analyser.common.targetstatecontroller import TargetState
+
+START = datetime.datetime(2017, 1, 1, 12, 0, 0)
+
+
+def measurement(name, offset, duration=10):
+    return ActiveMeasurement(name, START + datetime.timedelta(seconds=offset), duration, TargetState())
+
+
+def test_measurementsAreFoundById():
+    registry = MeasurementRegistry()
+    first = measurement('first', 0)
+    second = measurement('second', 20)
+    registry.add(ACTIVE, first)
+    registry.add(ACTIVE, second)
+    assert registry.getById(first.id) is first
+    assert registry.getById(second.id, group=ACTIVE) is second
+    assert registry.getById(second.id, group=COMPLETE) is None
+    registry.move(first, COMPLETE)
+    assert registry.get(ACTIVE) == [second]
+    assert registry.getById(first.id, group=COMPLETE) is first
+    assert registry.getById(first.id, group=ACTIVE) is None
+    # a measurement that is no longer active is not moved again
+    registry.move(first, FAILED)
+    assert registry.get(FAILED) == []
+    assert registry.remove(COMPLETE, first.id) is first
+    assert registry.getById(first.id) is None
+
+
+def test_clashesAreFoundWithActiveMeasurements():
+    registry = MeasurementRegistry()
+    for idx in range(100):
+        registry.add(ACTIVE, measurement('m' + str(idx), idx * 20))
+    assert [m.name for m in registry.clashes(START + datetime.timedelta(seconds=505), 10)] == ['m25']
+    assert [m.name for m in registry.clashes(START + datetime.timedelta(seconds=505), 20)] == ['m26', 'm25']
+    assert registry.clashes(START + datetime.timedelta(seconds=511), 8) == []
+    assert registry.clashes(START - datetime.timedelta(seconds=20), 10) == []
+    assert [m.name for m in registry.clashes(START + datetime.timedelta(seconds=2000), 10)] == []
+    assert [m.name for m in registry.clashes(START + datetime.timedelta(seconds=1985), 10)] == ['m99']
+
+
+def test_readersKeepTheirSnapshot():
+    registry = MeasurementRegistry()
+    first = measurement('first', 0)
+    registry.add(ACTIVE, first)
+    active = registry.get(ACTIVE)
+    registry.move(first, FAILED)
+    assert active == [first]
+    assert registry.get(ACTIVE) == []
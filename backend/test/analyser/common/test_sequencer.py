@@ -0,0 +1,53 @@
+import numpy as np
+
+from analyser.common.sequencer import BatchSequencer
+from core.batch import SampleBatch
+
+SAMPLES = np.arange(400, dtype=np.float64).reshape(-1, 4)
+
+
+def batch(start, end):
+    return SampleBatch(SAMPLES[start:end], ['time', 'ac_x', 'ac_y', 'ac_z'], 500, startIdx=start)
+
+
+def test_batchesAreDeliveredInSampleOrder():
+    delivered = []
+    sequencer = BatchSequencer('test')
+    for start in [10, 30, 0, 20, 40]:
+        sequencer.accept(batch(start, start + 10), delivered.append)
+    assert [b.startIdx for b in delivered] == [0, 10, 20, 30, 40]
+    assert sequencer.heldBatches == 2
+    assert sequencer.flush(delivered.append) == []
+
+
+def test_duplicatesAreDroppedAndOverlapsAreTrimmed():
+    delivered = []
+    sequencer = BatchSequencer('test')
+    sequencer.accept(batch(0, 10), delivered.append)
+    sequencer.accept(batch(0, 10), delivered.append)
+    sequencer.accept(batch(5, 15), delivered.append)
+    assert [(b.startIdx, len(b)) for b in delivered] == [(0, 10), (10, 5)]
+    assert np.array_equal(delivered[1].samples, SAMPLES[10:15])
+    assert sequencer.duplicates == 1
+
+
+def test_gapIsSkippedOnceTooManyBatchesAreHeld():
+    delivered = []
+    sequencer = BatchSequencer('test', maxPendingBatches=2)
+    sequencer.accept(batch(0, 10), delivered.append)
+    for start in [20, 30, 40]:
+        sequencer.accept(batch(start, start + 10), delivered.append)
+    assert [b.startIdx for b in delivered] == [0, 20, 30, 40]
+    assert sequencer.gaps == [[10, 20]]
+    # the missing batch is too late to be used
+    sequencer.accept(batch(10, 20), delivered.append)
+    assert len(delivered) == 4
+
+
+def test_flushReleasesHeldBatchesAndReportsGaps():
+    delivered = []
+    sequencer = BatchSequencer('test')
+    for start in [0, 20, 50]:
+        sequencer.accept(batch(start, start + 10), delivered.append)
+    assert sequencer.flush(delivered.append) == [[10, 20], [30, 50]]
+    assert [b.startIdx for b in delivered] == [0, 20, 50]
@@ -115,3 +115,47 @@ def test_whenTriAxisTxtIsInDefaultFormat_IsReadCorrectly():
     assert measurement.tilt('y') is not None
     assert measurement.tilt('z') is not None
     assert measurement.tilt('woot') is None
+
+
+def test_whenTriAxisDataFileIsConverted_IsReadCorrectly(tmpdirPath):
+    import shutil
+    from core.datafile import convertCsvFile
+    csvPath = os.path.join(tmpdirPath, 'data.out')
+    shutil.copy(os.path.join(str(Path(__file__).resolve().parents[2]), 'tri_axis_sine_default.txt'), csvPath)
+    expected = ms.loadTriAxisSignalFromFile(csvPath)
+    measurement = ms.loadTriAxisSignalFromDataFile(convertCsvFile(csvPath))
+    for axis in ['x', 'y', 'z']:
+        assert measurement.cache['raw'][axis].fs == 48000
+        assert np.allclose(measurement.cache['raw'][axis].samples, expected.cache['raw'][axis].samples, atol=1e-6)
+
+
+def test_whenTriAxisTxtIsLoadedWithCache_SidecarIsUsedUntilTheFileChanges(tmpdirPath):
+    import glob
+    import shutil
+    from unittest.mock import patch
+    csvPath = os.path.join(tmpdirPath, 'data.out')
+    shutil.copy(os.path.join(str(Path(__file__).resolve().parents[2]), 'tri_axis_sine_default.txt'), csvPath)
+    expected = np.genfromtxt(csvPath, delimiter=',')
+    measurement = ms.loadTriAxisSignalFromFile(csvPath, cache=True)
+    assert measurement.cache['raw']['x'].fs == 48000
+    assert np.array_equal(measurement.cache['raw']['z'].samples, expected[:, 3])
+    assert len(glob.glob(csvPath + '.*.npy')) == 1
+    with patch('analyser.common.signal._parseDelimitedFile') as parse:
+        cached = ms.loadTriAxisSignalFromFile(csvPath, cache=True)
+        assert parse.call_count == 0
+    assert np.array_equal(cached.cache['raw']['y'].samples, expected[:, 2])
+    with open(csvPath, 'a') as f:
+        f.write('1.0,1.0,1.0,1.0\n')
+    reloaded = ms.loadTriAxisSignalFromFile(csvPath, cache=True)
+    assert reloaded.cache['raw']['x'].samples.shape[0] == expected.shape[0] + 1
+    assert len(glob.glob(csvPath + '.*.npy')) == 1
+
+
+def test_whenTxtHasMissingValues_ItIsStillRead(tmpdirPath):
+    csvPath = os.path.join(tmpdirPath, 'data.out')
+    with open(csvPath, 'w') as f:
+        f.write('0.0,1.0\n0.5,\n1.0,3.0\n')
+    measurement = ms.loadSignalFromDelimitedFile(csvPath)
+    assert measurement.fs == 2
+    assert measurement.samples[0] == 1.0
+    assert np.isnan(measurement.samples[1])
@@ -1,7 +1,12 @@
+import threading
+from unittest.mock import Mock
+
 import pytest
 
-from analyser.common.targetstatecontroller import _applyTargetState, TargetState
+from analyser.common.targetstatecontroller import _applyTargetState, TargetState, TargetStateController, \
+    TargetStateProvider
 from core.httpclient import RecordingHttpClient
+from core.reactor import Reactor
 
 
 def test_noChange_meansNoUpdate():
@@ -132,3 +137,35 @@ def test_deviceNotInTargetState_isPatched(deviceState):
         'samplesPerBatch': targetState.samplesPerBatch
     }
     assert patchedTargetState == args[2]['json']
+
+
+class BlockingHttpClient(RecordingHttpClient):
+    """
+    Holds every patch until released.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+        self.patched = threading.Event()
+
+    def patch(self, url, **kwargs):
+        self.released.wait(timeout=5)
+        response = super().patch(url, **kwargs)
+        self.patched.set()
+        return response
+
+
+def test_updateTargetStateDoesNotWaitForTheDevices():
+    httpclient = BlockingHttpClient()
+    deviceController = Mock()
+    deviceController.getDevices.return_value = [Mock(deviceId='d1', payload=loadDeviceDeltas()[0])]
+    controller = TargetStateController(TargetStateProvider(TargetState()), Reactor(), httpclient,
+                                       deviceController=deviceController)
+    controller.updateTargetState({'fs': 400})
+    assert controller.getTargetState().fs == 400
+    assert len(httpclient.record) == 0
+    httpclient.released.set()
+    assert httpclient.patched.wait(timeout=5)
+    assert httpclient.record[0][1] == 'hello'
+    assert httpclient.record[0][2]['json']['fs'] == 400
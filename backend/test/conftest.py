@@ -1,8 +1,11 @@
 import logging
 import shutil
 
+import numpy as np
 import pytest
 
+from core.batch import SampleBatch
+
 
 @pytest.fixture(scope="session", autouse=True)
 def logger():
@@ -19,3 +22,62 @@ def tmpdirPath(tmpdir):
     yield str(tmpdir)
     # required due to https://github.com/pytest-dev/pytest/issues/1120
     shutil.rmtree(str(tmpdir))
+
+
+class SampleBatchFactory(object):
+    """
+    Builds the SampleBatches used by the tests, i.e. a time column followed by some accelerometer axes.
+    """
+    AXES = ['ac_x', 'ac_y', 'ac_z']
+    # the scale of a count from the accelerometer and from the temperature sensor
+    COUNT_SCALE = [2 / 32768, 0.0]
+    TEMP_SCALE = [1 / 340, 36.53]
+
+    def make(self, startIdx=0, count=125, fs=500, signal='ramp', axes=3, temp=False, scales=None):
+        """
+        :param startIdx: the index of the first sample.
+        :param count: the no of samples.
+        :param fs: the sample rate.
+        :param signal: ramp (every value is unique, i.e. its position in the flattened values), random (random sensor
+        counts seeded by startIdx) or sine (slowly varying sensor counts which compress well).
+        :param axes: the no of accelerometer axes.
+        :param temp: if true, a temperature column (with a non zero offset) follows the axes.
+        :param scales: the scales of the batch, defaults to the sensor scales for random and sine and none for ramp.
+        :return: the batch.
+        """
+        columns = ['time'] + self.AXES[:axes] + (['temp'] if temp else [])
+        valueCount = len(columns) - 1
+        idx = np.arange(startIdx, startIdx + count)
+        samples = np.empty((count, len(columns)))
+        samples[:, 0] = idx / fs
+        if signal == 'ramp':
+            samples[:, 1:] = np.arange(startIdx * valueCount, (startIdx + count) * valueCount).reshape(-1, valueCount)
+            defaultScales = {}
+        else:
+            if signal == 'random':
+                counts = np.random.RandomState(startIdx).randint(-32768, 32767, size=(count, valueCount))
+            elif signal == 'sine':
+                t = idx / fs
+                shapes = [np.rint(800 * np.sin(2 * np.pi * 5 * t)), np.rint(200 * np.cos(2 * np.pi * 3 * t)),
+                          np.full(count, 16384)]
+                counts = np.column_stack([shapes[i % len(shapes)] for i in range(valueCount)])
+            else:
+                raise ValueError('Unknown signal ' + signal)
+            defaultScales = {c: self.TEMP_SCALE if c == 'temp' else self.COUNT_SCALE for c in columns[1:]}
+            samples[:, 1:] = counts * np.array([defaultScales[c][0] for c in columns[1:]]) + \
+                             np.array([defaultScales[c][1] for c in columns[1:]])
+        return SampleBatch(samples, columns, fs, startIdx=startIdx, scales=defaultScales if scales is None else scales)
+
+    def contiguous(self, count, samplesPerBatch=125, **kwargs):
+        """
+        :param count: the no of batches.
+        :param samplesPerBatch: the no of samples in each batch.
+        :param kwargs: passed to make.
+        :return: count batches which follow on from each other.
+        """
+        return [self.make(startIdx=i * samplesPerBatch, count=samplesPerBatch, **kwargs) for i in range(count)]
+
+
+@pytest.fixture
+def sampleBatches():
+    return SampleBatchFactory()
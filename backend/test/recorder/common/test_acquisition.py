@@ -0,0 +1,144 @@
+import threading
+import time
+
+from core.handler import DataHandler
+from core.interface import RecordingDeviceStatus
+from recorder.common.acquisition import AcquisitionScheduler
+from recorder.common.i2c_io import i2c_io, mock_io, mux_io
+from recorder.common.mpu6050 import mpu6050
+
+
+class AddressedFifos(i2c_io):
+    """
+    a bus with a FIFO, filling in real time, at each address which counts any transactions that overlap. Like smbus_io,
+    each transaction holds the lock.
+    """
+
+    def __init__(self, bytesPerSecond, addresses):
+        super().__init__(maxReadBytes=1024)
+        self.bytesPerSecond = bytesPerSecond
+        self.start = {address: None for address in addresses}
+        self.consumed = {address: 0 for address in addresses}
+        self.inUse = False
+        self.collisions = 0
+
+    def _enter(self):
+        self.lock.acquire()
+        if self.inUse:
+            self.collisions += 1
+        self.inUse = True
+        time.sleep(0.0001)
+
+    def _exit(self):
+        self.inUse = False
+        self.lock.release()
+
+    def _available(self, address):
+        if self.start[address] is None:
+            self.start[address] = time.time()
+        return int((time.time() - self.start[address]) * self.bytesPerSecond) - self.consumed[address]
+
+    def write(self, i2cAddress, register, val):
+        self._enter()
+        if register == mpu6050.MPU6050_RA_USER_CTRL and val & 0b00000100:
+            self.start[i2cAddress] = None
+            self.consumed[i2cAddress] = 0
+        self._exit()
+
+    def writeByte(self, i2cAddress, val):
+        pass
+
+    def read(self, i2cAddress, register):
+        self._enter()
+        self._exit()
+        return 0x01
+
+    def readBlock(self, i2cAddress, register, length):
+        self._enter()
+        try:
+            if register == mpu6050.MPU6050_RA_FIFO_COUNTH:
+                return min(self._available(i2cAddress), 1023).to_bytes(2, 'big')
+            else:
+                self.consumed[i2cAddress] += length
+                return [0] * length
+        finally:
+            self._exit()
+
+    def readBulk(self, i2cAddress, register, length):
+        return self.readBlock(i2cAddress, register, length)
+
+
+class CountingHandler(DataHandler):
+    def __init__(self):
+        self.samples = 0
+        self.nextIdx = 0
+        self.contiguous = True
+
+    def start(self, measurementId):
+        pass
+
+    def handle(self, data):
+        self.contiguous = self.contiguous and data.startIdx == self.nextIdx
+        self.nextIdx = data.endIdx
+        self.samples += len(data)
+
+    def stop(self, measurementId, failureReason=None):
+        pass
+
+
+def test_devicesOnOneBusAreDrainedByOneScheduler():
+    io = AddressedFifos(500 * 6, [0x68, 0x69])
+    scheduler = AcquisitionScheduler()
+    handlers = [CountingHandler(), CountingHandler()]
+    devices = [mpu6050(io, name='low', dataHandler=handlers[0], i2cAddress=0x68, scheduler=scheduler),
+               mpu6050(io, name='high', dataHandler=handlers[1], i2cAddress=0x69, scheduler=scheduler)]
+    threads = [threading.Thread(target=d.start, args=('m1', 0.5)) for d in devices]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for device, handler in zip(devices, handlers):
+        assert device.status == RecordingDeviceStatus.INITIALISED, device.failureCode
+        assert handler.samples >= 250
+        assert handler.contiguous
+    assert io.collisions == 0
+    stats = scheduler.getStats()
+    assert stats.keys() == {'low', 'high'}
+    for name in ['low', 'high']:
+        assert stats[name]['samples'] == handlers[0 if name == 'low' else 1].samples
+        assert stats[name]['drains'] > 1
+        assert stats[name]['samplesPerSecond'] > 0
+
+
+def test_drainReadsEverythingAvailable():
+    def provider(register, length=None):
+        if register is mpu6050.MPU6050_RA_INT_STATUS:
+            return 0x01
+        elif register is mpu6050.MPU6050_RA_FIFO_COUNTH:
+            return [0b0000, 0b1100]
+        elif register is mpu6050.MPU6050_RA_FIFO_R_W:
+            return [0b0000, 0b0001] * (length // 2)
+
+    mpu = mpu6050(mock_io(dataProvider=provider))
+    assert len(mpu.drain()) == 2
+
+
+def test_deviceUsesItsOwnAddress():
+    io = mock_io(dataProvider=lambda register, length=None: 0x01)
+    mpu6050(io, i2cAddress=0x69)
+    assert len(io.valuesWritten) > 0
+    assert all(v[0] == 0x69 for v in io.valuesWritten)
+
+
+def test_muxSelectsChannelOnlyWhenItChanges():
+    parent = mock_io()
+    first = mux_io(parent, 0)
+    second = mux_io(parent, 3)
+    first.write(0x68, 1, 2)
+    first.write(0x68, 1, 2)
+    second.write(0x68, 1, 2)
+    first.write(0x68, 1, 2)
+    assert parent.valuesWritten == [[0x70, None, 0b0001], [0x68, 1, 2], [0x68, 1, 2],
+                                    [0x70, None, 0b1000], [0x68, 1, 2],
+                                    [0x70, None, 0b0001], [0x68, 1, 2]]
+    assert first.lock is parent.lock
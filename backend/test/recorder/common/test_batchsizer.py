@@ -0,0 +1,63 @@
+import pytest
+from flask_restful import marshal
+
+from core.interface import recordingDeviceFields
+from recorder.common.batchsizer import AdaptiveBatchSizer
+from recorder.common.i2c_io import mock_io
+from recorder.common.mpu6050 import mpu6050
+
+
+def test_slowHandlerGrowsTheBatch():
+    sizer = AdaptiveBatchSizer()
+    # 0.2s batch taking 0.15s to handle
+    assert sizer.nextSize(100, 500, 100, 0.15) == 150
+
+
+def test_fastHandlerShrinksTheBatch():
+    sizer = AdaptiveBatchSizer()
+    assert sizer.nextSize(100, 500, 100, 0.001) == 90
+
+
+def test_handlerWithinBoundsKeepsTheBatch():
+    sizer = AdaptiveBatchSizer()
+    assert sizer.nextSize(100, 500, 100, 0.05) == 100
+
+
+def test_overflowShrinksTheBatchEvenIfTheHandlerIsSlow():
+    sizer = AdaptiveBatchSizer()
+    assert sizer.nextSize(100, 500, 100, 0.15, overflowed=True) == 50
+    assert sizer.nextSize(100, 500, 100, 0.15, fifoFill=0.9) == 50
+
+
+def test_batchIsBounded():
+    sizer = AdaptiveBatchSizer(minSeconds=0.1, maxSeconds=0.5)
+    assert sizer.nextSize(240, 500, 240, 1.0) == 250
+    assert sizer.nextSize(60, 500, 60, 0.0, overflowed=True) == 50
+    assert sizer.getBounds(500) == (50, 250)
+
+
+def test_invalidBoundsAreRejected():
+    with pytest.raises(ValueError):
+        AdaptiveBatchSizer(minSeconds=1.0, maxSeconds=0.5)
+
+
+def test_activeBatchSizeIsReportedAndResetBySettingSamplesPerBatch():
+    def provider(register, length=None):
+        if register is mpu6050.MPU6050_RA_INT_STATUS:
+            return 0x01
+
+    mpu = mpu6050(mock_io(dataProvider=provider), batchSizer=AdaptiveBatchSizer())
+    mpu._adaptBatchSize(125, 0.2)
+    assert mpu.samplesPerBatch == 125
+    assert mpu.activeSamplesPerBatch == 188
+    assert marshal(mpu, recordingDeviceFields)['activeSamplesPerBatch'] == 188
+    mpu.samplesPerBatch = 100
+    assert mpu.activeSamplesPerBatch == 100
+
+
+def test_fifoStatsAreResetWhenRead():
+    mpu = mpu6050(mock_io())
+    mpu.fifoPeakBytes = 768
+    mpu.fifoOverflows = 1
+    assert mpu.getFifoStats() == (0.75, True)
+    assert mpu.getFifoStats() == (0.0, False)
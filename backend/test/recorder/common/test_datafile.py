@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+
+from core.batch import SampleBatch
+from core.datafile import DataFile, DataFileWriter, convertCsvFile, convertMeasurements, DATA_FILE_NAME
+from core.handler import BinaryLogger
+
+COLUMNS = ['time', 'ac_x', 'ac_y', 'ac_z']
+SCALES = {'ac_x': [1 / 16384, 0.0], 'ac_y': [1 / 16384, 0.0], 'ac_z': [1 / 16384, 0.0]}
+
+
+def test_float32RoundTrip(tmpdirPath, sampleBatches):
+    path = os.path.join(tmpdirPath, DATA_FILE_NAME)
+    samples = sampleBatches.make(count=1000, signal='random').samples
+    writer = DataFileWriter(path, COLUMNS, 500)
+    writer.append(samples[:400])
+    writer.append(samples[400:])
+    writer.close()
+    dataFile = DataFile(path)
+    assert len(dataFile) == 1000
+    assert dataFile.fs == 500
+    assert dataFile.columns == COLUMNS
+    assert np.allclose(dataFile.column('time'), samples[:, 0])
+    assert np.allclose(dataFile.columnAt(2), samples[:, 2], atol=1e-6)
+    assert os.path.getsize(path) < 1000 * 3 * 4 + 200
+
+
+def test_int16IsLosslessForSensorCounts(tmpdirPath, sampleBatches):
+    path = os.path.join(tmpdirPath, DATA_FILE_NAME)
+    samples = sampleBatches.make(startIdx=100, count=500, signal='random').samples
+    writer = DataFileWriter(path, COLUMNS, 500, scales=SCALES, encoding='int16', startIdx=100)
+    writer.append(samples)
+    writer.close()
+    dataFile = DataFile(path)
+    assert dataFile.encoding == 'int16'
+    assert dataFile.scales == SCALES
+    assert np.array_equal(dataFile.column('ac_z'), samples[:, 3])
+    assert np.allclose(dataFile.time(), samples[:, 0])
+
+
+def test_floatColumnsAreMemoryMapped(tmpdirPath, sampleBatches):
+    from analyser.common.datacache import _isMapped
+    path = os.path.join(tmpdirPath, DATA_FILE_NAME)
+    samples = sampleBatches.make(count=1000, signal='random').samples
+    writer = DataFileWriter(path, COLUMNS, 500)
+    writer.append(samples)
+    writer.close()
+    dataFile = DataFile(path)
+    assert _isMapped(dataFile.column('ac_x'))
+    assert _isMapped(dataFile.columnAt(3))
+    int16Path = os.path.join(tmpdirPath, 'int16.bin')
+    writer = DataFileWriter(int16Path, COLUMNS, 500, scales=SCALES, encoding='int16')
+    writer.append(samples)
+    writer.close()
+    # int16 counts are scaled so are copied
+    assert not _isMapped(DataFile(int16Path).column('ac_x'))
+
+
+def test_int16FallsBackToFloat32WithoutScales(tmpdirPath):
+    writer = DataFileWriter(os.path.join(tmpdirPath, DATA_FILE_NAME), COLUMNS, 500, encoding='int16')
+    writer.close()
+    assert writer.encoding == 'float32'
+
+
+def test_unclosedFileIsReadable(tmpdirPath, sampleBatches):
+    path = os.path.join(tmpdirPath, DATA_FILE_NAME)
+    writer = DataFileWriter(path, COLUMNS, 500)
+    writer.append(sampleBatches.make(count=300, signal='random').samples)
+    writer._file.flush()
+    assert len(DataFile(path)) == 300
+    writer.close()
+
+
+def test_copyRangeStartsFromZero(tmpdirPath, sampleBatches):
+    path = os.path.join(tmpdirPath, DATA_FILE_NAME)
+    samples = sampleBatches.make(count=1000, signal='random').samples
+    writer = DataFileWriter(path, COLUMNS, 500)
+    writer.append(samples)
+    writer.close()
+    copyPath = os.path.join(tmpdirPath, 'copy.bin')
+    assert DataFile(path).copyRange(copyPath, 0.5, 1.0) == 251
+    copy = DataFile(copyPath)
+    assert len(copy) == 251
+    assert copy.time()[0] == 0
+    assert np.allclose(copy.column('ac_x'), samples[250:501, 1], atol=1e-6)
+
+
+def test_csvIsConverted(tmpdirPath, sampleBatches):
+    deviceDir = os.path.join(tmpdirPath, '20170101', '120000', 'd1')
+    os.makedirs(deviceDir)
+    csvPath = os.path.join(deviceDir, 'data.out')
+    samples = sampleBatches.make(count=2000, signal='random').samples
+    with open(csvPath, 'w') as f:
+        for row in samples.tolist():
+            f.write(','.join(repr(v) for v in row) + '\n')
+    assert convertMeasurements(tmpdirPath) == 1
+    dataPath = os.path.join(deviceDir, DATA_FILE_NAME)
+    assert os.path.getsize(csvPath) / os.path.getsize(dataPath) > 4
+    dataFile = DataFile(dataPath)
+    assert dataFile.fs == 500
+    assert np.allclose(dataFile.column('ac_y'), samples[:, 2], atol=1e-6)
+    # already converted
+    assert convertMeasurements(tmpdirPath, removeCsv=True) == 0
+    assert convertCsvFile(csvPath) == dataPath
+
+
+def test_binaryLoggerWritesBatches(tmpdirPath, sampleBatches):
+    logger = BinaryLogger('test', 'd1', tmpdirPath, encoding='int16')
+    logger.start('m1')
+    samples = sampleBatches.make(count=250, signal='random').samples
+    logger.handle(SampleBatch(samples[:125], COLUMNS, 500, scales=SCALES))
+    logger.handle(SampleBatch(samples[125:], COLUMNS, 500, startIdx=125, scales=SCALES))
+    logger.stop('m1')
+    dataFile = DataFile(os.path.join(tmpdirPath, 'm1', 'd1', DATA_FILE_NAME))
+    assert len(dataFile) == 250
+    assert np.array_equal(dataFile.column('ac_x'), samples[:, 1])
+
+
+def test_binaryLoggerWritesListsOfSamples(tmpdirPath, sampleBatches):
+    logger = BinaryLogger('test', 'd1', tmpdirPath)
+    logger.start('m1')
+    samples = sampleBatches.make(count=251, signal='random').samples
+    # a single sample is held until the sample rate can be worked out
+    logger.handle(samples[:1].tolist())
+    logger.handle(samples[1:125].tolist())
+    logger.handle(samples[125:250].tolist())
+    logger.handle(samples[250:].tolist())
+    logger.stop('m1')
+    dataFile = DataFile(os.path.join(tmpdirPath, 'm1', 'd1', DATA_FILE_NAME))
+    assert len(dataFile) == 251
+    assert dataFile.fs == 500
+    assert dataFile.columns == COLUMNS
+    assert np.allclose(dataFile.time(), samples[:, 0])
+    assert np.allclose(dataFile.column('ac_z'), samples[:, 3], atol=1e-6)
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from core.fanout import FanOut, FanOutStatus
+
+
+def test_callsAreMadeConcurrently():
+    fanOut = FanOut('test', maxWorkers=4, deadlineSeconds=2.0)
+    lock = threading.Lock()
+    active = [0, 0]
+
+    def call(target):
+        with lock:
+            active[0] += 1
+            active[1] = max(active)
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return target * 2
+
+    start = time.monotonic()
+    results = fanOut.run(call, range(8))
+    assert time.monotonic() - start < 0.35
+    assert active[1] == 4
+    assert {k: v.value for k, v in results.items()} == {i: i * 2 for i in range(8)}
+    assert all(r.status is FanOutStatus.OK and r.elapsed is not None for r in results.values())
+    assert fanOut.getStats()['calls'] == 8
+    fanOut.shutdown()
+
+
+def test_slowAndFailingCallsDoNotHoldUpTheOthers():
+    fanOut = FanOut('test', maxWorkers=4, deadlineSeconds=0.2)
+    release = threading.Event()
+
+    def call(target):
+        if target == 'slow':
+            release.wait(2)
+        elif target == 'broken':
+            raise ValueError('broken')
+        return target
+
+    start = time.monotonic()
+    results = fanOut.run(call, ['slow', 'broken', 'fine'])
+    assert time.monotonic() - start < 1.0
+    release.set()
+    assert results['slow'].status is FanOutStatus.TIMEOUT
+    assert results['broken'].status is FanOutStatus.FAILED
+    assert str(results['broken'].error) == 'broken'
+    assert results['fine'].status is FanOutStatus.OK
+    assert results['fine'].value == 'fine'
+    stats = fanOut.getStats()
+    assert stats['failures'] == 1
+    assert stats['timeouts'] == 1
+    fanOut.shutdown()
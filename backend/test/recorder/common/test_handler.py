@@ -125,3 +125,424 @@ def verifyCsv(tmpdirPath, useListVals=False):
         assert lines[0] == "d,b"
         for i in range(0, 100):
             assert lines[i + 1] == "d" + str(i) + ",b" + str(i)
+
+
+def test_sampleBatchBehavesLikeListOfLists(sampleBatches):
+    batch = sampleBatches.make(startIdx=6, count=2)
+    assert len(batch) == 2
+    assert list(batch) == [[0.012, 18.0, 19.0, 20.0], [0.014, 21.0, 22.0, 23.0]]
+    assert batch[1] == [0.014, 21.0, 22.0, 23.0]
+    sliced = batch[1:]
+    assert len(sliced) == 1
+    assert sliced.startIdx == 7
+    assert sliced.endIdx == 8
+    assert sliced.samples.base is batch.samples
+
+
+def test_sampleBatchSurvivesJsonRoundTrip(sampleBatches):
+    from flask import json
+    from core.batch import SampleBatch
+    batch = sampleBatches.make(startIdx=6, count=2, scales={'ac_x': [2 / 32768, 0.0]})
+    copied = SampleBatch.fromDict(json.loads(json.dumps(batch.toDict())))
+    assert copied.columns == batch.columns
+    assert copied.fs == batch.fs
+    assert copied.startIdx == batch.startIdx
+    assert copied.scales == batch.scales
+    assert copied.toRows() == batch.toRows()
+
+
+def test_httpSendsSampleBatchAsDict(sampleBatches):
+    http = HttpPoster("mpu6050", "http://localhost:8080/")
+    http.deviceName = 'mpu6050'
+    batch = sampleBatches.make(startIdx=2, count=2)
+    with mock.patch.object(http, '_doPut') as monkey:
+        http.start('starttest')
+        http.handle(batch)
+        monkey.assert_called_with("http://localhost:8080/api/1/measurements/starttest/mpu6050/data",
+                                  data=batch.toDict())
+
+
+def test_csvWritesEachRowOfSampleBatchToFile(tmpdirPath, sampleBatches):
+    outputDir = setupCsv(tmpdirPath)
+    logger = CSVLogger('owner', "csv", outputDir)
+    logger.start("starttest")
+    for batch in sampleBatches.contiguous(50, samplesPerBatch=2):
+        logger.handle(batch)
+    logger.stop("endtest")
+    with open(os.path.join(tmpdirPath, "test", "starttest", 'csv', 'data.out')) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 100
+    assert lines[6] == "0.012,18.0,19.0,20.0"
+    assert lines[7] == "0.014,21.0,22.0,23.0"
+
+
+def test_asyncHandlerReportsQueueDepth():
+    asyncHandler = AsyncHandler('test', MyHandler())
+    # not started so nothing is consumed
+    for i in range(0, 3):
+        asyncHandler.handle(makeEvent(i))
+    assert asyncHandler.getQueueDepth() == 3
+
+
+def test_sampleBatchSurvivesInt16BinaryRoundTripExactly(sampleBatches):
+    from core.batch import SampleBatch
+    batch = sampleBatches.make(startIdx=1000, signal='random', temp=True)
+    payload = batch.toBinary(encoding='int16')
+    copied = SampleBatch.fromBinary(payload)
+    assert copied.columns == batch.columns
+    assert copied.fs == batch.fs
+    assert copied.startIdx == batch.startIdx
+    assert copied.scales == batch.scales
+    assert copied.toRows() == batch.toRows()
+    # 2 bytes per value plus a small header
+    assert len(payload) < len(batch) * 4 * 2 + 150
+
+
+def test_sampleBatchSurvivesFloat32BinaryRoundTrip(sampleBatches):
+    import numpy as np
+    from core.batch import SampleBatch
+    batch = sampleBatches.make(startIdx=6, count=2)
+    copied = SampleBatch.fromBinary(batch.toBinary())
+    assert copied.columns == batch.columns
+    assert copied.startIdx == batch.startIdx
+    assert copied.scales == batch.scales
+    assert np.allclose(copied.samples, batch.samples)
+
+
+def test_int16FallsBackToFloat32WithoutScales(sampleBatches):
+    from core.batch import SampleBatch
+    # only ac_x has a scale so the values cannot be sent as counts
+    batch = sampleBatches.make(startIdx=6, count=2, scales={'ac_x': [2 / 32768, 0.0]})
+    assert SampleBatch.fromBinary(batch.toBinary(encoding='int16')).toRows() == batch.toRows()
+
+
+def test_truncatedBinaryPayloadIsRejectedAsInvalid(sampleBatches):
+    import pytest
+    from core.batch import BINARY_HEADER, SampleBatch
+    payload = sampleBatches.make(signal='random', temp=True).toBinary(encoding='int16')
+    # cut inside the column table and inside the body
+    for length in (BINARY_HEADER.size + 3, BINARY_HEADER.size + 20, len(payload) - 1):
+        with pytest.raises(ValueError):
+            SampleBatch.fromBinary(payload[:length])
+
+
+def test_httpSendsBinaryBatch(sampleBatches):
+    from core.batch import BINARY_CONTENT_TYPE, SampleBatch
+    from core.httpclient import RecordingHttpClient
+    client = RecordingHttpClient()
+    http = HttpPoster("mpu6050", "http://localhost:8080/", httpclient=client, wireFormat='binary', encoding='int16')
+    http.deviceName = 'mpu6050'
+    batch = sampleBatches.make(signal='random', temp=True)
+    http.start('starttest')
+    http.handle(batch)
+    method, url, kwargs = client.record[-1]
+    assert url == "http://localhost:8080/api/1/measurements/starttest/mpu6050/data"
+    assert kwargs['headers']['Content-Type'] == BINARY_CONTENT_TYPE
+    assert SampleBatch.fromBinary(kwargs['data']).toRows() == batch.toRows()
+    assert http.dataResponseCode == [200]
+
+
+def test_httpFallsBackToJsonWhenBinaryIsRejected(sampleBatches):
+    http = HttpPoster("mpu6050", "http://localhost:8080/", wireFormat='binary')
+    http.deviceName = 'mpu6050'
+    batch = sampleBatches.make(signal='random', temp=True)
+    with mock.patch.object(http, '_doPutBinary', return_value=400) as binary, \
+            mock.patch.object(http, '_doPut', return_value=200) as monkey:
+        http.start('starttest')
+        http.handle(batch)
+        http.handle(batch)
+        assert binary.call_count == 1
+        monkey.assert_called_with("http://localhost:8080/api/1/measurements/starttest/mpu6050/data",
+                                  data=batch.toDict())
+    assert http.wireFormat == 'json'
+    assert http.dataResponseCode == [200, 200]
+
+
+def test_asyncCoalescesBatchesWhenTheQueueBacksUp(sampleBatches):
+    import numpy as np
+    from core.batch import SampleBatch
+    logger = MyHandler()
+    asyncHandler = AsyncHandler('test', logger, coalesceThreshold=4, maxCoalescedSamples=1000)
+    batches = sampleBatches.contiguous(20)
+    # queue everything before the worker starts so the backlog is visible on the first get
+    for batch in batches:
+        asyncHandler.handle(batch)
+    asyncHandler.start('starttest')
+    asyncHandler.stop('endtest')
+    assert all(isinstance(e, SampleBatch) for e in logger.events)
+    # 20 batches of 125 are merged into batches of at most 1000 samples
+    assert [len(e) for e in logger.events] == [1000, 1000, 500]
+    assert np.array_equal(np.concatenate([e.samples for e in logger.events]),
+                          np.concatenate([b.samples for b in batches]))
+    assert [e.startIdx for e in logger.events] == [0, 1000, 2000]
+    stats = asyncHandler.getCoalescingStats()
+    assert stats['items'] == 20
+    assert stats['delegateCalls'] == 3
+    assert stats['coalescedCalls'] == 3
+    assert stats['ratio'] == 6.667
+
+
+def test_asyncDoesNotCoalesceBelowTheThreshold(sampleBatches):
+    logger = MyHandler()
+    asyncHandler = AsyncHandler('test', logger, coalesceThreshold=4)
+    for batch in sampleBatches.contiguous(3):
+        asyncHandler.handle(batch)
+    asyncHandler.start('starttest')
+    asyncHandler.stop('endtest')
+    assert [len(e) for e in logger.events] == [125, 125, 125]
+
+
+def test_asyncOnlyCoalescesContiguousBatchesWithinTheMaxDuration(sampleBatches):
+    logger = MyHandler()
+    asyncHandler = AsyncHandler('test', logger, coalesceThreshold=2, maxCoalescedSeconds=0.5)
+    batches = sampleBatches.contiguous(6)
+    # a gap before the 4th batch so it cannot be merged with the 3rd
+    batches[3].startIdx += 1
+    batches[4].startIdx += 1
+    batches[5].startIdx += 1
+    for batch in batches:
+        asyncHandler.handle(batch)
+    asyncHandler.handle(makeEvent(0))
+    asyncHandler.start('starttest')
+    asyncHandler.stop('endtest')
+    # 0.5s at 500Hz is 250 samples so at most 2 batches are merged
+    assert [(e.startIdx, len(e)) for e in logger.events[:-1]] == [(0, 250), (250, 125), (376, 250), (626, 125)]
+    assert logger.events[-1] == makeEvent(0)
+
+
+def test_asyncMarksANoneTakenWhileCoalescingAsDone(sampleBatches):
+    import threading
+    logger = MyHandler()
+    asyncHandler = AsyncHandler('test', logger, coalesceThreshold=2)
+    batches = sampleBatches.contiguous(4)
+    for batch in batches[:2]:
+        asyncHandler.handle(batch)
+    asyncHandler.handle(None)
+    for batch in batches[2:]:
+        asyncHandler.handle(batch)
+    asyncHandler.start('starttest')
+    stopper = threading.Thread(target=asyncHandler.stop, args=('endtest',), daemon=True)
+    stopper.start()
+    stopper.join(timeout=5)
+    assert not stopper.is_alive()
+    assert [(e.startIdx, len(e)) for e in logger.events] == [(0, 250), (250, 250)]
+
+
+def test_asyncDoesNotCoalesceWhenDisabled(sampleBatches):
+    logger = MyHandler()
+    asyncHandler = AsyncHandler('test', logger, coalesceThreshold=None)
+    for batch in sampleBatches.contiguous(10):
+        asyncHandler.handle(batch)
+    asyncHandler.start('starttest')
+    asyncHandler.stop('endtest')
+    assert len(logger.events) == 10
+    assert asyncHandler.getCoalescingStats()['ratio'] == 1.0
+
+
+def test_deltaEncodedBatchSurvivesRoundTripExactly(sampleBatches):
+    from core.batch import SampleBatch
+    batch = sampleBatches.make(startIdx=250, signal='random', temp=True)
+    copied = SampleBatch.fromBinary(batch.toBinary(encoding='int16', delta=True))
+    assert copied.startIdx == batch.startIdx
+    assert copied.toRows() == batch.toRows()
+
+
+def test_httpSendsCompressedBatch(sampleBatches):
+    import zlib
+    from core.batch import SampleBatch
+    from core.httpclient import RecordingHttpClient
+    client = RecordingHttpClient()
+    http = HttpPoster("mpu6050", "http://localhost:8080/", httpclient=client, wireFormat='binary', encoding='int16',
+                      compressionLevel=6)
+    http.deviceName = 'mpu6050'
+    batch = sampleBatches.make(count=500, signal='sine')
+    http.start('starttest')
+    http.handle(batch)
+    method, url, kwargs = client.record[-1]
+    assert kwargs['headers']['Content-Encoding'] == 'deflate'
+    assert SampleBatch.fromBinary(zlib.decompress(kwargs['data'])).toRows() == batch.toRows()
+    stats = http.getCompressionStats()
+    assert stats['payloads'] == 1
+    # delta encoding makes slowly varying counts very compressible
+    assert stats['ratio'] > 3
+    assert stats['encodedBytes'] == len(kwargs['data'])
+
+
+def test_httpSendsUncompressedBinaryWhenCompressionIsRejected(sampleBatches):
+    http = HttpPoster("mpu6050", "http://localhost:8080/", wireFormat='binary', compressionLevel=6)
+    http.deviceName = 'mpu6050'
+    batch = sampleBatches.make(signal='random', temp=True)
+    with mock.patch.object(http, '_doPutBinary', side_effect=[400, 200, 200]) as binary, \
+            mock.patch.object(http, '_doPut', return_value=200):
+        http.start('starttest')
+        http.handle(batch)
+        http.handle(batch)
+        assert binary.call_count == 3
+        binary.assert_called_with("http://localhost:8080/api/1/measurements/starttest/mpu6050/data",
+                                  batch.toBinary(), sequence=1)
+    assert http.compressionLevel is None
+    assert http.wireFormat == 'binary'
+    assert http.dataResponseCode == [200, 200]
+
+
+def test_httpPipelinesRequestsWithinTheWindow(sampleBatches):
+    import threading
+    import time
+    from core.batch import SampleBatch
+    from core.httpclient import RecordingHttpClient
+
+    class SlowClient(RecordingHttpClient):
+        def __init__(self):
+            super().__init__()
+            self.lock = threading.Lock()
+            self.active = 0
+            self.maxActive = 0
+
+        def put(self, url, **kwargs):
+            with self.lock:
+                self.active += 1
+                self.maxActive = max(self.maxActive, self.active)
+            time.sleep(0.02)
+            with self.lock:
+                self.active -= 1
+                return super().put(url, **kwargs)
+
+    client = SlowClient()
+    http = HttpPoster("mpu6050", "http://localhost:8080/", httpclient=client, wireFormat='binary', window=4)
+    http.deviceName = 'mpu6050'
+    http.start('starttest')
+    for i in range(12):
+        http.handle(sampleBatches.make(startIdx=i * 125, signal='random', temp=True))
+    http.stop('starttest')
+    assert client.maxActive == 4
+    assert http.dataResponseCode == [200] * 12
+    data = [kwargs for _, url, kwargs in client.record if url.endswith('/data')]
+    assert sorted(int(d['headers']['X-Vibe-Sequence']) for d in data) == list(range(12))
+    assert sorted(SampleBatch.fromBinary(d['data']).startIdx for d in data) == [i * 125 for i in range(12)]
+    # complete is only sent once every batch has been sent
+    assert client.record[-1][1].endswith('/complete')
+
+
+def test_csvWritesBatchesWithTheConfiguredPrecision(tmpdirPath):
+    import numpy as np
+    from core.batch import SampleBatch
+    outputDir = setupCsv(tmpdirPath)
+    logger = CSVLogger('owner', "csv", outputDir, precision=4)
+    logger.start("starttest")
+    logger.handle(SampleBatch(np.array([[0.002, 1 / 3, -2 / 3, 1.0]]), ['time', 'ac_x', 'ac_y', 'ac_z'], 500))
+    logger.stop("endtest")
+    with open(os.path.join(tmpdirPath, "test", "starttest", 'csv', 'data.out'), newline='') as f:
+        assert f.read() == "0.002,0.3333,-0.6667,1\r\n"
+    stats = logger.getStats()
+    assert stats['rows'] == 1
+    assert stats['bytes'] == 24
+    assert stats['mbPerSecond'] > 0
+
+
+def test_csvFlushesOnTheConfiguredInterval(tmpdirPath, sampleBatches):
+    outputDir = setupCsv(tmpdirPath)
+    now = [0.0]
+    logger = CSVLogger('owner', "csv", outputDir, flushInterval=1.0, fsync=True, clock=lambda: now[0])
+    logger.start("starttest")
+    path = os.path.join(tmpdirPath, "test", "starttest", 'csv', 'data.out')
+    logger.handle(sampleBatches.make(count=2))
+    assert os.path.getsize(path) == 0
+    now[0] = 1.0
+    logger.handle(sampleBatches.make(startIdx=2, count=2))
+    assert os.path.getsize(path) > 0
+    assert logger.getStats()['flushes'] == 1
+    logger.stop("endtest")
+
+
+def test_httpKeepsBinaryWhenALaterBatchIsRejected(sampleBatches):
+    http = HttpPoster("mpu6050", "http://localhost:8080/", wireFormat='binary')
+    http.deviceName = 'mpu6050'
+    batch = sampleBatches.make(signal='random', temp=True)
+    with mock.patch.object(http, '_doPutBinary', side_effect=[200, 400, 200]) as binary, \
+            mock.patch.object(http, '_doPut', return_value=200) as monkey:
+        http.start('starttest')
+        http.handle(batch)
+        http.handle(batch)
+        http.handle(batch)
+        assert binary.call_count == 3
+    assert http.wireFormat == 'binary'
+    assert http.dataResponseCode == [200, 400, 200]
+
+
+def test_httpFallsBackToJsonWhenBinaryIsUnsupported(sampleBatches):
+    http = HttpPoster("mpu6050", "http://localhost:8080/", wireFormat='binary')
+    http.deviceName = 'mpu6050'
+    batch = sampleBatches.make(signal='random', temp=True)
+    with mock.patch.object(http, '_doPutBinary', side_effect=[200, 415]), \
+            mock.patch.object(http, '_doPut', return_value=200):
+        http.start('starttest')
+        http.handle(batch)
+        http.handle(batch)
+    assert http.wireFormat == 'json'
+    assert http.dataResponseCode == [200, 200]
+
+
+def test_httpCopiesSendEachDevicesBatchesToItsOwnUrl(sampleBatches):
+    import copy
+    from core.batch import SampleBatch
+    from core.httpclient import RecordingHttpClient
+    client = RecordingHttpClient()
+    http = HttpPoster("mpu6050", "http://localhost:8080/", httpclient=client, wireFormat='binary', window=2)
+    # the recorder copies the poster for each device
+    posters = []
+    for device in ['d1', 'd2']:
+        http.deviceName = device
+        posters.append(copy.copy(http))
+    for poster in posters:
+        poster.start('starttest')
+    for batch in sampleBatches.contiguous(3, signal='random'):
+        for poster in posters:
+            poster.handle(batch)
+    for poster in posters:
+        poster.stop('starttest')
+    for device in ['d1', 'd2']:
+        sent = [SampleBatch.fromBinary(kwargs['data']).startIdx for _, url, kwargs in client.record
+                if url.endswith('/' + device + '/data')]
+        assert sent == [0, 125, 250]
+    assert [poster.dataResponseCode for poster in posters] == [[200] * 3, [200] * 3]
+
+
+def test_httpCreatesAPooledClientForEachPoster():
+    from core.httpclient import PooledHttpClient
+    first = HttpPoster("mpu6050", "http://localhost:8080/")
+    second = HttpPoster("mpu6050", "http://localhost:8080/")
+    assert isinstance(first.httpclient, PooledHttpClient)
+    assert first.httpclient is not second.httpclient
+
+
+def test_httpFallsBackToJsonOnceWhenRequestsAreInFlight(sampleBatches):
+    import threading
+    import time
+    from core.httpclient import RecordingHttpClient
+
+    class NoBinaryClient(RecordingHttpClient):
+        def __init__(self):
+            super().__init__()
+            self.lock = threading.Lock()
+
+        def put(self, url, **kwargs):
+            time.sleep(0.01)
+            with self.lock:
+                response = super().put(url, **kwargs)
+            if 'headers' in kwargs:
+                response.status_code = 415
+            return response
+
+    client = NoBinaryClient()
+    http = HttpPoster("mpu6050", "http://localhost:8080/", httpclient=client, wireFormat='binary',
+                      compressionLevel=6, window=4)
+    http.deviceName = 'mpu6050'
+    http.start('starttest')
+    for batch in sampleBatches.contiguous(8, signal='random'):
+        http.handle(batch)
+    http.stop('starttest')
+    assert http.wireFormat == 'json'
+    assert http.compressionLevel is None
+    assert http.dataResponseCode == [200] * 8
+    assert len([kwargs for _, url, kwargs in client.record if url.endswith('/data') and 'json' in kwargs]) == 8
+
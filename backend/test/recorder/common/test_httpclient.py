@@ -0,0 +1,141 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from core.httpclient import PooledHttpClient, RequestException
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server only provides this from python 3.7
+    daemon_threads = True
+
+
+class Server(object):
+    """
+    A keep alive http server which replies to each request with the next status code from a list.
+    """
+
+    def __init__(self, codes=None):
+        server = self
+        self.codes = list(codes) if codes is not None else []
+        self.requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self):
+                length = int(self.headers.get('Content-Length', 0))
+                if length > 0:
+                    self.rfile.read(length)
+                server.requests.append((self.command, self.path))
+                self.send_response(server.codes.pop(0) if len(server.codes) > 0 else 200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            do_GET = _reply
+            do_PUT = _reply
+            do_POST = _reply
+            do_PATCH = _reply
+            do_DELETE = _reply
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:' + str(self._server.server_address[1])
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def server():
+    s = Server()
+    yield s
+    s.close()
+
+
+def test_connectionsAreReused(server):
+    client = PooledHttpClient()
+    for i in range(10):
+        assert client.put(server.url + '/data', json='{}').status_code == 200
+    assert client.get(server.url + '/state').status_code == 200
+    stats = client.getStats()
+    assert stats['requests'] == 11
+    assert stats['connections'] == 1
+    assert stats['reuseRatio'] == pytest.approx(1 - 1 / 11, abs=1e-3)
+    assert len(server.requests) == 11
+
+
+def test_getIsRetriedOnServiceUnavailable(server):
+    server.codes = [503, 503]
+    sleeps = []
+    client = PooledHttpClient(sleeper=sleeps.append)
+    assert client.get(server.url + '/state').status_code == 200
+    assert client.retryCount == 2
+    assert sleeps == [0.1, 0.2]
+
+
+def test_putIsNotRetriedOnServiceUnavailable(server):
+    server.codes = [503]
+    client = PooledHttpClient(sleeper=lambda s: None)
+    assert client.put(server.url + '/data', json='{}').status_code == 503
+    assert client.retryCount == 0
+    assert len(server.requests) == 1
+
+
+def test_idempotentCallsAreRetriedWhenTheConnectionFails():
+    sleeps = []
+    client = PooledHttpClient(sleeper=sleeps.append, maxRetries=3, maxBackoffSeconds=0.3)
+    # nothing listens on port 1
+    with pytest.raises(RequestException):
+        client.put('http://127.0.0.1:1/data', json='{}')
+    assert sleeps == [0.1, 0.2, 0.3]
+    assert client.failureCount == 1
+
+
+def test_nonIdempotentCallsAreNotRetried():
+    sleeps = []
+    client = PooledHttpClient(sleeper=sleeps.append)
+    with pytest.raises(RequestException):
+        client.post('http://127.0.0.1:1/data', json='{}')
+    assert sleeps == []
+    assert client.requestCount == 1
+
+
+def test_putIsNotRetriedWhenTheConnectionIsAbortedAfterSending():
+    import socket
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(5)
+    received = []
+
+    def acceptAndDrop():
+        # reads each request then closes the connection without responding
+        while True:
+            try:
+                conn, addr = listener.accept()
+            except OSError:
+                return
+            received.append(conn.recv(65536))
+            conn.close()
+
+    threading.Thread(target=acceptAndDrop, daemon=True).start()
+    url = 'http://127.0.0.1:' + str(listener.getsockname()[1])
+    sleeps = []
+    client = PooledHttpClient(sleeper=sleeps.append)
+    try:
+        with pytest.raises(RequestException):
+            client.put(url + '/data', json='{}')
+        assert sleeps == []
+        assert len(received) == 1
+        # a GET is safe to repeat
+        with pytest.raises(RequestException):
+            client.get(url + '/state')
+        assert len(sleeps) == 2
+    finally:
+        listener.close()
@@ -164,6 +164,12 @@ def test_readSingleBatchWithSixBytesAvailableOnEachRead():
         lastTimestamp = timestamp
     assert fifoCounter == 125
     assert fifoReader == 125
+    assert output.columns == ['time', 'ac_x', 'ac_y', 'ac_z']
+    assert output.fs == mpu.fs
+    assert output.startIdx == 0
+    assert output.scales['ac_x'] == [mpu._accelerationFactor, 0.0]
+    # the next batch follows on from the last
+    assert mpu.provideData().startIdx == 125
 
 
 def test_readSingleBatchInOneTripToFifo():
@@ -308,3 +314,122 @@ def test_readSingleBatchWithVaryingFifoSizes():
             assert timestamp - lastTimestamp == pytest.approx(1/mpu.fs)
         lastTimestamp = timestamp
     # fifo size is randomly generated so can't verify the number of times we read it
+
+
+def test_unpackBatchMatchesUnpackSample():
+    import numpy as np
+    mpu = mpu6050(mock_io())
+    mpu.enableGyro()
+    mpu.enableTemperature()
+    rawData = np.random.randint(0, 256, size=mpu.sampleSizeBytes * 250, dtype=np.uint8).tobytes()
+    expected = [mpu.unpackSample(rawData[i:i + mpu.sampleSizeBytes])
+                for i in range(0, len(rawData), mpu.sampleSizeBytes)]
+    mpu._sampleIdx = 0
+    actual = mpu.unpackBatch(rawData)
+    assert actual.shape == (250, 8)
+    assert actual.tolist() == expected
+    assert mpu._sampleIdx == 250
+
+
+class TimedFifo(object):
+    """
+    emulates a FIFO that fills at the given rate in real time.
+    """
+
+    def __init__(self, bytesPerSecond):
+        import time
+        self.time = time.time
+        self.start = None
+        self.bytesPerSecond = bytesPerSecond
+        self.consumed = 0
+
+    def available(self):
+        if self.start is None:
+            self.start = self.time()
+        return int((self.time() - self.start) * self.bytesPerSecond) - self.consumed
+
+    def provide(self, register, length=None):
+        if register is mpu6050.MPU6050_RA_INT_STATUS:
+            return 0x01
+        elif register is mpu6050.MPU6050_RA_FIFO_COUNTH:
+            return min(self.available(), 1023).to_bytes(2, 'big')
+        elif register is mpu6050.MPU6050_RA_FIFO_R_W:
+            self.consumed += length
+            return [0] * length
+
+
+def test_pacedReadUsesFewerTransactionsPerSample():
+    from recorder.common.fifopacer import FifoPacer
+
+    def transactionsPerSample(pacer):
+        fifo = TimedFifo(500 * 6)
+        mpu = mpu6050(mock_io(dataProvider=fifo.provide), pacer=pacer)
+        mpu.i2cTransactions = 0
+        samples = sum(len(mpu.provideData()) for i in range(0, 2))
+        assert samples == 250
+        return mpu.i2cTransactions / samples
+
+    pacer = FifoPacer()
+    paced = transactionsPerSample(pacer)
+    unpaced = transactionsPerSample(None)
+    assert paced < unpaced / 2
+    assert pacer.sleeps > 0
+    assert pacer.polls > 0
+    assert pacer.getSleepPollRatio() > 0.5
+    assert pacer.bytesPerSecond == pytest.approx(3000, rel=0.25)
+
+
+def test_readSingleBatchInOneBulkRead():
+    fifoCounter = 0
+    fifoReader = 0
+
+    def provider(register, length=None):
+        if register is mpu6050.MPU6050_RA_INT_STATUS:
+            return 0x01
+        elif register is mpu6050.MPU6050_RA_FIFO_COUNTH:
+            nonlocal fifoCounter
+            fifoCounter += 1
+            return [0b0011, 0b11111100]
+        elif register is mpu6050.MPU6050_RA_FIFO_R_W:
+            nonlocal fifoReader
+            fifoReader += 1
+            assert length == 750
+            return [0b0000, 0b0001, 0b0010, 0b0011, 0b0100, 0b0101] * (length // 6)
+
+    mpu = mpu6050(mock_io(dataProvider=provider, maxReadBytes=1024))
+    output = mpu.provideData()
+    assert len(output) == 125
+    assert all(x[1:] == output[0][1:] for x in output)
+    assert fifoCounter == 1
+    assert fifoReader == 1
+
+
+def test_defaultBulkReadIsSplitIntoBlockReads():
+    from recorder.common.i2c_io import i2c_io
+
+    class BlockOnly(i2c_io):
+        def __init__(self):
+            super().__init__()
+            self.lengths = []
+
+        def readBlock(self, i2cAddress, register, length):
+            self.lengths.append(length)
+            return list(range(length))
+
+    io = BlockOnly()
+    assert io.readBulk(0x68, mpu6050.MPU6050_RA_FIFO_R_W, 70) == list(range(32)) + list(range(32)) + list(range(6))
+    assert io.lengths == [32, 32, 6]
+
+
+def test_bulkReadsUseFewerTransactionsPerSample():
+    def transactionsPerSample(maxReadBytes):
+        from recorder.common.fifopacer import FifoPacer
+        fifo = TimedFifo(1000 * 12)
+        mpu = mpu6050(mock_io(dataProvider=fifo.provide, maxReadBytes=maxReadBytes), pacer=FifoPacer(), fs=1000)
+        mpu.enableGyro()
+        mpu.i2cTransactions = 0
+        samples = len(mpu.provideData())
+        assert samples == 250
+        return mpu.i2cTransactions / samples
+
+    assert transactionsPerSample(1024) < transactionsPerSample(32) / 2
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+import pytest
+
+from recorder.common.i2c_io import mock_io
+from recorder.common.mpu6050 import mpu6050
+from recorder.common.replay import ReplayProvider
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def makeReplay(speed=1.0, loop=True, length=1000):
+    clock = FakeClock()
+    samples = np.zeros((length, 3))
+    samples[:, 0] = np.arange(length) / 1000.0
+    samples[:, 1] = 0.5
+    samples[:, 2] = -0.25
+    provider = ReplayProvider(samples, speed=speed, loop=loop, clock=clock)
+    mpu = mpu6050(mock_io(dataProvider=provider.provide, maxReadBytes=1024, writeHandler=provider.write))
+    return provider, mpu, clock
+
+
+def test_fifoFillsWithWallClockTimeAtTheReplaySpeed():
+    provider, mpu, clock = makeReplay(speed=10.0)
+    assert mpu.getFifoCount() == 0
+    clock.now += 0.01
+    # 500Hz * 10 * 0.01s = 50 samples of 6 bytes
+    assert mpu.getFifoCount() == 300
+
+
+def test_replayedValuesMatchTheRecording():
+    provider, mpu, clock = makeReplay()
+    clock.now += 0.25
+    batch = mpu.provideData()
+    assert len(batch) == 125
+    assert batch.samples[:, 1] == pytest.approx(np.arange(125) / 1000.0, abs=1e-4)
+    assert batch.samples[:, 2] == pytest.approx(np.full(125, 0.5), abs=1e-4)
+    assert batch.samples[:, 3] == pytest.approx(np.full(125, -0.25), abs=1e-4)
+    assert not mpu.measurementOverflowed
+
+
+def test_slowReaderOverflowsTheFifo():
+    provider, mpu, clock = makeReplay()
+    # 1024 bytes holds 170 samples, i.e. 0.34s at 500Hz
+    clock.now += 0.5
+    assert mpu.getInterruptStatus() & 0x10
+    assert mpu.getFifoCount() == 170 * 6
+    assert provider.overflows == 1
+    assert provider.samplesLost == 80
+
+
+def test_replayStopsAtTheEndIfNotLooping():
+    provider, mpu, clock = makeReplay(loop=False, length=100)
+    clock.now += 0.1
+    assert mpu.getFifoCount() == 50 * 6
+    mpu.getDataFromFIFO(50 * 6)
+    clock.now += 0.1
+    assert mpu.getFifoCount() == 50 * 6
+    mpu.getDataFromFIFO(50 * 6)
+    clock.now += 0.1
+    assert mpu.getFifoCount() == 0
+
+
+def test_canLoadDataOut(tmpdir):
+    path = os.path.join(str(tmpdir), 'data.out')
+    with open(path, 'w') as f:
+        for i in range(10):
+            f.write(','.join([str(i / 500), '0.1', '0.2', '0.3']) + '\n')
+    provider = ReplayProvider.fromFile(path)
+    assert provider.recordedFs == 500
+    assert provider.samples.shape == (10, 3)
+    assert provider.samples[0].tolist() == [0.1, 0.2, 0.3]
+
+
+def test_canLoadWav():
+    provider = ReplayProvider.fromFile(os.path.join(os.path.dirname(__file__), '..', '..', 'full_scale_sine.wav'),
+                                       wavScale=2.0)
+    assert provider.recordedFs == 48000
+    assert provider.samples.shape == (9600, 3)
+    assert np.abs(provider.samples[:, 0]).max() == pytest.approx(2.0, abs=0.01)
+    assert np.all(provider.samples[:, 1:] == 0)
@@ -0,0 +1,124 @@
+import time
+
+from core.handler import DataHandler
+from core.interface import RecordingDeviceStatus
+from recorder.common.accelerometer import Accelerometer
+from recorder.common.ringbuffer import SampleRingBuffer
+
+
+def test_readReturnsWhatWasWritten(sampleBatches):
+    buffer = SampleRingBuffer(10)
+    assert buffer.write(sampleBatches.make(startIdx=0, count=4, axes=1)) == 0
+    assert buffer.write(sampleBatches.make(startIdx=4, count=3, axes=1)) == 0
+    assert len(buffer) == 7
+    batch = buffer.read()
+    assert batch.startIdx == 0
+    assert batch.columns == ['time', 'ac_x']
+    assert batch.fs == 500
+    assert batch.samples[:, 1].tolist() == list(range(7))
+    assert len(buffer) == 0
+    assert buffer.highWaterMark == 7
+
+
+def test_readWrapsAroundTheEndOfTheBuffer(sampleBatches):
+    buffer = SampleRingBuffer(10)
+    buffer.write(sampleBatches.make(startIdx=0, count=8, axes=1))
+    assert buffer.read(maxSamples=6).samples[:, 1].tolist() == list(range(6))
+    buffer.write(sampleBatches.make(startIdx=8, count=7, axes=1))
+    batch = buffer.read()
+    assert batch.startIdx == 6
+    assert batch.samples[:, 1].tolist() == list(range(6, 15))
+    assert buffer.overruns == 0
+
+
+def test_overrunDropsTheSamplesThatDoNotFit(sampleBatches):
+    buffer = SampleRingBuffer(10)
+    buffer.write(sampleBatches.make(startIdx=0, count=8, axes=1))
+    assert buffer.write(sampleBatches.make(startIdx=8, count=5, axes=1)) == 3
+    assert buffer.overruns == 1
+    assert buffer.droppedSamples == 3
+    assert buffer.highWaterMark == 10
+    assert buffer.getFillRatio() == 1.0
+    assert buffer.read().samples[:, 1].tolist() == list(range(10))
+
+
+def test_readTimesOutWhenEmpty():
+    buffer = SampleRingBuffer(10)
+    assert buffer.read(timeout=0.01) is None
+
+
+def test_readReturnsNoneOnceClosedAndDrained(sampleBatches):
+    buffer = SampleRingBuffer(10)
+    buffer.write(sampleBatches.make(startIdx=0, count=2, axes=1))
+    buffer.close()
+    assert len(buffer.read()) == 2
+    assert buffer.read() is None
+
+
+def test_resetClearsStatsButKeepsStorage(sampleBatches):
+    buffer = SampleRingBuffer(10)
+    buffer.write(sampleBatches.make(startIdx=0, count=12, axes=1))
+    storage = buffer._storage
+    buffer.close()
+    buffer.reset()
+    assert len(buffer) == 0
+    assert buffer.overruns == 0
+    assert buffer.droppedSamples == 0
+    assert buffer.highWaterMark == 0
+    assert not buffer.closed
+    buffer.write(sampleBatches.make(startIdx=0, count=1, axes=1))
+    assert buffer._storage is storage
+
+
+class FakeAccelerometer(Accelerometer):
+    def __init__(self, handler, sampleBatches, bufferSeconds=30):
+        super().__init__(fs=500, samplesPerBatch=25, dataHandler=handler, bufferSeconds=bufferSeconds)
+        self._sampleBatches = sampleBatches
+
+    def initialiseDevice(self):
+        pass
+
+    def provideData(self):
+        time.sleep(0.05)
+        batch = self._sampleBatches.make(startIdx=self._sampleIdx, count=25, axes=1)
+        self._sampleIdx += 25
+        return batch
+
+
+class SlowHandler(DataHandler):
+    def __init__(self, delay):
+        self.delay = delay
+        self.samples = []
+        self.failureCode = None
+
+    def start(self, measurementId):
+        pass
+
+    def handle(self, data):
+        time.sleep(self.delay)
+        self.samples.extend(data.samples[:, 1].tolist())
+
+    def stop(self, measurementId, failureReason=None):
+        self.failureCode = failureReason
+
+
+def test_slowHandlerDoesNotLoseData(sampleBatches):
+    handler = SlowHandler(0.15)
+    device = FakeAccelerometer(handler, sampleBatches)
+    device.start('slow', durationInSeconds=0.5)
+    assert device.status == RecordingDeviceStatus.INITIALISED
+    assert handler.failureCode is None
+    assert len(handler.samples) >= 250
+    assert handler.samples == list(range(len(handler.samples)))
+    assert device.ringBuffer.overruns == 0
+    assert device.ringBuffer.highWaterMark > 25
+
+
+def test_handlerTooSlowForBufferFailsMeasurement(sampleBatches):
+    handler = SlowHandler(0.5)
+    device = FakeAccelerometer(handler, sampleBatches, bufferSeconds=0.1)
+    device.start('tooslow', durationInSeconds=0.5)
+    # the device is reinitialised after a failure so the failure is visible via the failureCode
+    assert device.failureCode.startswith('Ring buffer overrun')
+    assert device.ringBuffer.overruns > 0
+    assert handler.failureCode.startswith('Ring buffer overrun')
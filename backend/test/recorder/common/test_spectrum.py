@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from analyser.common.signal import Signal, loadTriAxisSignalFromSummary
+from core.batch import SampleBatch
+from core.handler import CSVLogger
+from recorder.common.spectrum import WelchAccumulator, SpectralSummariser, highPassPowerResponse
+
+FS = 500
+
+
+def makeSignal(seconds=20, seed=1):
+    """
+    :return: gravity on z plus a tone and some noise on each axis.
+    """
+    rng = np.random.RandomState(seed)
+    t = np.arange(seconds * FS) / FS
+    x = 0.05 * np.sin(2 * np.pi * 40 * t) + rng.normal(0, 0.01, t.shape[0])
+    y = 0.02 * np.sin(2 * np.pi * 75.5 * t) + rng.normal(0, 0.01, t.shape[0])
+    z = 1.0 + 0.03 * np.sin(2 * np.pi * 120 * t) + rng.normal(0, 0.01, t.shape[0])
+    return t, np.column_stack((x, y, z))
+
+
+def stream(accumulator, data, batchSize=125):
+    for i in range(0, data.shape[0], batchSize):
+        accumulator.accept(data[i:i + batchSize])
+
+
+def test_highPassResponseMatchesTheAnalysersFilter():
+    from scipy import signal
+    b, a = signal.butter(2, 2 / (0.5 * FS), btype='high')
+    freqs = np.linspace(0.5, 250, 100)
+    _, h = signal.freqz(b, a, worN=freqs, fs=FS)
+    assert highPassPowerResponse(freqs, FS) == pytest.approx(np.abs(h) ** 4, rel=1e-6, abs=1e-12)
+
+
+def test_unfilteredResultMatchesScipyWelchExactly():
+    from scipy import signal
+    _, data = makeSignal(seconds=5)
+    accumulator = WelchAccumulator(FS, 3)
+    stream(accumulator, data, batchSize=77)
+    freqs, result = accumulator.getResult(highPass=False)
+    detrended = data - data.mean(axis=0)
+    for channel in range(3):
+        # scipy detrends each segment when detrend is constant which is what the accumulator does
+        f, psd = signal.welch(detrended[:, channel], FS, nperseg=512, detrend='constant')
+        assert freqs == pytest.approx(f)
+        assert result['psd'][:, channel] == pytest.approx(psd, rel=1e-9, abs=1e-15)
+        f, spec = signal.welch(detrended[:, channel], FS, nperseg=512, detrend='constant', scaling='spectrum')
+        assert result['spectrum'][:, channel] == pytest.approx(np.sqrt(spec), rel=1e-9, abs=1e-15)
+        f, _, sxx = signal.spectrogram(detrended[:, channel], FS, window='hann', nperseg=512, noverlap=256,
+                                       detrend='constant', scaling='spectrum')
+        assert result['peakSpectrum'][:, channel] == pytest.approx(np.sqrt(sxx.max(axis=-1)), rel=1e-9, abs=1e-15)
+    assert accumulator.segments == (data.shape[0] - 512) // 256 + 1
+
+
+def test_resultIsConsistentWithTheAnalyser():
+    _, data = makeSignal()
+    accumulator = WelchAccumulator(FS, 3)
+    stream(accumulator, data)
+    freqs, result = accumulator.getResult()
+    # the per segment mean removal and the filtfilt edge effects only differ near the 2Hz corner
+    near = freqs > 3
+    above = freqs > 5
+    for channel in range(3):
+        hp = Signal(data[:, channel], fs=FS).highPass()
+        f, spec = hp.spectrum()
+        assert freqs == pytest.approx(f)
+        assert result['spectrum'][near, channel] == pytest.approx(spec[near], rel=0.02)
+        assert result['spectrum'][above, channel] == pytest.approx(spec[above], rel=0.005)
+        _, psd = hp.psd()
+        assert result['psd'][near, channel] == pytest.approx(psd[near], rel=0.04)
+        assert result['psd'][above, channel] == pytest.approx(psd[above], rel=0.01)
+        _, peak = hp.peakSpectrum()
+        assert result['peakSpectrum'][near, channel] == pytest.approx(peak[near], rel=0.05)
+        assert result['peakSpectrum'][above, channel] == pytest.approx(peak[above], rel=0.005)
+
+
+def test_shortSignalUsesASingleSegment():
+    _, data = makeSignal(seconds=1)
+    accumulator = WelchAccumulator(FS, 3, segmentLength=1024)
+    stream(accumulator, data)
+    freqs, result = accumulator.getResult()
+    assert accumulator.segments == 0
+    assert freqs.shape[0] == FS // 2 + 1
+
+
+def test_summaryIsWrittenAlongsideTheDataAndCanBeLoadedByTheAnalyser(tmpdir):
+    t, data = makeSignal(seconds=4)
+    summariser = SpectralSummariser(CSVLogger('test', 'dev1', str(tmpdir)))
+    summariser.start('m1')
+    samples = np.column_stack((t, data))
+    for i in range(0, samples.shape[0], 125):
+        summariser.handle(SampleBatch(samples[i:i + 125], ['time', 'ac_x', 'ac_y', 'ac_z'], FS, startIdx=i))
+    summariser.stop('m1')
+    targetDir = os.path.join(str(tmpdir), 'm1', 'dev1')
+    # no raw data is written by default
+    assert os.path.getsize(os.path.join(targetDir, 'data.out')) == 0
+    with open(os.path.join(targetDir, 'spectrum.json')) as f:
+        summary = json.load(f)
+    assert summary['samples'] == samples.shape[0]
+    assert summary['fs'] == FS
+    assert sorted(summary['axes'].keys()) == ['x', 'y', 'z']
+    loaded = loadTriAxisSignalFromSummary(os.path.join(targetDir, 'spectrum.json'))
+    f, spec = loaded.spectrum('x')
+    assert f[np.argmax(spec)] == pytest.approx(40, abs=1)
+    f, psd = loaded.psd('z')
+    assert f[np.argmax(psd)] == pytest.approx(120, abs=1)
@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from core.batch import SampleBatch
+from core.handler import AsyncHandler, HttpPoster, DataHandler
+from core.interface import SEQUENCE_HEADER
+from core.spool import DiskSpool, readSegment
+
+
+class FlakyTarget(object):
+    """
+    Accepts puts unless it is down.
+    """
+
+    def __init__(self):
+        self.down = False
+        self.received = []
+        self.sequences = []
+        self.urls = []
+
+    def put(self, url, **kwargs):
+        if self.down:
+            raise IOError('Unable to connect')
+        self.urls.append(url)
+        if url.endswith('/data'):
+            self.received.append(SampleBatch.fromBinary(kwargs['data']))
+            self.sequences.append(int(kwargs['headers'][SEQUENCE_HEADER]))
+        return type('Response', (), {'status_code': 200})()
+
+
+class SlowHandler(DataHandler):
+    """
+    Blocks until released.
+    """
+
+    def __init__(self):
+        self.name = 'slow'
+        self.events = []
+        self.stopped = False
+        self.released = threading.Event()
+
+    def start(self, measurementId):
+        pass
+
+    def handle(self, data):
+        self.released.wait()
+        self.events.append(data)
+
+    def stop(self, measurementId, failureReason=None):
+        self.stopped = True
+
+
+def test_spoolReturnsItemsInOrderAndTruncatesWhenEmpty(tmpdir, sampleBatches):
+    spool = DiskSpool(str(tmpdir), 'dev1', bufferBytes=1024)
+    spool.open('m1')
+    batches = sampleBatches.contiguous(50, samplesPerBatch=10)
+    for batch in batches[:30]:
+        spool.append(batch)
+    spool.append([[1, 2, 3]])
+    assert len(spool) == 31
+    for batch in batches[:30]:
+        popped = spool.pop()
+        assert popped.startIdx == batch.startIdx
+        assert np.array_equal(popped.samples, batch.samples)
+    assert spool.pop() == [[1, 2, 3]]
+    assert spool.pop() is None
+    assert os.path.getsize(spool.path) == 0
+    for batch in batches[30:]:
+        spool.append(batch)
+    assert spool.peek().startIdx == 300
+    assert spool.getStats()['pending'] == 20
+    spool.close()
+    # a spool that still has data is left on disk
+    assert os.path.exists(spool.path)
+
+
+def test_posterSpoolsWhileTheTargetIsDownAndResendsInOrder(tmpdir, sampleBatches):
+    clock = [0.0]
+    target = FlakyTarget()
+    poster = HttpPoster('remote', 'http://localhost', httpclient=target, wireFormat='binary', encoding='float64',
+                        spoolDir=str(tmpdir), retryInterval=1.0, clock=lambda: clock[0], sleeper=lambda s: None)
+    poster.deviceName = 'dev1'
+    poster.start('m1')
+    batches = sampleBatches.contiguous(10, samplesPerBatch=10)
+    for i, batch in enumerate(batches):
+        target.down = 2 <= i < 6
+        clock[0] += 0.4
+        poster.handle(batch)
+    poster.stop('m1')
+    assert [b.startIdx for b in target.received] == [b.startIdx for b in batches]
+    # spooled batches are resent with the sequence number they were first sent with
+    assert target.sequences == list(range(len(batches)))
+    assert len(poster.dataResponseCode) > len(batches)
+    assert not os.path.exists(os.path.join(str(tmpdir), 'm1'))
+
+
+def test_posterLeavesTheSpoolOnDiskIfTheTargetNeverReturns(tmpdir, sampleBatches):
+    target = FlakyTarget()
+    poster = HttpPoster('remote', 'http://localhost', httpclient=target, wireFormat='binary', spoolDir=str(tmpdir),
+                        drainTimeout=0, sleeper=lambda s: None)
+    poster.deviceName = 'dev1'
+    poster.start('m1')
+    target.down = True
+    for batch in sampleBatches.contiguous(3, samplesPerBatch=10):
+        poster.handle(batch)
+    poster.stop('m1')
+    assert os.path.getsize(os.path.join(str(tmpdir), 'm1', 'dev1.retry.spool')) > 0
+
+
+def test_posterRetriesTheStartBeforeResendingSpooledData(tmpdir, sampleBatches):
+    clock = [0.0]
+    target = FlakyTarget()
+    poster = HttpPoster('remote', 'http://localhost', httpclient=target, wireFormat='binary', spoolDir=str(tmpdir),
+                        retryInterval=1.0, clock=lambda: clock[0], sleeper=lambda s: None)
+    poster.deviceName = 'dev1'
+    target.down = True
+    poster.start('m1')
+    assert poster.startResponseCode == 500
+    batches = sampleBatches.contiguous(6, samplesPerBatch=10)
+    for i, batch in enumerate(batches):
+        target.down = i < 3
+        clock[0] += 0.6
+        poster.handle(batch)
+    poster.stop('m1')
+    assert poster.startResponseCode == 200
+    assert target.urls[0] == 'http://localhost/api/1/measurements/m1/dev1'
+    assert target.urls[-1] == 'http://localhost/api/1/measurements/m1/dev1/complete'
+    assert [b.startIdx for b in target.received] == [b.startIdx for b in batches]
+
+
+def test_segmentLeftOnDiskOnlyHoldsUnsentItems(tmpdir, sampleBatches):
+    spool = DiskSpool(str(tmpdir), 'dev1', bufferBytes=1024)
+    spool.open('m1')
+    batches = sampleBatches.contiguous(10, samplesPerBatch=10)
+    for i, batch in enumerate(batches):
+        spool.append(batch, sequence=i)
+    spool.append({'failureReason': 'x'})
+    for i in range(4):
+        spool.pop()
+    spool.close()
+    items = list(readSegment(spool.path))
+    assert [b.startIdx for b in items[:-1]] == [b.startIdx for b in batches[4:]]
+    assert [s for _, s in readSegment(spool.path, withSequence=True)] == list(range(4, 10)) + [None]
+    assert items[-1] == {'failureReason': 'x'}
+
+
+def test_asyncHandlerBoundsTheQueueAndPreservesOrder(tmpdir, sampleBatches):
+    delegate = SlowHandler()
+    asyncHandler = AsyncHandler('test', delegate, coalesceThreshold=None, spoolDir=str(tmpdir), maxQueueDepth=5)
+    asyncHandler.start('m1')
+    batches = sampleBatches.contiguous(40, samplesPerBatch=10)
+    asyncHandler.handle(batches[0])
+    # wait for the worker to pick up the first batch, it is then stuck until the delegate is released
+    while asyncHandler.getQueueDepth() > 0:
+        time.sleep(0.01)
+    for batch in batches[1:]:
+        asyncHandler.handle(batch)
+    assert asyncHandler.getQueueDepth() == 5
+    assert asyncHandler.getSpoolStats()['pending'] == 34
+    delegate.released.set()
+    asyncHandler.stop('m1')
+    assert [b.startIdx for b in delegate.events] == [b.startIdx for b in batches]
+    assert asyncHandler.getSpoolStats()['replayed'] == 34
+    assert delegate.stopped
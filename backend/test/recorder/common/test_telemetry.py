@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from recorder.common.i2c_io import mock_io
+from recorder.common.mpu6050 import mpu6050
+from recorder.common.replay import ReplayProvider
+from recorder.common.telemetry import AcquisitionTelemetry
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_measurementMetricsAreDerivedFromTheRecordedEvents():
+    clock = FakeClock()
+    telemetry = AcquisitionTelemetry(clock=clock)
+    telemetry.startMeasurement('m1', 500)
+    for i in range(4):
+        clock.now += 0.25
+        telemetry.i2cRead(1)
+        telemetry.i2cRead(2)
+        telemetry.fifoCount(600 + i)
+        telemetry.i2cRead(750)
+        telemetry.batchRead(125, 2, i == 3)
+        telemetry.batchHandled(0.01 * (i + 1))
+    telemetry.endMeasurement('INITIALISED')
+    last = telemetry.toDict()['last']
+    assert last['measurementId'] == 'm1'
+    assert last['status'] == 'INITIALISED'
+    assert last['elapsed'] == pytest.approx(1.0)
+    assert last['nominalFs'] == 500
+    assert last['achievedFs'] == pytest.approx(500.0)
+    assert last['i2cReadsPerSecond'] == pytest.approx(12.0)
+    assert last['i2cBytesPerSecond'] == pytest.approx(3012.0)
+    assert last['loopIterationsPerBatch'] == pytest.approx(2.0)
+    assert last['fifoHighWaterBytes'] == 603
+    assert last['overdueBatches'] == 1
+    assert last['meanHandlerTime'] == pytest.approx(0.025)
+    assert last['maxHandlerTime'] == pytest.approx(0.04)
+    assert telemetry.toDict()['current'] is None
+
+
+def test_rollingMetricsOnlyCoverTheWindow():
+    clock = FakeClock()
+    telemetry = AcquisitionTelemetry(windowSeconds=1, clock=clock)
+    telemetry.fifoCount(1000)
+    telemetry.batchRead(500, 10, True)
+    for i in range(4):
+        clock.now += 0.5
+        telemetry.fifoCount(100)
+        telemetry.batchRead(250, 1, False)
+    rolling = telemetry.getRolling()
+    assert rolling['batches'] == 2
+    assert rolling['achievedFs'] == pytest.approx(500.0)
+    assert rolling['fifoHighWaterBytes'] == 100
+    assert rolling['overdueBatches'] == 0
+    assert rolling['loopIterationsPerBatch'] == pytest.approx(1.0)
+
+
+def test_summaryIdentifiesTheMeasurement():
+    telemetry = AcquisitionTelemetry()
+    assert 'measurementId' not in telemetry.getSummary()
+    telemetry.startMeasurement('m1', 500)
+    telemetry.fifoOverflowed()
+    summary = telemetry.getSummary()
+    assert summary['measurementId'] == 'm1'
+    assert summary['fifoOverflows'] == 1
+
+
+def test_deviceReportsReadsAndBatches():
+    clock = FakeClock()
+    provider = ReplayProvider(np.zeros((1000, 3)), clock=clock)
+    mpu = mpu6050(mock_io(dataProvider=provider.provide, maxReadBytes=1024, writeHandler=provider.write))
+    mpu.telemetry.startMeasurement('m1', mpu.fs)
+    clock.now += 0.25
+    mpu.provideData()
+    current = mpu.telemetry.toDict()['current']
+    assert current['samples'] == 125
+    assert current['batches'] == 1
+    assert current['i2cReads'] == 3
+    assert current['i2cBytes'] == 3 + 750
+    assert current['fifoHighWaterBytes'] == 750
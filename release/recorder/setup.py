@@ -37,6 +37,7 @@ setup(name='vibe-recorder',
           ],
       },
       install_requires=[
+          'numpy',
           'smbus2',
           'flask',
           'flask-restful',